@@ -0,0 +1,63 @@
+"""
+为已有的上传图片补生成缩略图
+
+遍历存储后端（本地目录或对象存储桶）中的原图，为还没有 manifest 的图片
+生成各宽度的 WebP / AVIF 缩略图。
+
+运行方式: python -m app.backfill_image_variants [--force] [--workers 4]
+"""
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from .config import settings
+from .services.storage import init_storage
+from .services.image_variants import generate_variants_for_key, iter_source_keys, manifest_key
+
+
+def main():
+    parser = argparse.ArgumentParser(description="为已有的上传图片补生成缩略图")
+    parser.add_argument("--force", action="store_true", help="已有 manifest 的图片也重新生成")
+    parser.add_argument("--workers", type=int, default=settings.IMAGE_VARIANT_WORKERS,
+                        help=f"并行进程数（默认 {settings.IMAGE_VARIANT_WORKERS}）")
+    args = parser.parse_args()
+
+    storage = init_storage()
+    sources = [
+        key for key in iter_source_keys()
+        if args.force or not storage.exists(manifest_key(key))
+    ]
+    if not sources:
+        print("没有需要处理的图片")
+        return
+
+    done = failed = 0
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        futures = {
+            executor.submit(
+                generate_variants_for_key,
+                key,
+                settings.IMAGE_VARIANT_WIDTHS,
+                settings.IMAGE_VARIANT_FORMATS,
+                settings.IMAGE_VARIANT_QUALITY,
+            ): key
+            for key in sources
+        }
+        for future in as_completed(futures):
+            key = futures[future]
+            try:
+                manifest = future.result()
+            except Exception as e:
+                failed += 1
+                print(f"失败: {key} ({e})")
+                continue
+            if manifest is None:
+                print("未安装 Pillow，无法生成缩略图")
+                return
+            done += 1
+            print(f"已生成: {key} ({len(manifest['variants'])} 个尺寸)")
+
+    print(f"共处理 {done} 张图片，失败 {failed} 张")
+
+
+if __name__ == "__main__":
+    main()
@@ -24,8 +24,120 @@ class Settings(BaseSettings):
     # CORS 配置 - 支持从环境变量读取，逗号分隔多个域名
     CORS_ORIGINS: List[str] = ["http://localhost:5173", "http://127.0.0.1:5173"]
 
+    # 文件上传 / 存储
+    STORAGE_BACKEND: str = "local"  # local | s3
+    UPLOAD_DIR: str = "../frontend/public/uploads"  # local 后端的根目录（相对 backend 运行目录）
+    UPLOAD_STAGING_DIR: str = "./data/upload-staging"  # local 后端的暂存目录（上传中的文件、分片），不能放在 UPLOAD_DIR 下
+    UPLOAD_MAX_BYTES: int = 10 * 1024 * 1024  # 单文件上限 10MB
+    UPLOAD_MULTIPART_THRESHOLD: int = 8 * 1024 * 1024  # 超过该大小的直传使用分片上传
+    UPLOAD_PART_SIZE: int = 5 * 1024 * 1024  # 分片大小（S3 要求除最后一片外不小于 5MB）
+    UPLOAD_PRESIGN_EXPIRES: int = 900  # 预签名 URL 有效期（秒）
+
+    # S3 兼容对象存储（STORAGE_BACKEND=s3 时生效，本地开发可指向 MinIO）
+    S3_ENDPOINT_URL: str = ""  # 留空使用 AWS 默认地址，如 http://127.0.0.1:9000
+    S3_REGION: str = "us-east-1"
+    S3_BUCKET: str = "suju-uploads"
+    S3_ACCESS_KEY: str = ""
+    S3_SECRET_KEY: str = ""
+    S3_PUBLIC_URL: str = ""  # 桶或 CDN 的公开访问地址；留空时图片通过预签名 GET 访问
+
+    # 商品列表筛选 / 统计（facets）
+    FACET_PRICE_EDGES: List[float] = [0, 1000, 2000, 5000, 10000]  # 价格区间分界，最后一档不设上限
+    FACET_CACHE_MAX_ENTRIES: int = 512  # 按筛选条件缓存的统计结果数
+    CATALOG_SNAPSHOT_ENABLED: bool = False  # 商品列表在内存列式快照上筛选排序（商品量很大时开启）
+
+    # 商品热度（sort_by=popular）
+    POPULARITY_REFRESH_SECONDS: float = 600.0  # 后台重算间隔
+    POPULARITY_WINDOW_DAYS: int = 90  # 只统计最近多少天的成交
+    POPULARITY_HALF_LIFE_DAYS: float = 14.0  # 成交件数的衰减半衰期
+    POPULARITY_VIEW_WEIGHT: float = 0.01  # 每次浏览折合的成交件数
+
+    # 相关商品推荐（离线预计算）
+    RELATED_TOP_K: int = 20  # 每个商品保存的相关商品数（详情页 limit 的上限）
+    RELATED_REFRESH_SECONDS: float = 6 * 3600.0  # 后台重建间隔
+    RELATED_PURCHASE_WEIGHT: float = 2.0  # 购买相对收藏的权重
+
+    # 商品浏览量（内存缓冲，定期批量写回）
+    VIEW_FLUSH_SECONDS: float = 5.0  # 写回间隔，也是崩溃时最多丢失的时间窗口
+    VIEW_FLUSH_THRESHOLD: int = 1000  # 待写入浏览数达到该值时提前写回
+    VIEW_DEDUP_SECONDS: float = 1800.0  # 同一访客重复浏览同一商品的去重窗口
+    VIEW_DEDUP_MAX_ENTRIES: int = 200000  # 去重记录上限，超过时淘汰最早的记录
+
+    # 管理后台批量导入 / 导出
+    PRODUCT_IMPORT_DIR: str = "./data/imports"  # 上传文件暂存目录，任务结束后删除
+    PRODUCT_IMPORT_MAX_BYTES: int = 200 * 1024 * 1024  # 单个导入文件上限
+    PRODUCT_IMPORT_BATCH_SIZE: int = 1000  # 每批校验、写入并提交的行数
+    PRODUCT_IMPORT_MAX_ERRORS: int = 1000  # 任务中最多保留的错误行明细
+    PRODUCT_EXPORT_BATCH_SIZE: int = 1000  # 导出时每次从数据库读取的商品数
+    ORDER_EXPORT_BATCH_SIZE: int = 1000  # 订单导出时每页的订单数
+
+    # 图片缩略图（响应式尺寸）
+    IMAGE_VARIANT_WIDTHS: List[int] = [320, 640, 1024]
+    IMAGE_VARIANT_FORMATS: List[str] = ["webp", "avif"]  # Pillow 不支持的格式会被跳过
+    IMAGE_VARIANT_QUALITY: int = 80
+    IMAGE_VARIANT_WORKERS: int = 2  # 生成缩略图的进程数
+    IMAGE_MANIFEST_CACHE_SIZE: int = 20000  # 内存中缓存的 manifest 数（含没有缩略图的记录），LRU 淘汰
+
+    # 通知实时推送（SSE）
+    NOTIFY_BROKER: str = "memory"  # memory（单进程） | redis（多 worker 共享）
+    NOTIFY_REDIS_URL: str = "redis://localhost:6379/0"
+    NOTIFY_REDIS_CHANNEL: str = "suju:notifications"
+    NOTIFY_HEARTBEAT_SECONDS: float = 15.0  # 空闲时发送心跳的间隔，防止代理断开连接
+    NOTIFY_QUEUE_SIZE: int = 64  # 每个连接最多积压的消息数，超过即断开
+    NOTIFY_MAX_CONNECTIONS_PER_USER: int = 5
+    NOTIFY_REPLAY_LIMIT: int = 50  # 重连时最多补发的通知数
+    NOTIFY_BATCH_SIZE: int = 200  # 通知批量写入：每批最多条数
+    NOTIFY_BATCH_INTERVAL: float = 0.5  # 通知批量写入：最长等待时间（秒）
+    NOTIFY_QUEUE_MAX: int = 10000  # 待写入通知队列上限，满了之后提交方会等待
+    NOTIFY_COUNTER_FLUSH_SECONDS: float = 10.0  # 未读数缓存写回数据库的间隔
+    NOTIFY_COUNTER_RECONCILE_SECONDS: float = 3600.0  # 按通知表校正未读数的间隔
+
     # AI Config
     SILICONFLOW_API_KEY: str = ""
+    SILICONFLOW_API_URL: str = "https://api.siliconflow.cn/v1/chat/completions"
+    AI_MODEL_NAME: str = "deepseek-ai/DeepSeek-R1-0528-Qwen3-8B"
+
+    # AI 上游 HTTP 客户端（连接池 / 超时 / 重试 / 熔断）
+    AI_HTTP2_ENABLED: bool = True
+    AI_HTTP_MAX_CONNECTIONS: int = 20
+    AI_HTTP_MAX_KEEPALIVE: int = 10
+    AI_HTTP_KEEPALIVE_EXPIRY: float = 30.0
+    AI_HTTP_CONNECT_TIMEOUT: float = 5.0
+    AI_HTTP_READ_TIMEOUT: float = 60.0
+    AI_HTTP_WRITE_TIMEOUT: float = 10.0
+    AI_HTTP_POOL_TIMEOUT: float = 5.0
+    AI_HTTP_MAX_RETRIES: int = 2
+    AI_HTTP_RETRY_BACKOFF: float = 0.5  # 指数退避基数（秒），实际等待带随机抖动
+    AI_HTTP_RETRY_BACKOFF_MAX: float = 8.0
+    AI_CIRCUIT_FAILURE_THRESHOLD: int = 5  # 连续失败多少次后熔断
+    AI_CIRCUIT_RESET_TIMEOUT: float = 30.0  # 熔断后多久进入半开状态试探
+
+    # AI 回复缓存
+    AI_CACHE_ENABLED: bool = True
+    AI_CACHE_TTL_SECONDS: float = 600.0
+    AI_CACHE_MAX_ENTRIES: int = 2000
+    AI_CACHE_SIMILARITY_THRESHOLD: float = 0.0  # >0 时启用向量相似度查找，如 0.92
+
+    # 文本向量化
+    AI_EMBEDDER: str = "hashing"
+    AI_EMBEDDING_DIM: int = 256
+
+    # 商品向量检索
+    PRODUCT_INDEX_DIR: str = "./data/product_index"
+    AI_RETRIEVAL_TOP_K: int = 5
+    AI_RETRIEVAL_MIN_SCORE: float = 0.1
+
+    # AI 对话上下文
+    AI_CONTEXT_TOKEN_BUDGET: int = 3000  # 发送给模型的 prompt token 上限（估算值）
+    AI_HISTORY_MAX_MESSAGES: int = 20  # 每次最多读取的历史消息条数
+    AI_SUMMARY_TOKEN_BUDGET: int = 400  # 滚动摘要的 token 上限
+
+    # AI 后台任务队列
+    AI_JOB_CONCURRENCY: int = 4  # 同时调用上游的 worker 数
+    AI_JOB_MAX_PENDING_PER_USER: int = 3  # 每个用户最多排队的任务数
+    AI_JOB_MAX_WAIT_SECONDS: float = 30.0  # 长轮询最长等待时间
+    AI_JOB_POLL_SECONDS: float = 1.0  # 长轮询的任务不在本进程时查库的间隔
+    AI_JOB_CALLBACKS_ENABLED: bool = False  # 是否允许任务完成后回调 callback_url
     
     class Config:
         env_file = ".env"
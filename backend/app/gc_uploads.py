@@ -0,0 +1,37 @@
+"""
+清理未被引用的上传文件
+
+重算 upload_blobs 的引用计数，并删除没有被任何商品/评价引用、
+且上传时间早于宽限期的内容寻址文件。
+
+运行方式: python -m app.gc_uploads [--grace-hours 24] [--dry-run]
+"""
+import argparse
+from datetime import timedelta
+
+from .database import SessionLocal, init_db
+from .services.blob_store import collect_garbage
+
+
+def main():
+    parser = argparse.ArgumentParser(description="清理未被引用的上传文件")
+    parser.add_argument("--grace-hours", type=float, default=24,
+                        help="只清理上传时间早于该小时数的文件（默认 24）")
+    parser.add_argument("--dry-run", action="store_true", help="只列出将被删除的文件")
+    args = parser.parse_args()
+
+    init_db()
+    db = SessionLocal()
+    try:
+        removed = collect_garbage(db, timedelta(hours=args.grace_hours), dry_run=args.dry_run)
+    finally:
+        db.close()
+
+    action = "将删除" if args.dry_run else "已删除"
+    for path in removed:
+        print(f"{action}: {path}")
+    print(f"共 {len(removed)} 个未引用文件")
+
+
+if __name__ == "__main__":
+    main()
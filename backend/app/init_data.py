@@ -9,6 +9,7 @@ from decimal import Decimal
 from .database import SessionLocal, init_db
 from .models import User, Category, Tag, Product, ProductTag, ProductParam
 from .utils.security import hash_password
+from .services.category_tree import assign_path
 
 
 def init_test_data():
@@ -55,6 +56,7 @@ def init_test_data():
             cat = Category(**cat_data)
             db.add(cat)
             db.flush()
+            assign_path(db, cat)
             categories[cat_data["name"]] = cat
         
         # 3. 创建商品标签
@@ -1,10 +1,30 @@
+import os
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, RedirectResponse
+from fastapi.staticfiles import StaticFiles
 from contextlib import asynccontextmanager
+from sqlalchemy.orm.exc import StaleDataError
 
 from .config import settings
-from .database import init_db
+from .utils.response import ErrorMessage
+from .database import init_db, SessionLocal
+from .services.ai_client import init_ai_client, close_ai_client
+from .services.product_index import init_product_index, save_product_index
+from .services.ai_jobs import job_queue
+from .services.blob_store import CAS_DIR
+from .services.image_variants import image_variants
+from .services.storage import init_storage, get_storage
+from .services.notification_hub import notification_hub
+from .services.notification_reads import migrate_global_read_flags
+from .services.category_tree import rebuild_paths
+from .services.catalog_snapshot import init_catalog_snapshot
+from .services.product_stats import backfill_sales_counts, popularity_job
+from .services.view_counter import view_counter
+from .services.related_products import recommendation_job
+from .services.product_io import product_import_queue
+from .services.unread_counters import unread_counters
+from .services.notification_dispatcher import notification_dispatcher
 from .routers import (
     auth_router,
     users_router,
@@ -20,6 +40,9 @@ from .routers import (
     upload_router,
     favorites_router,
     ai_router,
+    product_io_router,
+    order_export_router,
+    order_status_router,
 )
 
 
@@ -31,6 +54,7 @@ async def lifespan(app: FastAPI):
     init_db()
     
     # 简单的自动迁移逻辑 (确保Product表字段存在)
+    backfill_sales = False
     try:
         import sqlite3
         conn = sqlite3.connect('suju.db')
@@ -46,13 +70,142 @@ async def lifespan(app: FastAPI):
             cursor.execute("ALTER TABLE products ADD COLUMN sales_count INTEGER DEFAULT 0")
         if 'view_count' not in columns:
             cursor.execute("ALTER TABLE products ADD COLUMN view_count INTEGER DEFAULT 0")
+        if 'popularity_score' not in columns:
+            # 与热度同时引入的还有按订单状态维护的销量，旧库需要按已成交订单回填一次
+            backfill_sales = True
+            cursor.execute("ALTER TABLE products ADD COLUMN popularity_score FLOAT DEFAULT 0")
+        if 'version' not in columns:
+            cursor.execute("ALTER TABLE products ADD COLUMN version INTEGER NOT NULL DEFAULT 1")
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS ix_products_published_sales "
+            "ON products (is_published, sales_count)"
+        )
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS ix_products_published_popularity "
+            "ON products (is_published, popularity_score)"
+        )
+
+        cursor.execute("PRAGMA table_info(categories)")
+        columns = [row[1] for row in cursor.fetchall()]
+        if 'path' not in columns:
+            cursor.execute("ALTER TABLE categories ADD COLUMN path VARCHAR(255)")
+        if 'depth' not in columns:
+            cursor.execute("ALTER TABLE categories ADD COLUMN depth INTEGER DEFAULT 0")
+        cursor.execute("CREATE INDEX IF NOT EXISTS ix_categories_path ON categories (path)")
+
+        cursor.execute("PRAGMA table_info(ai_chat_sessions)")
+        columns = [row[1] for row in cursor.fetchall()]
+        if 'summary' not in columns:
+            cursor.execute("ALTER TABLE ai_chat_sessions ADD COLUMN summary TEXT")
+        if 'summary_until_id' not in columns:
+            cursor.execute("ALTER TABLE ai_chat_sessions ADD COLUMN summary_until_id INTEGER DEFAULT 0")
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS ix_ai_chat_messages_session_id_id "
+            "ON ai_chat_messages (session_id, id)"
+        )
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS ix_notifications_user_id_id "
+            "ON notifications (user_id, id)"
+        )
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS ix_notifications_user_id_is_read "
+            "ON notifications (user_id, is_read)"
+        )
+        # 乐观锁版本号
+        for table in ("orders", "refunds"):
+            cursor.execute(f"PRAGMA table_info({table})")
+            if 'version' not in [row[1] for row in cursor.fetchall()]:
+                cursor.execute(f"ALTER TABLE {table} ADD COLUMN version INTEGER NOT NULL DEFAULT 1")
+        # 订单按下单时间范围导出
+        cursor.execute("CREATE INDEX IF NOT EXISTS ix_orders_created_at ON orders (created_at)")
             
         conn.commit()
         conn.close()
     except Exception as e:
         print(f"Migration warning: {e}")
+
+    # 全局通知已读状态迁移到按用户记录（只执行一次）
+    db = SessionLocal()
+    try:
+        migrate_global_read_flags(db)
+    except Exception as e:
+        print(f"Migration warning: {e}")
+    finally:
+        db.close()
+
+    # 销量回填（只在从没有 popularity_score 的旧库升级时执行一次）
+    if backfill_sales:
+        db = SessionLocal()
+        try:
+            backfill_sales_counts(db)
+            db.commit()
+        except Exception as e:
+            print(f"Migration warning: {e}")
+        finally:
+            db.close()
+
+    # 分类物化路径回填（旧数据 / 直接写库产生的分类）
+    db = SessionLocal()
+    try:
+        rebuild_paths(db)
+    except Exception as e:
+        print(f"Migration warning: {e}")
+    finally:
+        db.close()
+
+    # 商品向量索引（AI 助手检索用）
+    db = SessionLocal()
+    try:
+        init_product_index(db)
+    except Exception as e:
+        print(f"Product index warning: {e}")
+    finally:
+        db.close()
+
+    # 商品列表内存快照（CATALOG_SNAPSHOT_ENABLED 开启时）
+    db = SessionLocal()
+    try:
+        init_catalog_snapshot(db)
+    except Exception as e:
+        print(f"Catalog snapshot warning: {e}")
+    finally:
+        db.close()
+
+    # 共享的 AI 上游 HTTP 客户端（连接池 + 熔断）
+    await init_ai_client()
+    # AI 回复后台任务 worker
+    await job_queue.start()
+    # 上传文件存储（本地目录 / S3 兼容对象存储）
+    init_storage()
+    # 图片缩略图生成进程池
+    image_variants.start()
+    # 通知推送 hub
+    await notification_hub.start()
+    # 通知未读数缓存（定期写回 + 校正）
+    await unread_counters.start()
+    # 通知批量写入
+    await notification_dispatcher.start()
+    # 商品热度定期重算
+    await popularity_job.start()
+    # 商品浏览量写回
+    await view_counter.start()
+    # 相关商品定期重建
+    await recommendation_job.start()
+    # 商品批量导入 worker
+    await product_import_queue.start()
     yield
-    # 关闭时清理资源
+    # 关闭时清理资源（先写完待写入的通知）
+    await notification_dispatcher.stop()
+    await product_import_queue.stop()
+    await recommendation_job.stop()
+    await view_counter.stop()
+    await popularity_job.stop()
+    await unread_counters.stop()
+    await notification_hub.stop()
+    image_variants.stop()
+    await job_queue.stop()
+    await close_ai_client()
+    save_product_index()
 
 
 app = FastAPI(
@@ -75,6 +228,12 @@ app.add_middleware(
 )
 
 
+# 乐观锁冲突：提交时 version 已被其他请求修改
+@app.exception_handler(StaleDataError)
+async def stale_data_handler(request: Request, exc: StaleDataError):
+    return JSONResponse(status_code=409, content={"detail": ErrorMessage.VERSION_CONFLICT})
+
+
 # 全局异常处理
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
@@ -103,6 +262,35 @@ app.include_router(dashboard_router, prefix="/v1")
 app.include_router(upload_router, prefix="/v1")
 app.include_router(favorites_router, prefix="/v1")
 app.include_router(ai_router, prefix="/v1")
+app.include_router(product_io_router, prefix="/v1")
+app.include_router(order_export_router, prefix="/v1")
+app.include_router(order_status_router, prefix="/v1")
+
+
+class ImmutableStaticFiles(StaticFiles):
+    """内容寻址文件：URL 随内容变化，响应可被永久缓存"""
+
+    async def get_response(self, path, scope):
+        response = await super().get_response(path, scope)
+        if response.status_code == 200:
+            response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+        return response
+
+
+if settings.STORAGE_BACKEND == "local":
+    app.mount(
+        f"/uploads/{CAS_DIR}",
+        ImmutableStaticFiles(directory=os.path.join(settings.UPLOAD_DIR, CAS_DIR), check_dir=False),
+        name="uploads-cas"
+    )
+    app.mount("/uploads", StaticFiles(directory=settings.UPLOAD_DIR, check_dir=False), name="uploads")
+else:
+    @app.get("/uploads/{key:path}", include_in_schema=False)
+    async def redirect_upload(key: str):
+        """对象存储：重定向到桶的公开地址（或预签名 GET）"""
+        response = RedirectResponse(get_storage().public_url(key), status_code=307)
+        response.headers["Cache-Control"] = "public, max-age=300"
+        return response
 
 
 # 健康检查
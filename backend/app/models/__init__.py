@@ -1,11 +1,13 @@
 # Models package
 from .user import User, UserAddress
-from .product import Category, Tag, Product, ProductTag, ProductParam
+from .product import Category, Tag, Product, ProductTag, ProductParam, ProductRecommendation, ProductImportJob
 from .cart import CartItem
+from .favorite import Favorite
 from .order import Order, OrderItem, Refund
 from .review import ProductReview, ReviewReply, ReviewLike
-from .notification import Notification
-from .ai import AIChatSession, AIChatMessage
+from .notification import Notification, NotificationReadState, NotificationRead, NotificationCounter
+from .ai import AIChatSession, AIChatMessage, AIChatJob
+from .upload import UploadBlob
 
 __all__ = [
     # User
@@ -17,8 +19,12 @@ __all__ = [
     "Product",
     "ProductTag",
     "ProductParam",
+    "ProductRecommendation",
+    "ProductImportJob",
     # Cart
     "CartItem",
+    # Favorite
+    "Favorite",
     # Order
     "Order",
     "OrderItem",
@@ -29,7 +35,13 @@ __all__ = [
     "ReviewLike",
     # Notification
     "Notification",
+    "NotificationReadState",
+    "NotificationRead",
+    "NotificationCounter",
     # AI
     "AIChatSession",
     "AIChatMessage",
+    "AIChatJob",
+    # Upload
+    "UploadBlob",
 ]
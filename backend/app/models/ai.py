@@ -1,5 +1,5 @@
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from ..database import Base
 
@@ -12,6 +12,8 @@ class AIChatSession(Base):
     title = Column(String(100), nullable=True)
     created_at = Column(DateTime, default=datetime.now)
     last_active_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+    summary = Column(Text, nullable=True)  # 滚动摘要：已移出上下文窗口的旧消息
+    summary_until_id = Column(Integer, default=0)  # 已折叠进摘要的最后一条消息 ID
 
     # Relationships
     user = relationship("User", backref="ai_sessions")
@@ -19,6 +21,10 @@ class AIChatSession(Base):
 
 class AIChatMessage(Base):
     __tablename__ = "ai_chat_messages"
+    __table_args__ = (
+        # 读取会话尾部消息: WHERE session_id = ? ORDER BY id DESC LIMIT n
+        Index("ix_ai_chat_messages_session_id_id", "session_id", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     session_id = Column(Integer, ForeignKey("ai_chat_sessions.id"), nullable=False)
@@ -28,3 +34,19 @@ class AIChatMessage(Base):
 
     # Relationships
     session = relationship("AIChatSession", back_populates="messages")
+
+class AIChatJob(Base):
+    """AI 回复任务：/ai/chat 入队后由后台 worker 处理"""
+    __tablename__ = "ai_chat_jobs"
+
+    id = Column(String(32), primary_key=True)  # uuid hex
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    session_id = Column(Integer, ForeignKey("ai_chat_sessions.id", ondelete="CASCADE"), nullable=False)
+    user_message_id = Column(Integer, nullable=False)
+    status = Column(String(20), default="queued", index=True)  # queued, running, succeeded, failed
+    result_message_id = Column(Integer, nullable=True)
+    error = Column(Text, nullable=True)
+    callback_url = Column(String(500), nullable=True)
+    created_at = Column(DateTime, default=datetime.now)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
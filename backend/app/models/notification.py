@@ -1,7 +1,8 @@
 """
 通知模型
 """
-from sqlalchemy import Column, Integer, String, Text, Boolean, DateTime, ForeignKey
+from datetime import datetime
+from sqlalchemy import Column, Integer, String, Text, Boolean, DateTime, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 
@@ -11,6 +12,11 @@ from ..database import Base
 class Notification(Base):
     """通知表"""
     __tablename__ = "notifications"
+    __table_args__ = (
+        # 未读统计: WHERE user_id IS NULL AND id > 水位线 / WHERE user_id = ? AND is_read = 0
+        Index("ix_notifications_user_id_id", "user_id", "id"),
+        Index("ix_notifications_user_id_is_read", "user_id", "is_read"),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=True, index=True)  # NULL = 全局通知
@@ -19,7 +25,7 @@ class Notification(Base):
     content = Column(Text)
     related_id = Column(Integer)  # 关联的商品/订单 ID
     related_image = Column(String(500))  # 关联的图片URL
-    is_read = Column(Boolean, default=False, index=True)
+    is_read = Column(Boolean, default=False, index=True)  # 仅对个人通知有意义，全局通知的已读状态见下面两张表
     created_at = Column(DateTime, server_default=func.now())
 
     # 关系（可选，如果 user_id 不为 NULL）
@@ -27,3 +33,38 @@ class Notification(Base):
 
     def __repr__(self):
         return f"<Notification(id={self.id}, type={self.type}, user_id={self.user_id})>"
+
+
+class NotificationReadState(Base):
+    """
+    用户对全局通知的已读水位线
+
+    id <= last_read_id 的全局通知视为已读；水位线之上单独标记已读的记录在 NotificationRead 中
+    """
+    __tablename__ = "notification_read_states"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    last_read_id = Column(Integer, default=0, nullable=False)
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+
+
+class NotificationRead(Base):
+    """水位线之上、被单独标记为已读的全局通知（稀疏集合）"""
+    __tablename__ = "notification_reads"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    notification_id = Column(Integer, ForeignKey("notifications.id"), primary_key=True)
+
+
+class NotificationCounter(Base):
+    """
+    未读数缓存的持久化副本（定期从内存写回）
+
+    未读数 = personal_unread + 全局通知总数 - global_read
+    """
+    __tablename__ = "notification_counters"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    personal_unread = Column(Integer, default=0, nullable=False)  # 个人通知未读数
+    global_read = Column(Integer, default=0, nullable=False)  # 已读的全局通知数
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
@@ -21,14 +21,17 @@ class Order(Base):
     shipped_at = Column(DateTime)
     completed_at = Column(DateTime)
     cancelled_at = Column(DateTime)
-    created_at = Column(DateTime, server_default=func.now())
+    created_at = Column(DateTime, server_default=func.now(), index=True)
     updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
+    version = Column(Integer, nullable=False, default=1, server_default="1")  # 乐观锁版本号（同 Product.version）
     
     # 关系
     user = relationship("User", back_populates="orders")
     items = relationship("OrderItem", back_populates="order", cascade="all, delete-orphan")
     refunds = relationship("Refund", back_populates="order")
     
+    __mapper_args__ = {"version_id_col": version}
+    
     def __repr__(self):
         return f"<Order(id={self.id}, order_number={self.order_number})>"
     
@@ -80,9 +83,12 @@ class Refund(Base):
     admin_notes = Column(Text)
     created_at = Column(DateTime, server_default=func.now())
     processed_at = Column(DateTime)
+    version = Column(Integer, nullable=False, default=1, server_default="1")  # 乐观锁版本号（同 Product.version）
     
     # 关系
     order = relationship("Order", back_populates="refunds")
     
+    __mapper_args__ = {"version_id_col": version}
+    
     def __repr__(self):
         return f"<Refund(id={self.id}, order_id={self.order_id})>"
@@ -1,6 +1,7 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, Numeric, ForeignKey
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, Numeric, Float, ForeignKey, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
+from datetime import datetime
 from ..database import Base
 
 
@@ -14,6 +15,9 @@ class Category(Base):
     parent_id = Column(Integer, default=0)
     sort_order = Column(Integer, default=0)
     is_active = Column(Boolean, default=True)
+    # 物化路径：根到自身的 id 序列，如 "/1/5/12/"；子树 = 以自身路径为前缀的所有分类
+    path = Column(String(255), index=True)
+    depth = Column(Integer, default=0)  # 顶级分类为 0
     created_at = Column(DateTime, server_default=func.now())
     
     # 关系
@@ -57,8 +61,11 @@ class Product(Base):
     is_published = Column(Boolean, default=True)
     sales_count = Column(Integer, default=0)
     view_count = Column(Integer, default=0)
+    popularity_score = Column(Float, default=0)  # 按近期成交时间衰减的热度，由后台任务定期重算
     created_at = Column(DateTime, server_default=func.now())
     updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
+    # 乐观锁版本号：每次通过 ORM 更新自增，UPDATE 带 WHERE version = 读取时的值
+    version = Column(Integer, nullable=False, default=1, server_default="1")
     
     # 关系
     category = relationship("Category", back_populates="products")
@@ -67,6 +74,13 @@ class Product(Base):
     reviews = relationship("ProductReview", back_populates="product")
     cart_items = relationship("CartItem", back_populates="product")
     
+    __table_args__ = (
+        # 列表按销量 / 热度排序（通常同时筛选上架状态）
+        Index("ix_products_published_sales", "is_published", "sales_count"),
+        Index("ix_products_published_popularity", "is_published", "popularity_score"),
+    )
+    __mapper_args__ = {"version_id_col": version}
+    
     def __repr__(self):
         return f"<Product(id={self.id}, name={self.name})>"
 
@@ -98,3 +112,37 @@ class ProductParam(Base):
     
     def __repr__(self):
         return f"<ProductParam(id={self.id}, name={self.name})>"
+
+
+class ProductRecommendation(Base):
+    """
+    预计算的相关商品（后台任务定期重建）
+
+    每个商品一行，related_ids 为按相关度排序的商品 id 列表（JSON），详情页按主键直接读取
+    """
+    __tablename__ = "product_recommendations"
+
+    product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), primary_key=True)
+    related_ids = Column(Text, nullable=False)  # JSON: [12, 7, 33, ...]
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
+
+
+class ProductImportJob(Base):
+    """商品批量导入任务：上传文件落盘后由后台 worker 分批写入"""
+    __tablename__ = "product_import_jobs"
+
+    id = Column(String(32), primary_key=True)  # uuid hex
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    format = Column(String(10), nullable=False)  # csv, jsonl
+    file_path = Column(String(500), nullable=False)
+    status = Column(String(20), default="queued", index=True)  # queued, running, succeeded, failed
+    total_rows = Column(Integer, default=0)
+    # 已处理的行数与进度、错误一起按批提交，进程重启后从这里继续
+    processed_rows = Column(Integer, default=0)
+    created_count = Column(Integer, default=0)
+    error_count = Column(Integer, default=0)
+    errors = Column(Text, default="[]")  # JSON: [{"row": 12, "error": "..."}]，最多保留 PRODUCT_IMPORT_MAX_ERRORS 条
+    error = Column(Text, nullable=True)  # 整个任务失败的原因
+    created_at = Column(DateTime, default=datetime.now)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
@@ -0,0 +1,23 @@
+"""
+上传文件（内容寻址）模型
+"""
+from datetime import datetime
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey
+
+from ..database import Base
+
+
+class UploadBlob(Base):
+    """按 sha256 去重存储的上传文件"""
+    __tablename__ = "upload_blobs"
+
+    sha256 = Column(String(64), primary_key=True)
+    ext = Column(String(10), nullable=False)
+    size = Column(Integer, nullable=False)
+    content_type = Column(String(50), nullable=False)
+    ref_count = Column(Integer, default=0, nullable=False, index=True)  # 商品/评价图片引用次数
+    uploader_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    created_at = Column(DateTime, default=datetime.now)  # 最近一次上传（去重命中时刷新），与 GC 宽限期比较，使用本地时间
+
+    def __repr__(self):
+        return f"<UploadBlob(sha256={self.sha256[:12]}, ref_count={self.ref_count})>"
@@ -0,0 +1,28 @@
+"""
+重建相关商品推荐表
+
+服务运行时后台任务会定期重建（RELATED_REFRESH_SECONDS），
+导入大量订单 / 商品后可以手动执行一次。
+
+运行方式: python -m app.rebuild_related [--top-k 20]
+"""
+import argparse
+
+from .config import settings
+from .database import init_db
+from .services.related_products import rebuild_recommendations
+
+
+def main():
+    parser = argparse.ArgumentParser(description="重建相关商品推荐表")
+    parser.add_argument("--top-k", type=int, default=settings.RELATED_TOP_K,
+                        help=f"每个商品保存的相关商品数（默认 {settings.RELATED_TOP_K}）")
+    args = parser.parse_args()
+
+    init_db()
+    count = rebuild_recommendations(args.top_k)
+    print(f"已为 {count} 个商品生成相关商品")
+
+
+if __name__ == "__main__":
+    main()
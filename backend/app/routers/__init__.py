@@ -12,6 +12,9 @@ from .dashboard import router as dashboard_router
 from .upload import router as upload_router
 from .favorites import router as favorites_router
 from .ai import router as ai_router
+from .product_io import router as product_io_router
+from .order_export import router as order_export_router
+from .order_status import router as order_status_router
 
 __all__ = [
     "auth_router",
@@ -28,4 +31,7 @@ __all__ = [
     "upload_router",
     "favorites_router",
     "ai_router",
+    "product_io_router",
+    "order_export_router",
+    "order_status_router",
 ]
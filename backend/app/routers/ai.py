@@ -1,13 +1,17 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from typing import List, Optional
 import uuid
 from pydantic import BaseModel
 
 from ..database import get_db
-from ..models import User, AIChatSession, AIChatMessage
-from ..services.ai_service import AIService
-from ..dependencies import get_current_user
+from ..config import settings
+from ..models import User, AIChatSession, AIChatMessage, AIChatJob
+from ..services.ai_jobs import job_queue, load_job, QueueFullError, FINISHED_STATUSES
+from ..services.ai_client import get_ai_client
+from ..services.ai_cache import response_cache
+from ..dependencies import get_current_user, get_current_admin
 
 router = APIRouter(
     prefix="/ai",
@@ -28,6 +32,7 @@ class ChatSessionResponse(BaseModel):
 class ChatMessageCreate(BaseModel):
     content: str
     session_token: str
+    callback_url: Optional[str] = None  # 任务完成后 POST 结果（需开启 AI_JOB_CALLBACKS_ENABLED）
 
 class ChatMessageResponse(BaseModel):
     id: int
@@ -35,6 +40,11 @@ class ChatMessageResponse(BaseModel):
     content: str
     created_at: str
 
+class ChatJobResponse(BaseModel):
+    job_id: str
+    status: str
+    user_message: ChatMessageResponse
+
 # Endpoints
 
 @router.post("/sessions", response_model=ChatSessionResponse)
@@ -108,52 +118,101 @@ def get_messages(
         } for m in messages
     ]
 
-@router.post("/chat", response_model=ChatMessageResponse)
-def chat(
-    message_in: ChatMessageCreate,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
-):
-    # 1. Verify Session
-    session = db.query(AIChatSession).filter(AIChatSession.session_token == message_in.session_token, AIChatSession.user_id == current_user.id).first()
+def _save_chat_message(db: Session, user_id: int, message_in: ChatMessageCreate) -> dict:
+    """Verify the session and store the user message plus its job record (runs in the threadpool)."""
+    session = db.query(AIChatSession).filter(AIChatSession.session_token == message_in.session_token, AIChatSession.user_id == user_id).first()
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
 
-    # 2. Save User Message
     user_msg = AIChatMessage(
         session_id=session.id,
         role="user",
         content=message_in.content
     )
     db.add(user_msg)
-    db.commit() # Commit to get ID and ensure it's saved
-
-    # 3. Get History for Context
-    # We fetch all messages for this session to pass to logic (or last N)
-    history_objs = db.query(AIChatMessage).filter(AIChatMessage.session_id == session.id).order_by(AIChatMessage.created_at.asc()).all()
-    history = [{"role": m.role, "content": m.content} for m in history_objs]
+    db.flush()
 
-    # 4. Call AI Service
-    ai_service = AIService(db)
-    response_text = ai_service.generate_response(current_user.id, history)
-
-    # 5. Save Assistant Message
-    ai_msg = AIChatMessage(
+    job = AIChatJob(
+        id=uuid.uuid4().hex,
+        user_id=user_id,
         session_id=session.id,
-        role="assistant",
-        content=response_text
+        user_message_id=user_msg.id,
+        status="queued",
+        callback_url=message_in.callback_url
     )
-    db.add(ai_msg)
-    
-    # Update session last active
-    session.last_active_at = ai_msg.created_at
-    
+    db.add(job)
     db.commit()
-    db.refresh(ai_msg)
 
     return {
-        "id": ai_msg.id,
-        "role": ai_msg.role,
-        "content": ai_msg.content,
-        "created_at": ai_msg.created_at.isoformat()
+        "job_id": job.id,
+        "status": job.status,
+        "user_message": {
+            "id": user_msg.id,
+            "role": user_msg.role,
+            "content": user_msg.content,
+            "created_at": user_msg.created_at.isoformat()
+        }
+    }
+
+@router.post("/chat", response_model=ChatJobResponse, status_code=status.HTTP_202_ACCEPTED)
+async def chat(
+    message_in: ChatMessageCreate,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Queue an assistant reply and return the job id immediately.
+
+    Poll GET /ai/jobs/{job_id} (optionally with ?wait=seconds) for the result.
+    """
+    # 1. Cheap in-memory checks first
+    if message_in.callback_url and not message_in.callback_url.startswith(("http://", "https://")):
+        raise HTTPException(status_code=400, detail="callback_url must be an http(s) URL")
+
+    # Reserve the queue slot before awaiting, so concurrent requests can't all pass the check
+    try:
+        job_queue.reserve(current_user.id)
+    except QueueFullError as e:
+        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=str(e))
+
+    # 2. Verify the session and save the user message + job record off the event loop
+    try:
+        result = await run_in_threadpool(_save_chat_message, db, current_user.id, message_in)
+    except BaseException:
+        job_queue.release(current_user.id)
+        raise
+
+    # 3. Hand over to the background workers (queue state lives on the event loop)
+    job_queue.submit(result["job_id"], current_user.id)
+    return result
+
+@router.get("/jobs/{job_id}")
+async def get_job(
+    job_id: str,
+    wait: float = Query(0, ge=0, description="Long-poll: seconds to wait for completion"),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    user_id = current_user.id
+    # Release the request's DB connection before a potentially long wait
+    db.close()
+
+    job = await run_in_threadpool(load_job, job_id, user_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    if wait and job["status"] not in FINISHED_STATUSES:
+        if await job_queue.wait(job_id, min(wait, settings.AI_JOB_MAX_WAIT_SECONDS)):
+            job = await run_in_threadpool(load_job, job_id, user_id)
+
+    return job
+
+@router.get("/metrics")
+async def get_ai_metrics(
+    current_admin: User = Depends(get_current_admin)
+):
+    """AI 上游调用与回复缓存指标（管理员）"""
+    return {
+        "upstream": get_ai_client().snapshot(),
+        "cache": response_cache.snapshot(),
     }
@@ -1,4 +1,4 @@
-from typing import Optional, List
+from typing import Optional
 from fastapi import APIRouter, Depends, Query
 from sqlalchemy.orm import Session
 
@@ -7,23 +7,12 @@ from ..models import Category, User
 from ..schemas import CategoryResponse, CategoryCreate, CategoryUpdate
 from ..utils.response import success_response
 from ..dependencies import get_current_admin
+from ..services.category_tree import assign_path, category_tree, move_subtree
+from ..services.product_facets import facet_cache
 
 router = APIRouter(prefix="/categories", tags=["商品分类"])
 
 
-def build_category_tree(categories: List[Category], parent_id: int = 0) -> List[dict]:
-    """递归构建分类树"""
-    result = []
-    for category in categories:
-        if category.parent_id == parent_id:
-            children = build_category_tree(categories, category.id)
-            cat_dict = CategoryResponse.model_validate(category).model_dump()
-            if children:
-                cat_dict["children"] = children
-            result.append(cat_dict)
-    return result
-
-
 @router.get("")
 async def get_categories(
     parent_id: Optional[int] = Query(None, description="父分类ID，0表示顶级分类"),
@@ -36,24 +25,12 @@ async def get_categories(
     - **parent_id**: 父分类ID，0表示顶级分类
     - **is_active**: 是否只显示启用分类
     """
-    query = db.query(Category)
-    
-    if is_active is not None:
-        query = query.filter(Category.is_active == is_active)
-    
-    categories = query.order_by(Category.sort_order, Category.id).all()
-    
     # 如果指定了 parent_id，只返回该分类的子分类
     if parent_id is not None:
-        categories = [c for c in categories if c.parent_id == parent_id]
-        return success_response(
-            data=[CategoryResponse.model_validate(c).model_dump() for c in categories]
-        )
-    
-    # 构建分类树
-    tree = build_category_tree(categories, 0)
+        return success_response(data=category_tree.get_children(db, parent_id, is_active))
     
-    return success_response(data=tree)
+    # 分类树（缓存）
+    return success_response(data=category_tree.get_tree(db, is_active))
 
 
 @router.get("/{category_id}")
@@ -62,20 +39,13 @@ async def get_category(
     db: Session = Depends(get_db)
 ):
     """
-    获取分类详情
+    获取分类详情（含直接子分类）
     """
-    category = db.query(Category).filter(Category.id == category_id).first()
+    result = category_tree.get_node(db, category_id)
     
-    if not category:
+    if result is None:
         return success_response(data=None, message="分类不存在", code=404)
     
-    # 获取子分类
-    children = db.query(Category).filter(Category.parent_id == category_id).all()
-    
-    result = CategoryResponse.model_validate(category).model_dump()
-    if children:
-        result["children"] = [CategoryResponse.model_validate(c).model_dump() for c in children]
-    
     return success_response(data=result)
 
 
@@ -94,8 +64,12 @@ async def create_category(
     
     category = Category(**category_data.model_dump())
     db.add(category)
+    db.flush()
+    assign_path(db, category)
     db.commit()
     db.refresh(category)
+    category_tree.invalidate()
+    facet_cache.invalidate()
     
     return success_response(
         data=CategoryResponse.model_validate(category).model_dump(),
@@ -123,12 +97,23 @@ async def update_category(
     if "name" in update_dict and update_dict["name"] != category.name:
         if db.query(Category).filter(Category.name == update_dict["name"]).first():
             return success_response(code=400, message="分类名称已存在")
+    
+    # 不能把分类移动到自身或自己的子孙分类下
+    if update_dict.get("parent_id") and update_dict["parent_id"] in category_tree.descendants(db, category_id):
+        return success_response(code=400, message="不能将分类移动到自身或其子分类下")
             
+    old_parent_id, old_path, old_depth = category.parent_id, category.path, category.depth
     for key, value in update_dict.items():
         setattr(category, key, value)
+    
+    # 移动了位置时同步更新整棵子树的路径
+    if category.parent_id != old_parent_id:
+        move_subtree(db, category, old_path, old_depth)
         
     db.commit()
     db.refresh(category)
+    category_tree.invalidate()
+    facet_cache.invalidate()
     
     return success_response(
         data=CategoryResponse.model_validate(category).model_dump(),
@@ -160,5 +145,7 @@ async def delete_category(
     
     db.delete(category)
     db.commit()
+    category_tree.invalidate()
+    facet_cache.invalidate()
     
     return success_response(message="分类删除成功")
@@ -1,15 +1,24 @@
 """
 通知路由
 """
-from typing import Optional
-from fastapi import APIRouter, Depends, HTTPException, Query, status
+import asyncio
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import StreamingResponse
+from fastapi.security import HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
 from sqlalchemy import or_
+from starlette.concurrency import run_in_threadpool
 
-from ..database import get_db
+from ..config import settings
+from ..database import get_db, SessionLocal
 from ..models import User, Notification
-from ..utils.response import success_response
-from ..dependencies import get_current_user
+from ..utils.response import success_response, ErrorMessage
+from ..utils.security import verify_token
+from ..dependencies import get_current_user, security
+from ..services.notification_hub import notification_hub, notification_to_dict, format_sse
+from ..services.notification_reads import mark_all_read, mark_read, read_flags
+from ..services.unread_counters import unread_counters
 
 router = APIRouter(prefix="/notifications", tags=["通知"])
 
@@ -35,18 +44,10 @@ async def get_notifications(
     total = query.count()
     notifications = query.offset((page - 1) * page_size).limit(page_size).all()
     
-    notification_list = []
-    for n in notifications:
-        notification_list.append({
-            "id": n.id,
-            "type": n.type,
-            "title": n.title,
-            "content": n.content,
-            "related_id": n.related_id,
-            "related_image": n.related_image,
-            "is_read": n.is_read,
-            "created_at": n.created_at.isoformat() if n.created_at else None
-        })
+    flags = read_flags(db, current_user.id, notifications)
+    notification_list = [
+        {**notification_to_dict(n), "is_read": flags[n.id]} for n in notifications
+    ]
     
     return success_response(data={
         "list": notification_list,
@@ -58,6 +59,93 @@ async def get_notifications(
     })
 
 
+def _stream_user_id(token: Optional[str]) -> Optional[int]:
+    """校验 token 并返回用户 ID；只短暂使用数据库会话，不在整个推送连接期间占用"""
+    payload = verify_token(token, "access") if token else None
+    if payload is None or payload.get("sub") is None:
+        return None
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.id == int(payload["sub"])).first()
+        return user.id if user is not None and user.is_active else None
+    finally:
+        db.close()
+
+
+def _missed_notifications(user_id: int, last_id: int) -> List[str]:
+    """重连时补发 last_id 之后的通知（按时间正序）"""
+    db = SessionLocal()
+    try:
+        rows = db.query(Notification).filter(
+            or_(
+                Notification.user_id == None,
+                Notification.user_id == user_id
+            ),
+            Notification.id > last_id
+        ).order_by(Notification.id.desc()).limit(settings.NOTIFY_REPLAY_LIMIT).all()
+        return [format_sse("notification", notification_to_dict(n), n.id) for n in reversed(rows)]
+    finally:
+        db.close()
+
+
+@router.get("/stream")
+async def notification_stream(
+    request: Request,
+    token: Optional[str] = Query(None, description="EventSource 无法设置请求头时用查询参数传 token"),
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(security)
+):
+    """
+    通知实时推送（Server-Sent Events）
+
+    - event: notification，data 与通知列表中的单项格式相同，id 为通知 ID
+    - 空闲时定期发送注释行作为心跳
+    - 断线重连时浏览器会带上 Last-Event-ID，服务端补发其后的通知
+    - 读取过慢导致积压时连接会被断开，客户端重连即可
+    """
+    user_id = await run_in_threadpool(
+        _stream_user_id, credentials.credentials if credentials else token
+    )
+    if user_id is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail=ErrorMessage.TOKEN_INVALID
+        )
+
+    # 先订阅再查询错过的通知，两者之间不会漏掉（可能重复，客户端按 id 去重）
+    sub = notification_hub.subscribe(user_id)
+    last_event_id = request.headers.get("last-event-id", "")
+    missed = []
+    if last_event_id.isdigit():
+        try:
+            missed = await run_in_threadpool(_missed_notifications, user_id, int(last_event_id))
+        except Exception:
+            notification_hub.unsubscribe(sub)
+            raise
+
+    async def event_stream():
+        try:
+            yield "retry: 5000\n\n"
+            for frame in missed:
+                yield frame
+            while True:
+                try:
+                    frame = await asyncio.wait_for(sub.queue.get(), settings.NOTIFY_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                if frame is None:
+                    break
+                yield frame
+        finally:
+            notification_hub.unsubscribe(sub)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @router.get("/unread-count")
 async def get_unread_count(
     current_user: User = Depends(get_current_user),
@@ -66,14 +154,9 @@ async def get_unread_count(
     """
     获取未读通知数量
     """
-    count = db.query(Notification).filter(
-        or_(
-            Notification.user_id == None,
-            Notification.user_id == current_user.id
-        ),
-        Notification.is_read == False
-    ).count()
-    
+    # 内存中的计数；只有该用户首次访问时才会查询数据库
+    count = unread_counters.get(db, current_user.id)
+
     return success_response(data={"count": count})
 
 
@@ -100,8 +183,12 @@ async def mark_as_read(
             detail="通知不存在"
         )
     
-    notification.is_read = True
+    # 全局通知的已读状态按用户记录，不修改通知本身
+    unread_counters.ensure_loaded(db, current_user.id)
+    was_unread = mark_read(db, current_user.id, notification)
     db.commit()
+    if was_unread:
+        unread_counters.on_read(current_user.id, is_global=notification.user_id is None)
     
     return success_response(message="已标记为已读")
 
@@ -114,14 +201,8 @@ async def mark_all_as_read(
     """
     标记所有通知为已读
     """
-    db.query(Notification).filter(
-        or_(
-            Notification.user_id == None,
-            Notification.user_id == current_user.id
-        ),
-        Notification.is_read == False
-    ).update({"is_read": True}, synchronize_session=False)
-    
+    mark_all_read(db, current_user.id)
     db.commit()
+    unread_counters.on_read_all(current_user.id)
     
     return success_response(message="已全部标记为已读")
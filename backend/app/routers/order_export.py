@@ -0,0 +1,44 @@
+"""
+订单导出路由（管理员）
+"""
+from datetime import date, datetime, time, timedelta
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+
+from ..models import User
+from ..dependencies import get_current_admin
+from ..services.order_export import export_orders
+
+router = APIRouter(prefix="/admin/orders", tags=["订单导出"])
+
+EXPORT_MEDIA_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "jsonl": "application/x-ndjson; charset=utf-8",
+}
+
+
+@router.get("/export")
+async def export_orders_file(
+    format: str = Query("csv", pattern="^(csv|jsonl)$"),
+    start_date: Optional[date] = Query(None, description="下单日期起（含）"),
+    end_date: Optional[date] = Query(None, description="下单日期止（含）"),
+    status: Optional[str] = None,
+    current_admin: User = Depends(get_current_admin),
+):
+    """
+    流式导出订单（按下单时间升序）
+
+    CSV 每个订单明细一行；JSONL 每个订单一行，明细在 items 中。
+    """
+    if start_date and end_date and start_date > end_date:
+        raise HTTPException(status_code=400, detail="开始日期不能晚于结束日期")
+
+    start = datetime.combine(start_date, time.min) if start_date else None
+    end = datetime.combine(end_date + timedelta(days=1), time.min) if end_date else None
+    filename = f"orders-{start_date or 'all'}-{end_date or datetime.now().date()}.{format}"
+    return StreamingResponse(
+        export_orders(format, start, end, status),
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
@@ -0,0 +1,43 @@
+"""
+订单批量状态变更路由（管理员）
+"""
+from typing import List
+from fastapi import APIRouter, Depends, HTTPException
+from pydantic import BaseModel, Field
+from sqlalchemy.orm import Session
+
+from ..database import get_db
+from ..models import User
+from ..utils.response import success_response
+from ..dependencies import get_current_admin
+from ..services.order_state import InvalidTransition, bulk_transition
+
+router = APIRouter(prefix="/admin/orders", tags=["订单状态"])
+
+
+class OrderBulkStatus(BaseModel):
+    """批量变更订单状态请求"""
+    order_ids: List[int] = Field(..., min_length=1, max_length=5000)
+    status: str = Field(..., description="目标状态，如 shipped、completed、cancelled")
+
+
+@router.put("/bulk-status")
+async def bulk_update_order_status(
+    data: OrderBulkStatus,
+    current_admin: User = Depends(get_current_admin),
+    db: Session = Depends(get_db)
+):
+    """
+    批量变更订单状态（如批量发货）
+
+    按来源状态分组，每组一条 UPDATE；不允许迁移、不存在或被并发修改的订单分别在
+    skipped、not_found 中返回，其余订单在同一事务中提交。
+    """
+    try:
+        result = bulk_transition(db, list(dict.fromkeys(data.order_ids)), data.status)
+    except InvalidTransition as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    db.commit()
+    await result.effects.publish()
+
+    return success_response(data=result.to_dict(), message=f"已更新 {len(result.updated)} 个订单")
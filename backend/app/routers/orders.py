@@ -1,7 +1,7 @@
 import json
 from datetime import datetime
 from typing import Optional, List
-from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response, status
 from sqlalchemy.orm import Session, joinedload
 from decimal import Decimal
 
@@ -9,7 +9,10 @@ from ..database import get_db
 from ..models import User, Order, OrderItem, CartItem, Product, UserAddress
 from ..schemas import OrderCreate, OrderCancel, OrderListItem, OrderDetail, ShippingAddress, OrderTimeline, OrderUpdateStatus
 from ..utils.response import success_response, ErrorMessage
+from ..utils.etag import check_if_match, set_etag
 from ..dependencies import get_current_user, get_current_admin
+from ..services.ai_cache import invalidate_products
+from ..services.order_state import USER, InvalidTransition, transition
 
 router = APIRouter(prefix="/orders", tags=["订单"])
 
@@ -21,6 +24,22 @@ def generate_order_number() -> str:
     return f"SJ{now.strftime('%Y%m%d%H%M%S')}{random.randint(1000, 9999)}"
 
 
+def adjust_stock(db: Session, product_id: int, delta: int) -> bool:
+    """
+    原子地增减库存，扣减时库存不足返回 False；由调用方提交
+
+    同时递增商品版本号：持有旧 ETag 的商品修改会返回 409，而并发下单之间不会互相冲突。
+    """
+    query = db.query(Product).filter(Product.id == product_id)
+    if delta < 0:
+        query = query.filter(Product.stock >= -delta)
+    updated = query.update(
+        {Product.stock: Product.stock + delta, Product.version: Product.version + 1},
+        synchronize_session=False
+    )
+    return updated > 0
+
+
 def build_order_timelines(order: Order) -> List[dict]:
     """构建订单时间线"""
     timelines = []
@@ -92,7 +111,8 @@ def build_order_response(order: Order) -> dict:
             }
             for item in order.items
         ],
-        "created_at": order.created_at.isoformat() if order.created_at else None
+        "created_at": order.created_at.isoformat() if order.created_at else None,
+        "version": order.version
     }
 
 
@@ -192,8 +212,11 @@ async def create_order(
     
     # 扣减库存
     for cart_item in cart_items:
-        if cart_item.product:
-            cart_item.product.stock -= cart_item.quantity
+        if cart_item.product and not adjust_stock(db, cart_item.product_id, -cart_item.quantity):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"商品 {cart_item.product.name} 库存不足"
+            )
     
     # 删除购物车项
     for cart_item in cart_items:
@@ -201,6 +224,7 @@ async def create_order(
     
     db.commit()
     db.refresh(order)
+    invalidate_products(item["product_id"] for item in order_items)
     
     # 构建支付信息（模拟）
     payment_info = {
@@ -292,6 +316,7 @@ async def get_all_orders(
 @router.get("/admin/{order_id}")
 async def get_admin_order(
     order_id: int,
+    response: Response,
     current_admin: User = Depends(get_current_admin),
     db: Session = Depends(get_db)
 ):
@@ -356,9 +381,11 @@ async def get_admin_order(
         "created_at": order.created_at.isoformat() if order.created_at else None,
         "paid_at": order.paid_at.isoformat() if order.paid_at else None,
         "shipped_at": order.shipped_at.isoformat() if order.shipped_at else None,
-        "completed_at": order.completed_at.isoformat() if order.completed_at else None
+        "completed_at": order.completed_at.isoformat() if order.completed_at else None,
+        "version": order.version
     }
     
+    set_etag(response, order.version)
     return success_response(data=result)
 
 
@@ -456,24 +483,18 @@ async def cancel_order(
             detail=ErrorMessage.ORDER_NOT_FOUND
         )
     
-    # 只有待支付的订单才能取消
-    if order.status != "pending":
+    # 只有待支付的订单才能取消（状态机归还库存）
+    try:
+        effects = transition(db, order, "cancelled", actor=USER)
+    except InvalidTransition:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=ErrorMessage.CANNOT_CANCEL_ORDER
         )
-    
-    # 恢复库存
-    for item in order.items:
-        product = db.query(Product).filter(Product.id == item.product_id).first()
-        if product:
-            product.stock += item.quantity
-    
-    order.status = "cancelled"
-    order.cancelled_at = datetime.now()
     order.note = f"取消原因: {cancel_data.reason}"
     
     db.commit()
+    await effects.publish()
     
     return success_response(message="订单已取消")
 
@@ -502,22 +523,17 @@ async def request_refund(
         )
     
     # 只有已支付的订单才能退款 (发货后通常走售后流程，这里简化为未发货可退款)
-    if order.status != "paid":
+    try:
+        effects = transition(db, order, "refunded", actor=USER)
+    except InvalidTransition:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="当前订单状态不可退款"
         )
-    
-    # 恢复库存
-    for item in order.items:
-        product = db.query(Product).filter(Product.id == item.product_id).first()
-        if product:
-            product.stock += item.quantity
-    
-    order.status = "refunded"
     order.note = f"{order.note or ''}\n退款原因: {cancel_data.reason}"
     
     db.commit()
+    await effects.publish()
     
     return success_response(message="退款成功")
 
@@ -543,16 +559,16 @@ async def confirm_order(
         )
     
     # 只有已发货的订单才能确认收货
-    if order.status != "shipped":
+    try:
+        effects = transition(db, order, "completed", actor=USER)
+    except InvalidTransition:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="只有已发货的订单才能确认收货"
         )
     
-    order.status = "completed"
-    order.completed_at = datetime.now()
-    
     db.commit()
+    await effects.publish()
     
     return success_response(message="确认收货成功")
 
@@ -576,17 +592,17 @@ async def simulate_pay(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=ErrorMessage.ORDER_NOT_FOUND
         )
-            
-    # if order.status != "pending":
-    #      raise HTTPException(
-    #         status_code=status.HTTP_400_BAD_REQUEST,
-    #         detail="订单已支付或状态不正确"
-    #     )
     
-    order.status = "paid"
-    order.paid_at = datetime.now()
+    try:
+        effects = transition(db, order, "paid", actor=USER)
+    except InvalidTransition:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="订单已支付或状态不正确"
+        )
     
     db.commit()
+    await effects.publish()
     
     return success_response(message="支付成功")
 
@@ -598,11 +614,16 @@ async def simulate_pay(
 async def update_order_status(
     order_id: int,
     status_data: OrderUpdateStatus,
+    response: Response,
+    if_match: Optional[str] = Header(None),
     current_admin: User = Depends(get_current_admin),
     db: Session = Depends(get_db)
 ):
     """
     更新订单状态（管理员）
+
+    If-Match 传入订单详情返回的 ETag，订单已被其他人修改时返回 409；
+    不允许的状态迁移（见 services/order_state.py）返回 400。
     """
     order = db.query(Order).filter(Order.id == order_id).first()
     if not order:
@@ -610,21 +631,15 @@ async def update_order_status(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=ErrorMessage.ORDER_NOT_FOUND
         )
+    check_if_match(if_match, order.version)
     
-    old_status = order.status
-    new_status = status_data.status
-    
-    # 更新状态逻辑
-    if new_status == "shipped" and old_status == "paid":
-        order.shipped_at = datetime.now()
-        # 这里可以保存 tracking_number
-    elif new_status == "completed" and old_status == "shipped":
-        order.completed_at = datetime.now()
-    elif new_status == "cancelled":
-        # 恢复库存等逻辑（如果尚未发货）
-        pass
-        
-    order.status = new_status
+    # 时间戳、库存、销量由状态机处理；tracking_number 暂不保存
+    try:
+        effects = transition(db, order, status_data.status, notify=True)
+    except InvalidTransition as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
     db.commit()
+    await effects.publish()
     
-    return success_response(message="订单状态更新成功")
+    set_etag(response, order.version)
+    return success_response(data={"version": order.version}, message="订单状态更新成功")
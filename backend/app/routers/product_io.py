@@ -0,0 +1,116 @@
+"""
+商品批量导入 / 导出路由（管理员）
+"""
+import uuid
+from datetime import datetime
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+
+from ..config import settings
+from ..database import get_db
+from ..models import User, ProductImportJob
+from ..utils.response import success_response
+from ..dependencies import get_current_admin
+from ..services.uploads import UploadError, receive_raw_upload
+from ..services.product_filters import ProductFilters
+from ..services.product_io import (
+    detect_format, export_products, job_to_dict, product_import_queue,
+)
+
+router = APIRouter(prefix="/admin/products", tags=["商品导入导出"])
+
+# 请求体由路由自行流式接收，这里只为 OpenAPI 文档声明
+IMPORT_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "text/csv": {"schema": {"type": "string", "format": "binary"}},
+            "application/x-ndjson": {"schema": {"type": "string", "format": "binary"}},
+        },
+    }
+}
+
+EXPORT_MEDIA_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "jsonl": "application/x-ndjson; charset=utf-8",
+}
+
+
+@router.post("/import", openapi_extra=IMPORT_OPENAPI)
+async def import_products(
+    request: Request,
+    format: Optional[str] = Query(None, pattern="^(csv|jsonl)$", description="csv, jsonl；不传时按 Content-Type 判断"),
+    current_admin: User = Depends(get_current_admin),
+    db: Session = Depends(get_db)
+):
+    """
+    批量导入商品
+
+    请求体为 CSV 或 JSONL 文件内容，接收完成后立即返回任务，
+    通过 GET /admin/products/import/{job_id} 查询进度和错误行。
+    """
+    fmt = format or detect_format(request.headers.get("content-type"))
+    if fmt is None:
+        raise HTTPException(status_code=400, detail="无法识别导入文件格式，请指定 format=csv 或 format=jsonl")
+
+    try:
+        stored = await receive_raw_upload(
+            request, settings.PRODUCT_IMPORT_DIR, settings.PRODUCT_IMPORT_MAX_BYTES, sniff=False
+        )
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+
+    job = ProductImportJob(
+        id=uuid.uuid4().hex,
+        user_id=current_admin.id,
+        format=fmt,
+        file_path=stored.path,
+        status="queued",
+    )
+    db.add(job)
+    db.commit()
+    product_import_queue.submit(job.id)
+    return success_response(data=job_to_dict(job, with_errors=False), message="导入任务已提交")
+
+
+@router.get("/import/{job_id}")
+async def get_import_job(
+    job_id: str,
+    current_admin: User = Depends(get_current_admin),
+    db: Session = Depends(get_db)
+):
+    """
+    查询导入任务进度与错误行
+    """
+    job = db.query(ProductImportJob).filter(ProductImportJob.id == job_id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="导入任务不存在")
+    return success_response(data=job_to_dict(job))
+
+
+@router.get("/export")
+async def export_products_file(
+    format: str = Query("csv", pattern="^(csv|jsonl)$"),
+    keyword: Optional[str] = None,
+    category_id: Optional[int] = None,
+    tag_id: Optional[int] = None,
+    is_published: Optional[bool] = None,
+    current_admin: User = Depends(get_current_admin),
+):
+    """
+    流式导出商品（与导入格式相同，可直接再导入）
+    """
+    filters = ProductFilters(
+        keyword=keyword,
+        category_id=category_id,
+        tag_id=tag_id,
+        is_published=is_published,
+    )
+    filename = f"products-{datetime.now():%Y%m%d%H%M%S}.{format}"
+    return StreamingResponse(
+        export_products(format, filters),
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
@@ -1,14 +1,28 @@
 import json
 from typing import Optional, List
-from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response, status
+from sqlalchemy import func
 from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import or_
+from pydantic import BaseModel, Field
 
 from ..database import get_db
-from ..models import Product, Category, Tag, ProductTag, ProductParam, ProductReview, User, Notification
+from ..models import Product, Category, Tag, ProductTag, ProductParam, ProductReview, User
+from ..schemas.product import ProductParam as ProductParamSchema
 from ..schemas import ProductListItem, ProductDetail, TagResponse, CategoryResponse, ProductQuery, ReviewsSummary, ProductCreate, ProductUpdate
 from ..utils.response import success_response, ErrorMessage
+from ..utils.etag import check_if_match, set_etag
 from ..dependencies import get_current_admin
+from ..services.ai_cache import invalidate_products
+from ..services.product_index import get_product_index
+from ..services.blob_store import adjust_blob_refs, product_image_urls
+from ..services.image_variants import image_variants
+from ..services.product_filters import ProductFilters, apply_filters
+from ..services.product_facets import facet_cache
+from ..services.catalog_snapshot import catalog_snapshot
+from ..services.view_counter import view_counter, viewer_key
+from ..services.related_products import get_related_ids
+from ..services.notification_dispatcher import NotificationEvent, notification_dispatcher
+from ..services.product_attributes import AttributeChange, bump_versions, missing_tag_ids, update_attributes
 
 router = APIRouter(prefix="/products", tags=["商品"])
 
@@ -76,53 +90,39 @@ async def get_products(
     
     支持分页、筛选和排序
     """
-    query = db.query(Product)
-    
-    # 关键词搜索
-    if keyword:
-        query = query.filter(
-            or_(
-                Product.name.contains(keyword),
-                Product.short_description.contains(keyword)
-            )
-        )
-    
-    # 分类筛选
-    if category_id:
-        query = query.filter(Product.category_id == category_id)
-    
-    # 标签筛选
-    if tag_id:
-        query = query.join(ProductTag).filter(ProductTag.tag_id == tag_id)
-    
-    # 价格区间
-    if min_price is not None:
-        query = query.filter(Product.price >= min_price)
-    if max_price is not None:
-        query = query.filter(Product.price <= max_price)
-    
-    # 推荐商品
-    if is_top is not None:
-        query = query.filter(Product.is_top == is_top)
-        
-    # 上架状态
-    if is_published is not None:
-        query = query.filter(Product.is_published == is_published)
-
-    
-    # 排序
-    if sort_by == "price_asc":
-        query = query.order_by(Product.price.asc())
-    elif sort_by == "price_desc":
-        query = query.order_by(Product.price.desc())
-    elif sort_by == "newest":
-        query = query.order_by(Product.created_at.desc())
-    else:  # popular 或默认 -> newest
-        query = query.order_by(Product.created_at.desc())
+    filters = ProductFilters(
+        keyword=keyword,
+        category_id=category_id,
+        tag_id=tag_id,
+        min_price=min_price,
+        max_price=max_price,
+        is_top=is_top,
+        is_published=is_published,
+    )
     
-    # 分页
-    total = query.count()
-    products = query.offset((page - 1) * page_size).limit(page_size).all()
+    if catalog_snapshot.supports(filters):
+        # 内存列式快照：筛选排序在内存中完成，只取当前页的商品
+        total, page_ids = catalog_snapshot.search(db, filters, sort_by, (page - 1) * page_size, page_size)
+        by_id = {p.id: p for p in db.query(Product).filter(Product.id.in_(page_ids))} if page_ids else {}
+        products = [by_id[pid] for pid in page_ids if pid in by_id]
+    else:
+        query = apply_filters(db, db.query(Product), filters)
+
+        # 排序
+        if sort_by == "price_asc":
+            query = query.order_by(Product.price.asc())
+        elif sort_by == "price_desc":
+            query = query.order_by(Product.price.desc())
+        elif sort_by == "sales":
+            query = query.order_by(Product.sales_count.desc(), Product.id.asc())
+        elif sort_by == "popular":
+            query = query.order_by(Product.popularity_score.desc(), Product.id.asc())
+        else:  # newest 或默认
+            query = query.order_by(Product.created_at.desc())
+
+        # 分页
+        total = query.count()
+        products = query.offset((page - 1) * page_size).limit(page_size).all()
     
     # 构建响应
     product_list = []
@@ -134,6 +134,7 @@ async def get_products(
             "price": float(product.price),
             "original_price": float(product.original_price) if product.original_price else None,
             "main_image_url": product.main_image_url,
+            "main_image_srcset": image_variants.srcset(product.main_image_url),
             "stock": product.stock,
             "sales_count": product.sales_count,
             "is_published": product.is_published,
@@ -153,9 +154,41 @@ async def get_products(
     })
 
 
+@router.get("/facets")
+async def get_product_facets(
+    category_id: Optional[int] = None,
+    tag_id: Optional[int] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    keyword: Optional[str] = None,
+    is_top: Optional[bool] = None,
+    is_published: Optional[bool] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    商品筛选统计
+    
+    参数与商品列表的筛选参数相同，返回当前条件下各分类、标签、价格区间的商品数。
+    统计某一维度时忽略该维度自身的条件，便于展示“切换到其他选项后有多少商品”。
+    分类数量包含子分类下的商品。
+    """
+    filters = ProductFilters(
+        keyword=keyword,
+        category_id=category_id,
+        tag_id=tag_id,
+        min_price=min_price,
+        max_price=max_price,
+        is_top=is_top,
+        is_published=is_published,
+    )
+    return success_response(data=facet_cache.get(db, filters))
+
+
 @router.get("/{product_id}")
 async def get_product(
     product_id: int,
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db)
 ):
     """
@@ -173,9 +206,8 @@ async def get_product(
             detail=ErrorMessage.PRODUCT_NOT_FOUND
         )
     
-    # 增加浏览量
-    # product.view_count += 1
-    # db.commit()
+    # 增加浏览量（内存缓冲，后台批量写回）
+    view_counter.record(product.id, viewer_key(request))
     
     # 解析图片URLs
     image_urls = []
@@ -195,16 +227,20 @@ async def get_product(
         "original_price": float(product.original_price) if product.original_price else None,
         "stock": product.stock,
         "main_image_url": product.main_image_url,
+        "main_image_srcset": image_variants.srcset(product.main_image_url),
         "image_urls": image_urls,
+        "image_srcsets": image_variants.srcsets(image_urls),
         "category": CategoryResponse.model_validate(product.category).model_dump() if product.category else None,
         "tags": get_product_tags(product),
         "params": [{"name": p.name, "value": p.value} for p in sorted(product.params, key=lambda x: x.sort_order)],
-        "sales_count": 0, # product.sales_count,
-        "view_count": 0, # product.view_count,
+        "sales_count": product.sales_count,
+        "view_count": (product.view_count or 0) + view_counter.pending(product.id),
         "created_at": product.created_at.isoformat() if product.created_at else None,
-        "reviews_summary": get_reviews_summary(db, product_id)
+        "reviews_summary": get_reviews_summary(db, product_id),
+        "version": product.version
     }
     
+    set_etag(response, product.version)
     return success_response(data=result)
 
 
@@ -217,32 +253,44 @@ async def get_related_products(
     """
     获取相关商品
     
-    基于相同分类推荐
+    读取后台预计算的推荐结果（共同购买 / 收藏 + 同分类高销量兜底）；
+    新商品尚未计算时按同分类高销量推荐
     """
-    product = db.query(Product).filter(Product.id == product_id).first()
-    
-    if not product:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=ErrorMessage.PRODUCT_NOT_FOUND
-        )
-    
-    # 查找相同分类的其他商品
-    related = db.query(Product).filter(
-        Product.category_id == product.category_id,
-        Product.id != product_id
-        # Product.is_published == True
-    ).limit(limit).all() # .order_by(Product.sales_count.desc())
+    related_ids = get_related_ids(db, product_id)
     
-    # 如果相同分类商品不足，补充其他热门商品
-    if len(related) < limit:
-        remaining = limit - len(related)
-        existing_ids = [p.id for p in related] + [product_id]
-        more = db.query(Product).filter(
-            Product.id.notin_(existing_ids)
-            # Product.is_published == True
-        ).limit(remaining).all() # .order_by(Product.sales_count.desc())
-        related.extend(more)
+    if related_ids is not None:
+        by_id = {
+            p.id: p for p in db.query(Product).options(
+                joinedload(Product.category),
+                joinedload(Product.tags).joinedload(ProductTag.tag)
+            ).filter(Product.id.in_(related_ids[:limit * 2]), Product.is_published == True)
+        } if related_ids else {}
+        related = [by_id[pid] for pid in related_ids if pid in by_id][:limit]
+    else:
+        product = db.query(Product).filter(Product.id == product_id).first()
+        
+        if not product:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=ErrorMessage.PRODUCT_NOT_FOUND
+            )
+        
+        # 查找相同分类的其他商品
+        related = db.query(Product).filter(
+            Product.category_id == product.category_id,
+            Product.id != product_id,
+            Product.is_published == True
+        ).order_by(Product.sales_count.desc()).limit(limit).all()
+        
+        # 如果相同分类商品不足，补充其他热门商品
+        if len(related) < limit:
+            remaining = limit - len(related)
+            existing_ids = [p.id for p in related] + [product_id]
+            more = db.query(Product).filter(
+                Product.id.notin_(existing_ids),
+                Product.is_published == True
+            ).order_by(Product.sales_count.desc()).limit(remaining).all()
+            related.extend(more)
     
     product_list = []
     for p in related:
@@ -253,8 +301,9 @@ async def get_related_products(
             "price": float(p.price),
             "original_price": float(p.original_price) if p.original_price else None,
             "main_image_url": p.main_image_url,
+            "main_image_srcset": image_variants.srcset(p.main_image_url),
             "stock": p.stock,
-            "sales_count": 0, # p.sales_count,
+            "sales_count": p.sales_count,
             "tags": get_product_tags(p),
             "category": CategoryResponse.model_validate(p.category).model_dump() if p.category else None
         }
@@ -297,6 +346,7 @@ async def create_product(
         # is_top=product_dict.is_top
     )
     db.add(product)
+    adjust_blob_refs(db, [], product_image_urls(product))
     db.commit()
     db.refresh(product)
 
@@ -311,18 +361,19 @@ async def create_product(
             )
             db.add(param)
         db.commit()
+    facet_cache.invalidate()
+    catalog_snapshot.upsert([product])
 
-    # 创建新商品通知（全局通知，user_id=None）
-    notification = Notification(
+    # 创建新商品通知（全局通知，user_id=None），由后台批量写入并推送
+    await notification_dispatcher.emit(NotificationEvent(
         user_id=None,  # 全局通知
         type="new_product",
         title="新商品上架",
         content=f"{product.name} 已上架，快来看看吧！",
         related_id=product.id,
         related_image=product.main_image_url
-    )
-    db.add(notification)
-    db.commit()
+    ))
+    get_product_index().upsert([product])
 
     
     # 构造响应
@@ -342,12 +393,14 @@ async def create_product(
         "original_price": float(product.original_price) if product.original_price else None,
         "stock": product.stock,
         "main_image_url": product.main_image_url,
+        "main_image_srcset": image_variants.srcset(product.main_image_url),
         "image_urls": image_urls_list,
+        "image_srcsets": image_variants.srcsets(image_urls_list),
         "category": CategoryResponse.model_validate(product.category).model_dump() if product.category else None,
         "tags": get_product_tags(product),
         "params": [{"name": p.name, "value": p.value} for p in sorted(product.params, key=lambda x: x.sort_order)],
-        "sales_count": 0,
-        "view_count": 0,
+        "sales_count": product.sales_count,
+        "view_count": product.view_count,
         "created_at": product.created_at.isoformat() if product.created_at else None,
         "reviews_summary": {"total": 0, "average_rating": 0, "rating_5": 0, "rating_4": 0, "rating_3": 0, "rating_2": 0, "rating_1": 0}
     }
@@ -362,11 +415,15 @@ async def create_product(
 async def update_product(
     product_id: int,
     product_data: ProductUpdate,
+    response: Response,
+    if_match: Optional[str] = Header(None),
     current_admin: User = Depends(get_current_admin),
     db: Session = Depends(get_db)
 ):
     """
     更新商品（管理员）
+
+    If-Match 传入商品详情返回的 ETag，商品已被其他人修改时返回 409。
     """
     product = db.query(Product).filter(Product.id == product_id).first()
     if not product:
@@ -374,29 +431,37 @@ async def update_product(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=ErrorMessage.PRODUCT_NOT_FOUND
         )
+    check_if_match(if_match, product.version)
 
     # 更新字段
     update_data = product_data.model_dump(exclude_unset=True)
+    price_or_stock_changed = any(
+        key in update_data and update_data[key] != getattr(product, key)
+        for key in ("price", "stock")
+    )
+    old_image_urls = product_image_urls(product)
     
     # 特殊处理 JSON 和 关联字段
     if "image_urls" in update_data:
         product.image_urls = json.dumps(update_data.pop("image_urls"))
     
-    # 更新参数需要先删除旧的再添加新的？或者差异更新。这里简单处理：如果有params字段，全量替换
+    # 参数、标签按差异更新，只写有变化的行
+    changes = AttributeChange()
     if "params" in update_data:
-        params_data = update_data.pop("params")
-        # 删除旧参数
-        db.query(ProductParam).filter(ProductParam.product_id == product.id).delete()
-        # 添加新参数
-        if params_data:
-            for idx, p in enumerate(params_data):
-                param = ProductParam(
-                    product_id=product.id,
-                    name=p["name"],
-                    value=p["value"],
-                    sort_order=idx
-                )
-                db.add(param)
+        changes.params = update_data.pop("params") or []
+    if "tag_ids" in update_data:
+        changes.tag_ids = update_data.pop("tag_ids") or []
+        missing = missing_tag_ids(db, changes.tag_ids)
+        if missing:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"标签不存在: {missing}"
+            )
+    if changes.params is not None or changes.tag_ids is not None:
+        diff = update_attributes(db, {product.id: changes})
+        if any(diff.summary().values()):
+            # 参数、标签也算商品内容，确保商品行被更新、版本号递增
+            product.updated_at = func.now()
 
     # 过滤不支持的字段
     unsupported_fields = ["is_top", "is_published", "sales_count", "view_count"]
@@ -409,8 +474,14 @@ async def update_product(
         if hasattr(product, key): # 确保只更新存在的字段
              setattr(product, key, value)
 
+    adjust_blob_refs(db, old_image_urls, product_image_urls(product))
     db.commit()
     db.refresh(product)
+    if price_or_stock_changed:
+        invalidate_products([product.id])
+    facet_cache.invalidate()
+    catalog_snapshot.upsert([product])
+    get_product_index().upsert([product])
 
     # 构造响应
     image_urls_list = []
@@ -429,22 +500,89 @@ async def update_product(
         "original_price": float(product.original_price) if product.original_price else None,
         "stock": product.stock,
         "main_image_url": product.main_image_url,
+        "main_image_srcset": image_variants.srcset(product.main_image_url),
         "image_urls": image_urls_list,
+        "image_srcsets": image_variants.srcsets(image_urls_list),
         "category": CategoryResponse.model_validate(product.category).model_dump() if product.category else None,
         "tags": get_product_tags(product),
         "params": [{"name": p.name, "value": p.value} for p in sorted(product.params, key=lambda x: x.sort_order)],
-        "sales_count": 0,
-        "view_count": 0,
+        "sales_count": product.sales_count,
+        "view_count": product.view_count,
         "created_at": product.created_at.isoformat() if product.created_at else None,
-        "reviews_summary": get_reviews_summary(db, product_id)
+        "reviews_summary": get_reviews_summary(db, product_id),
+        "version": product.version
     }
 
+    set_etag(response, product.version)
     return success_response(
         data=result,
         message="商品更新成功"
     )
 
 
+class ProductAttributesItem(BaseModel):
+    """单个商品的参数 / 标签；不传的部分保持不变"""
+    product_id: int
+    params: Optional[List[ProductParamSchema]] = None
+    tag_ids: Optional[List[int]] = None
+
+
+class ProductAttributesBatch(BaseModel):
+    """批量更新商品参数 / 标签请求"""
+    items: List[ProductAttributesItem] = Field(..., min_length=1, max_length=1000)
+
+
+@router.put("/batch/attributes")
+async def batch_update_attributes(
+    batch: ProductAttributesBatch,
+    current_admin: User = Depends(get_current_admin),
+    db: Session = Depends(get_db)
+):
+    """
+    批量更新商品参数与标签（管理员，供同步任务使用）
+
+    每个商品传入完整的目标参数列表 / 标签 ID 列表，按差异增删改；
+    所有商品在同一个事务中提交，任一商品或标签不存在时整体不生效。
+    """
+    changes = {}
+    for item in batch.items:
+        if item.product_id in changes:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"商品重复: {item.product_id}"
+            )
+        changes[item.product_id] = AttributeChange(
+            params=[p.model_dump() for p in item.params] if item.params is not None else None,
+            tag_ids=item.tag_ids,
+        )
+
+    found = {pid for pid, in db.query(Product.id).filter(Product.id.in_(list(changes)))}
+    missing = sorted(set(changes) - found)
+    if missing:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"{ErrorMessage.PRODUCT_NOT_FOUND}: {missing}"
+        )
+    missing = missing_tag_ids(db, (t for c in changes.values() for t in c.tag_ids or ()))
+    if missing:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"标签不存在: {missing}"
+        )
+
+    diff = update_attributes(db, changes)
+    bump_versions(db, diff.products_changed)
+    db.commit()
+    if diff.tags_changed:
+        facet_cache.invalidate()
+        catalog_snapshot.refresh(diff.tags_changed)
+
+    return success_response(
+        data={"products": len(changes), **diff.summary()},
+        message="商品参数与标签已更新"
+    )
+
+
 @router.delete("/{product_id}")
 async def delete_product(
     product_id: int,
@@ -465,6 +603,9 @@ async def delete_product(
     try:
         product.is_published = False
         db.commit()
+        facet_cache.invalidate()
+        catalog_snapshot.upsert([product])
+        get_product_index().remove([product.id])
     except Exception as e:
         db.rollback()
         raise HTTPException(
@@ -3,14 +3,16 @@
 """
 from typing import Optional
 from datetime import datetime
-from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response, status
 from sqlalchemy.orm import Session, joinedload
 from pydantic import BaseModel
 
 from ..database import get_db
 from ..models import User, Refund, Order
 from ..utils.response import success_response
+from ..utils.etag import check_if_match, set_etag
 from ..dependencies import get_current_admin
+from ..services.order_state import InvalidTransition, TransitionEffects, transition
 
 router = APIRouter(prefix="/admin/refunds", tags=["退款管理"])
 
@@ -60,7 +62,8 @@ async def get_refunds(
             "status": r.status,
             "admin_notes": r.admin_notes,
             "created_at": r.created_at.isoformat() if r.created_at else None,
-            "processed_at": r.processed_at.isoformat() if r.processed_at else None
+            "processed_at": r.processed_at.isoformat() if r.processed_at else None,
+            "version": r.version
         })
     
     return success_response(data={
@@ -77,11 +80,15 @@ async def get_refunds(
 async def approve_refund(
     refund_id: int,
     action: RefundAction,
+    response: Response,
+    if_match: Optional[str] = Header(None),
     current_admin: User = Depends(get_current_admin),
     db: Session = Depends(get_db)
 ):
     """
     批准退款
+
+    If-Match 传入退款列表中的 version（ETag 格式 "version"），已被其他人处理时返回 409。
     """
     refund = db.query(Refund).filter(Refund.id == refund_id).first()
     
@@ -90,6 +97,7 @@ async def approve_refund(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="退款申请不存在"
         )
+    check_if_match(if_match, refund.version)
     
     if refund.status != "pending":
         raise HTTPException(
@@ -102,25 +110,35 @@ async def approve_refund(
     refund.admin_notes = action.admin_notes
     refund.processed_at = datetime.now()
     
-    # 更新订单状态
+    # 更新订单状态（用户已自行退款的订单不再变更）
     order = db.query(Order).filter(Order.id == refund.order_id).first()
-    if order:
-        order.status = "refunded"
+    effects = TransitionEffects()
+    if order and order.status != "refunded":
+        try:
+            effects = transition(db, order, "refunded", notify=True)
+        except InvalidTransition as e:
+            raise HTTPException(status_code=e.status_code, detail=str(e))
     
     db.commit()
+    await effects.publish()
     
-    return success_response(message="退款已批准")
+    set_etag(response, refund.version)
+    return success_response(data={"version": refund.version}, message="退款已批准")
 
 
 @router.put("/{refund_id}/reject")
 async def reject_refund(
     refund_id: int,
     action: RefundAction,
+    response: Response,
+    if_match: Optional[str] = Header(None),
     current_admin: User = Depends(get_current_admin),
     db: Session = Depends(get_db)
 ):
     """
     拒绝退款
+
+    If-Match 传入退款列表中的 version（ETag 格式 "version"），已被其他人处理时返回 409。
     """
     refund = db.query(Refund).filter(Refund.id == refund_id).first()
     
@@ -129,6 +147,7 @@ async def reject_refund(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="退款申请不存在"
         )
+    check_if_match(if_match, refund.version)
     
     if refund.status != "pending":
         raise HTTPException(
@@ -143,9 +162,12 @@ async def reject_refund(
     
     # 恢复订单状态（如果之前被标记为refunded）
     order = db.query(Order).filter(Order.id == refund.order_id).first()
+    effects = TransitionEffects()
     if order and order.status == "refunded":
-        order.status = "completed"  # 恢复为已完成
+        effects = transition(db, order, "completed", notify=True)  # 恢复为已完成
     
     db.commit()
+    await effects.publish()
     
-    return success_response(message="退款已拒绝")
+    set_etag(response, refund.version)
+    return success_response(data={"version": refund.version}, message="退款已拒绝")
@@ -8,6 +8,8 @@ from ..models import User, Product, Order, ProductReview, ReviewLike
 from ..schemas import ReviewCreate, ReviewResponse, ReviewUser
 from ..utils.response import success_response, ErrorMessage
 from ..dependencies import get_current_user, get_current_user_optional, get_current_admin
+from ..services.blob_store import adjust_blob_refs, review_image_urls
+from ..services.image_variants import image_variants
 
 router = APIRouter(tags=["评价"])
 
@@ -40,6 +42,7 @@ def build_review_response(review: ProductReview, current_user_id: Optional[int]
         "rating": review.rating,
         "content": review.content,
         "image_urls": image_urls,
+        "image_srcsets": image_variants.srcsets(image_urls),
         "like_count": review.like_count,
         "is_liked": is_liked,
         "created_at": review.created_at.isoformat() if review.created_at else None,
@@ -161,6 +164,7 @@ async def create_review(
     )
     
     db.add(review)
+    adjust_blob_refs(db, [], review_image_urls(review))
     db.commit()
     db.refresh(review)
     
@@ -416,6 +420,7 @@ async def delete_review(
             detail="评价不存在"
         )
     
+    adjust_blob_refs(db, review_image_urls(review), [])
     db.delete(review)
     db.commit()
     
@@ -1,50 +1,299 @@
+import hashlib
 import os
-import uuid
-import shutil
-from datetime import datetime
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
+import re
+from typing import List, Optional
+from fastapi import APIRouter, Request, HTTPException, Depends, Query, Response
+from pydantic import BaseModel, Field
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from ..config import settings
+from ..database import get_db
 from ..utils.response import success_response, ErrorMessage
+from ..utils.security import verify_token
 from ..dependencies import get_current_user
-from ..models import User
+from ..models import User, UploadBlob
+from ..services.uploads import (
+    IMAGE_TYPES, SNIFF_BYTES, StoredUpload, UploadError,
+    receive_image_upload, receive_raw_upload, sniff_image_type,
+)
+from ..services.blob_store import blob_relpath, register_blob
+from ..services.image_variants import image_variants, manifest_key
+from ..services.storage import LocalStorage, StorageError, get_storage, url_for_key
 
 router = APIRouter(prefix="/upload", tags=["文件上传"])
 
-# 配置上传目录 (相对于 backend 运行目录)
-UPLOAD_DIR = "../frontend/public/uploads"
+_SHA256_RE = re.compile(r"^[0-9a-f]{64}$")
 
-# 确保目录存在
-os.makedirs(UPLOAD_DIR, exist_ok=True)
+# 请求体由路由自行流式解析，这里只为 OpenAPI 文档声明表单结构
+UPLOAD_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "properties": {"file": {"type": "string", "format": "binary"}},
+                    "required": ["file"],
+                }
+            }
+        },
+    }
+}
 
-@router.post("")
+
+class PresignRequest(BaseModel):
+    sha256: str = Field(..., description="文件内容的 sha256（十六进制）")
+    size: int = Field(..., gt=0)
+    content_type: str
+
+
+class UploadedPart(BaseModel):
+    part_number: int = Field(..., ge=1)
+    etag: str
+
+
+class CompleteRequest(BaseModel):
+    sha256: str
+    content_type: str
+    upload_id: Optional[str] = None  # 分片上传时必填
+    parts: List[UploadedPart] = []
+
+
+class AbortRequest(BaseModel):
+    sha256: str
+    content_type: str
+    upload_id: str
+
+
+def _upload_result(stored: StoredUpload) -> dict:
+    return {
+        # 返回相对路径 (前端可访问的路径)
+        "url": url_for_key(blob_relpath(stored.sha256, stored.ext)),
+        "size": stored.size,
+        "sha256": stored.sha256,
+        "content_type": stored.content_type,
+        "deduplicated": stored.deduplicated
+    }
+
+
+def _blob_key(sha256: str, content_type: str) -> str:
+    if not _SHA256_RE.match(sha256):
+        raise HTTPException(status_code=400, detail="sha256 格式不正确")
+    ext = IMAGE_TYPES.get(content_type)
+    if ext is None:
+        raise HTTPException(status_code=415, detail="只能上传图片文件")
+    return blob_relpath(sha256, ext)
+
+
+async def _submit_variants(key: str):
+    """已有缩略图（去重命中）时不重复生成；先查 manifest 缓存，未命中再在线程池中查存储"""
+    if image_variants.cached_manifest(key) is not None:
+        return
+    if not await run_in_threadpool(get_storage().exists, manifest_key(key)):
+        image_variants.submit(key)
+
+
+@router.post("", openapi_extra=UPLOAD_OPENAPI)
 async def upload_file(
-    file: UploadFile = File(...),
-    current_user: User = Depends(get_current_user)
+    request: Request,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
 ):
     """
     上传文件 (登录用户)
-    保存至 frontend/public/uploads
-    返回 URL: /uploads/{filename}
-    """
-    # 验证文件类型
-    if not file.content_type.startswith("image/"):
-        raise HTTPException(status_code=400, detail="只能上传图片文件")
-    
-    # 生成唯一文件名
-    ext = os.path.splitext(file.filename)[1]
-    filename = f"{datetime.now().strftime('%Y%m%d%H%M%S')}_{uuid.uuid4().hex[:8]}{ext}"
-    file_path = os.path.join(UPLOAD_DIR, filename)
-    
+    经 API 中转写入存储后端的 cas/ 目录，按内容 sha256 去重
+    返回 URL: /uploads/cas/ab/cd/{sha256}.{ext}（内容不变 URL 就不变，可长期缓存）
+
+    请求体按块流式写入暂存目录，超过 UPLOAD_MAX_BYTES 立即中止；
+    文件类型按文件头识别，仅接受 JPEG/PNG/GIF/WebP/AVIF。
+    保存后在后台进程中生成各宽度的缩略图，详见商品/评价接口中的 srcset 字段。
+    较大的文件建议使用 /upload/presign 直传到存储。
+    """
+    storage = get_storage()
     try:
-        # 保存文件
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-            
-        # 返回相对路径 (前端可访问的路径)
-        url = f"/uploads/{filename}"
-        
-        return success_response(
-            data={"url": url},
-            message="上传成功"
-        )
-    except Exception as e:
+        stored = await receive_image_upload(request, storage.staging_dir(), settings.UPLOAD_MAX_BYTES)
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except OSError as e:
         raise HTTPException(status_code=500, detail=f"上传失败: {str(e)}")
+
+    key = blob_relpath(stored.sha256, stored.ext)
+    try:
+        stored.deduplicated = await run_in_threadpool(storage.exists, key)
+        if stored.deduplicated:
+            os.remove(stored.path)
+        else:
+            await run_in_threadpool(storage.save, key, stored.path, stored.content_type)
+    except (OSError, StorageError) as e:
+        if os.path.exists(stored.path):
+            os.remove(stored.path)
+        raise HTTPException(status_code=500, detail=f"上传失败: {str(e)}")
+
+    register_blob(db, stored, current_user.id)
+    await _submit_variants(key)
+
+    return success_response(data=_upload_result(stored), message="上传成功")
+
+
+@router.post("/presign")
+async def presign_upload(
+    data: PresignRequest,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    申请直传 (登录用户)
+
+    客户端先在本地计算文件 sha256，再按返回的说明把文件直接发送给存储，
+    文件内容不经过 API。上传完成后调用 /upload/complete 登记。
+
+    - 内容已存在时返回 deduplicated=true 和 URL，无需上传
+    - 小文件: upload.mode = "single"，按 method/url/headers 发送整个文件
+    - 大文件（超过 UPLOAD_MULTIPART_THRESHOLD）: upload.mode = "multipart"，
+      按 part_size 切片后依次 PUT 到各分片 URL，记录响应头中的 ETag
+    """
+    key = _blob_key(data.sha256, data.content_type)
+    if data.size > settings.UPLOAD_MAX_BYTES:
+        raise HTTPException(
+            status_code=413,
+            detail=f"文件大小不能超过 {settings.UPLOAD_MAX_BYTES // (1024 * 1024)}MB"
+        )
+
+    if db.query(UploadBlob).filter(UploadBlob.sha256 == data.sha256).first() is not None:
+        return success_response(data={"deduplicated": True, "url": url_for_key(key), "upload": None})
+
+    storage = get_storage()
+    try:
+        if data.size <= settings.UPLOAD_MULTIPART_THRESHOLD:
+            upload = {"mode": "single", **storage.presign_put(key, data.content_type, data.sha256)}
+        else:
+            upload_id = await run_in_threadpool(storage.create_multipart, key, data.content_type)
+            part_count = (data.size + settings.UPLOAD_PART_SIZE - 1) // settings.UPLOAD_PART_SIZE
+            upload = {
+                "mode": "multipart",
+                "upload_id": upload_id,
+                "part_size": settings.UPLOAD_PART_SIZE,
+                "parts": [
+                    {"part_number": n, "method": "PUT", "url": storage.presign_part(key, upload_id, n)}
+                    for n in range(1, part_count + 1)
+                ],
+            }
+    except StorageError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+    return success_response(data={"deduplicated": False, "url": url_for_key(key), "upload": upload})
+
+
+def _verify_uploaded(key: str, sha256: str, multipart: bool) -> StoredUpload:
+    """检查直传完成的对象：大小、真实类型，分片上传时还要校验 sha256"""
+    storage = get_storage()
+    size = storage.size(key)
+    if size is None:
+        raise UploadError("文件尚未上传")
+    if size > settings.UPLOAD_MAX_BYTES:
+        storage.delete(key)
+        raise UploadError(f"文件大小不能超过 {settings.UPLOAD_MAX_BYTES // (1024 * 1024)}MB")
+
+    sniffed = sniff_image_type(storage.read_head(key, SNIFF_BYTES))
+    if sniffed is None or not key.endswith(sniffed[1]):
+        storage.delete(key)
+        raise UploadError("只能上传图片文件")
+
+    if multipart:
+        # 单次 PUT 由存储端按签名中的校验和验证；分片上传没有整体校验和，这里补做一次
+        hasher = hashlib.sha256()
+        for chunk in storage.iter_chunks(key):
+            hasher.update(chunk)
+        if hasher.hexdigest() != sha256:
+            storage.delete(key)
+            raise UploadError("文件内容与 sha256 不一致")
+
+    return StoredUpload(
+        filename=key, path=key, size=size, sha256=sha256,
+        content_type=sniffed[0], ext=sniffed[1],
+    )
+
+
+@router.post("/complete")
+async def complete_upload(
+    data: CompleteRequest,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    登记直传完成的文件 (登录用户)
+
+    分片上传需要带上 upload_id 和各分片的 ETag，服务端合并后校验内容。
+    """
+    key = _blob_key(data.sha256, data.content_type)
+    storage = get_storage()
+    multipart = data.upload_id is not None
+    try:
+        if multipart:
+            parts = [p.model_dump() for p in data.parts]
+            await run_in_threadpool(storage.complete_multipart, key, data.upload_id, parts)
+        stored = await run_in_threadpool(_verify_uploaded, key, data.sha256, multipart)
+    except StorageError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except UploadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    register_blob(db, stored, current_user.id)
+    await _submit_variants(key)
+
+    return success_response(data=_upload_result(stored), message="上传成功")
+
+
+@router.post("/abort")
+async def abort_upload(
+    data: AbortRequest,
+    current_user: User = Depends(get_current_user)
+):
+    """放弃未完成的分片上传 (登录用户)"""
+    key = _blob_key(data.sha256, data.content_type)
+    try:
+        await run_in_threadpool(get_storage().abort_multipart, key, data.upload_id)
+    except StorageError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return success_response(message="已取消上传")
+
+
+@router.put("/direct", include_in_schema=False)
+async def direct_upload(request: Request, token: str = Query(...)):
+    """
+    本地存储后端的直传目标（相当于对象存储的预签名 PUT）
+
+    由 /upload/presign 签发的 token 授权，不需要登录态；
+    整个文件上传时边写边校验 sha256，分片上传时响应头返回 ETag。
+    """
+    storage = get_storage()
+    if not isinstance(storage, LocalStorage):
+        raise HTTPException(status_code=404, detail="Not Found")
+    claims = verify_token(token, "upload")
+    if claims is None:
+        raise HTTPException(status_code=403, detail="上传链接无效或已过期")
+
+    is_part = claims.get("op") == "part"
+    try:
+        stored = await receive_raw_upload(
+            request,
+            storage.staging_dir(),
+            settings.UPLOAD_MAX_BYTES,
+            sniff=not is_part,
+        )
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+
+    if is_part:
+        path = storage.part_path(claims["upload_id"], claims["part_number"])
+        if not os.path.isdir(os.path.dirname(path)):
+            os.remove(stored.path)
+            raise HTTPException(status_code=404, detail="分片上传不存在或已取消")
+        os.replace(stored.path, path)
+        return Response(status_code=200, headers={"ETag": f'"{stored.sha256}"'})
+
+    if stored.sha256 != claims["sha256"] or stored.content_type != claims["content_type"]:
+        os.remove(stored.path)
+        raise HTTPException(status_code=400, detail="文件内容与 sha256 不一致")
+    await run_in_threadpool(storage.save, claims["key"], stored.path, stored.content_type)
+    return Response(status_code=200, headers={"ETag": f'"{stored.sha256}"'})
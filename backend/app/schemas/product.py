@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import Optional, List
+from typing import Dict, Optional, List
 from pydantic import BaseModel, Field
 from decimal import Decimal
 
@@ -71,6 +71,7 @@ class ProductListItem(BaseModel):
     price: Decimal
     original_price: Optional[Decimal] = None
     main_image_url: Optional[str] = None
+    main_image_srcset: Optional[Dict[str, str]] = None  # {格式: srcset}
     stock: int
     sales_count: int = 0
     is_published: bool = True
@@ -85,6 +86,7 @@ class ProductDetail(ProductListItem):
     """商品详情"""
     description: Optional[str] = None
     image_urls: Optional[List[str]] = None
+    image_srcsets: Optional[List[Optional[Dict[str, str]]]] = None
     params: List[ProductParam] = []
     view_count: int = 0
     created_at: datetime
@@ -139,6 +141,7 @@ class ProductUpdate(BaseModel):
     main_image_url: Optional[str] = None
     image_urls: Optional[List[str]] = None
     params: Optional[List[ProductParam]] = None
+    tag_ids: Optional[List[int]] = None  # 传入时按差异更新为该标签集合
     is_published: Optional[bool] = None
     is_top: Optional[bool] = None
     is_new: Optional[bool] = None
@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import Optional, List
+from typing import Dict, Optional, List
 from pydantic import BaseModel, Field
 
 
@@ -33,6 +33,7 @@ class ReviewResponse(BaseModel):
     rating: int
     content: str
     image_urls: Optional[List[str]] = None
+    image_srcsets: Optional[List[Optional[Dict[str, str]]]] = None
     like_count: int
     is_liked: bool = False
     created_at: datetime
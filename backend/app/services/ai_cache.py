@@ -0,0 +1,185 @@
+"""
+AI 助手回复缓存
+
+缓存键 = 归一化后的用户问题 + 检索上下文指纹（商品/订单上下文文本的 sha256）。
+- 默认只做精确匹配
+- 配置了 AI_CACHE_SIMILARITY_THRESHOLD 时，在同一上下文指纹下按向量余弦相似度兜底查找
+- 条目带 TTL，按 LRU 淘汰
+- 商品价格或库存变化时，按商品 ID 反向索引失效相关条目
+"""
+import hashlib
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+import numpy as np
+
+from ..config import settings
+from .embedding import Embedder, get_embedder
+
+_PUNCT_RE = re.compile(r"[\s\W_]+", re.UNICODE)
+
+
+def normalize_prompt(text: str) -> str:
+    """全角转半角、小写、去掉标点与空白"""
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    return _PUNCT_RE.sub("", text)
+
+
+def context_fingerprint(context: str) -> str:
+    return hashlib.sha256((context or "").encode("utf-8")).hexdigest()
+
+
+@dataclass
+class _Entry:
+    prompt: str
+    fingerprint: str
+    response: str
+    expires_at: float
+    product_ids: Set[int] = field(default_factory=set)
+    vector: Optional[np.ndarray] = None
+
+
+class ResponseCache:
+    """进程内回复缓存"""
+
+    def __init__(
+        self,
+        ttl: float,
+        max_entries: int,
+        similarity_threshold: float = 0.0,
+        embedder: Optional[Embedder] = None,
+    ):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.similarity_threshold = similarity_threshold
+        self._embedder = embedder
+        self._entries: "OrderedDict[Tuple[str, str], _Entry]" = OrderedDict()
+        self._by_fingerprint: Dict[str, Set[Tuple[str, str]]] = {}
+        self._by_product: Dict[int, Set[Tuple[str, str]]] = {}
+        self._lock = threading.Lock()
+        self.stats = {
+            "hits_exact": 0,
+            "hits_semantic": 0,
+            "misses": 0,
+            "evictions": 0,
+            "invalidations": 0,
+        }
+
+    @property
+    def embedder(self) -> Optional[Embedder]:
+        if self.similarity_threshold <= 0:
+            return None
+        if self._embedder is None:
+            self._embedder = get_embedder()
+        return self._embedder
+
+    def _remove(self, key: Tuple[str, str]):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        keys = self._by_fingerprint.get(entry.fingerprint)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_fingerprint[entry.fingerprint]
+        for pid in entry.product_ids:
+            keys = self._by_product.get(pid)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_product[pid]
+
+    def get(self, prompt: str, context: str) -> Optional[str]:
+        key = (normalize_prompt(prompt), context_fingerprint(context))
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry.expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.stats["hits_exact"] += 1
+                    return entry.response
+                self._remove(key)
+
+            embedder = self.embedder
+            candidates = list(self._by_fingerprint.get(key[1], ()))
+            if embedder is not None and candidates:
+                query = embedder.embed([prompt])[0]
+                best_key, best_score = None, self.similarity_threshold
+                for candidate in candidates:
+                    cand = self._entries[candidate]
+                    if cand.expires_at <= now:
+                        self._remove(candidate)
+                        continue
+                    score = float(np.dot(query, cand.vector))
+                    if score >= best_score:
+                        best_key, best_score = candidate, score
+                if best_key is not None:
+                    self._entries.move_to_end(best_key)
+                    self.stats["hits_semantic"] += 1
+                    return self._entries[best_key].response
+
+            self.stats["misses"] += 1
+            return None
+
+    def set(self, prompt: str, context: str, response: str, product_ids: Iterable[int] = ()):
+        key = (normalize_prompt(prompt), context_fingerprint(context))
+        embedder = self.embedder
+        entry = _Entry(
+            prompt=key[0],
+            fingerprint=key[1],
+            response=response,
+            expires_at=time.monotonic() + self.ttl,
+            product_ids=set(product_ids),
+            vector=embedder.embed([prompt])[0] if embedder is not None else None,
+        )
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = entry
+            self._by_fingerprint.setdefault(key[1], set()).add(key)
+            for pid in entry.product_ids:
+                self._by_product.setdefault(pid, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.stats["evictions"] += 1
+
+    def invalidate_products(self, product_ids: Iterable[int]):
+        """商品价格/库存变化后调用，删除引用了这些商品的条目"""
+        with self._lock:
+            for pid in product_ids:
+                for key in list(self._by_product.get(pid, ())):
+                    self._remove(key)
+                    self.stats["invalidations"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_fingerprint.clear()
+            self._by_product.clear()
+
+    def snapshot(self) -> dict:
+        hits = self.stats["hits_exact"] + self.stats["hits_semantic"]
+        lookups = hits + self.stats["misses"]
+        return {
+            **self.stats,
+            "size": len(self._entries),
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+response_cache = ResponseCache(
+    ttl=settings.AI_CACHE_TTL_SECONDS,
+    max_entries=settings.AI_CACHE_MAX_ENTRIES,
+    similarity_threshold=settings.AI_CACHE_SIMILARITY_THRESHOLD,
+)
+
+
+def invalidate_products(product_ids: Iterable[int]):
+    """供商品/订单路由在价格、库存变化后调用"""
+    response_cache.invalidate_products(product_ids)
@@ -0,0 +1,264 @@
+"""
+AI 上游 HTTP 客户端
+
+在应用生命周期内共享一个 httpx.AsyncClient：
+- 连接池 + keep-alive，可用时启用 HTTP/2
+- 分阶段超时（connect / read / write / pool）
+- 429 / 5xx / 网络错误时带抖动的指数退避重试
+- 熔断器：连续失败达到阈值后快速失败，冷却后半开试探
+- 记录延迟与错误计数，供 /v1/ai/metrics 查询
+"""
+import asyncio
+import importlib.util
+import logging
+import random
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+
+import httpx
+
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class AIUpstreamError(Exception):
+    """上游调用失败（重试耗尽或不可重试的错误）"""
+
+
+class CircuitOpenError(AIUpstreamError):
+    """熔断器处于打开状态，直接拒绝请求"""
+
+
+class CircuitBreaker:
+    """
+    简单的三态熔断器
+
+    closed -> 连续失败 failure_threshold 次 -> open
+    open -> 经过 reset_timeout 秒 -> half_open（只放行一个试探请求）
+    half_open -> 成功则 closed，失败则重新 open
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+
+    def allow_request(self) -> bool:
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            self.state = self.HALF_OPEN
+            self._probe_in_flight = False
+        # half_open: 同一时间只放行一个试探请求
+        if self._probe_in_flight:
+            return False
+        self._probe_in_flight = True
+        return True
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._probe_in_flight = False
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+
+class UpstreamMetrics:
+    """上游调用指标（进程内）"""
+
+    def __init__(self, window: int = 500):
+        self.requests = 0
+        self.successes = 0
+        self.failures = 0
+        self.retries = 0
+        self.rejected = 0  # 熔断拒绝次数
+        self.status_codes: Dict[str, int] = {}
+        self._latencies: Deque[float] = deque(maxlen=window)
+
+    def observe(self, latency: float, status_code: Optional[int] = None):
+        self._latencies.append(latency)
+        key = str(status_code) if status_code is not None else "error"
+        self.status_codes[key] = self.status_codes.get(key, 0) + 1
+
+    def snapshot(self) -> dict:
+        latencies = sorted(self._latencies)
+
+        def percentile(p: float) -> Optional[float]:
+            if not latencies:
+                return None
+            idx = min(len(latencies) - 1, int(round(p * (len(latencies) - 1))))
+            return round(latencies[idx] * 1000, 1)
+
+        return {
+            "requests": self.requests,
+            "successes": self.successes,
+            "failures": self.failures,
+            "retries": self.retries,
+            "rejected": self.rejected,
+            "status_codes": dict(self.status_codes),
+            "latency_ms": {
+                "p50": percentile(0.5),
+                "p95": percentile(0.95),
+                "p99": percentile(0.99),
+            },
+        }
+
+
+class AIUpstreamClient:
+    """对 SiliconFlow（OpenAI 兼容）接口的共享异步客户端"""
+
+    def __init__(
+        self,
+        base_url: Optional[str] = None,
+        api_key: Optional[str] = None,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self.url = base_url or settings.SILICONFLOW_API_URL
+        self.api_key = api_key if api_key is not None else settings.SILICONFLOW_API_KEY
+        self.max_retries = settings.AI_HTTP_MAX_RETRIES
+        self.breaker = CircuitBreaker(
+            settings.AI_CIRCUIT_FAILURE_THRESHOLD,
+            settings.AI_CIRCUIT_RESET_TIMEOUT,
+        )
+        self.metrics = UpstreamMetrics()
+
+        # HTTP/2 依赖 h2 包，未安装时退回 HTTP/1.1
+        http2 = settings.AI_HTTP2_ENABLED and importlib.util.find_spec("h2") is not None
+        self._client = httpx.AsyncClient(
+            http2=http2,
+            transport=transport,
+            timeout=httpx.Timeout(
+                connect=settings.AI_HTTP_CONNECT_TIMEOUT,
+                read=settings.AI_HTTP_READ_TIMEOUT,
+                write=settings.AI_HTTP_WRITE_TIMEOUT,
+                pool=settings.AI_HTTP_POOL_TIMEOUT,
+            ),
+            limits=httpx.Limits(
+                max_connections=settings.AI_HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.AI_HTTP_MAX_KEEPALIVE,
+                keepalive_expiry=settings.AI_HTTP_KEEPALIVE_EXPIRY,
+            ),
+        )
+
+    def _backoff(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        """计算第 attempt 次重试前的等待时间（full jitter），优先遵守 Retry-After"""
+        if retry_after:
+            try:
+                return min(float(retry_after), settings.AI_HTTP_RETRY_BACKOFF_MAX)
+            except ValueError:
+                pass
+        cap = min(settings.AI_HTTP_RETRY_BACKOFF_MAX, settings.AI_HTTP_RETRY_BACKOFF * (2 ** attempt))
+        return random.uniform(0, cap)
+
+    async def chat_completion(self, payload: dict) -> dict:
+        """
+        调用 chat/completions 接口
+
+        Raises:
+            CircuitOpenError: 熔断器打开
+            AIUpstreamError: 重试耗尽或响应不可用
+        """
+        if not self.breaker.allow_request():
+            self.metrics.rejected += 1
+            raise CircuitOpenError("AI 上游服务暂时不可用（熔断中）")
+
+        headers = {"Authorization": f"Bearer {self.api_key}"}
+        last_error: Optional[str] = None
+
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self.metrics.retries += 1
+            self.metrics.requests += 1
+            started = time.perf_counter()
+            retry_after = None
+            try:
+                response = await self._client.post(self.url, json=payload, headers=headers)
+            except httpx.TimeoutException as e:
+                self.metrics.observe(time.perf_counter() - started)
+                last_error = f"timeout: {e.__class__.__name__}"
+            except httpx.TransportError as e:
+                self.metrics.observe(time.perf_counter() - started)
+                last_error = f"transport: {e.__class__.__name__}"
+            else:
+                self.metrics.observe(time.perf_counter() - started, response.status_code)
+                if response.status_code < 400:
+                    try:
+                        result = response.json()
+                    except ValueError:
+                        self.metrics.failures += 1
+                        self.breaker.record_failure()
+                        raise AIUpstreamError("上游返回了无效的 JSON")
+                    self.metrics.successes += 1
+                    self.breaker.record_success()
+                    return result
+                last_error = f"status {response.status_code}"
+                if response.status_code not in RETRYABLE_STATUS_CODES:
+                    # 4xx（除 429）是请求本身的问题，不计入熔断
+                    self.metrics.failures += 1
+                    self.breaker.record_success()
+                    raise AIUpstreamError(f"上游拒绝请求: {last_error}")
+                retry_after = response.headers.get("Retry-After")
+
+            if attempt < self.max_retries:
+                await asyncio.sleep(self._backoff(attempt, retry_after))
+
+        self.metrics.failures += 1
+        self.breaker.record_failure()
+        logger.warning("AI upstream failed after %d attempts: %s", self.max_retries + 1, last_error)
+        raise AIUpstreamError(f"上游调用失败: {last_error}")
+
+    def snapshot(self) -> dict:
+        data = self.metrics.snapshot()
+        data["circuit"] = {
+            "state": self.breaker.state,
+            "consecutive_failures": self.breaker.failures,
+        }
+        return data
+
+    async def aclose(self):
+        await self._client.aclose()
+
+
+# 由 main.lifespan 创建与关闭
+_client: Optional[AIUpstreamClient] = None
+
+
+async def init_ai_client(**kwargs: Any) -> AIUpstreamClient:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+    _client = AIUpstreamClient(**kwargs)
+    return _client
+
+
+async def close_ai_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def get_ai_client() -> AIUpstreamClient:
+    """获取共享客户端；未经 lifespan 初始化时（脚本等场景）惰性创建"""
+    global _client
+    if _client is None:
+        _client = AIUpstreamClient()
+    return _client
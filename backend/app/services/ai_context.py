@@ -0,0 +1,120 @@
+"""
+AI 对话上下文构建
+
+- 只通过 (session_id, id) 索引读取会话尾部有限条消息，不再加载整段历史
+- 用本地启发式估算 token：中日韩字符按 1 个 token，其余按约 4 个字符 1 个 token
+- 在 AI_CONTEXT_TOKEN_BUDGET 内放入 system 提示（含商品/订单上下文）、滚动摘要和最近的消息
+- 放不下的旧消息折叠进 AIChatSession.summary，summary_until_id 记录已折叠到的消息 ID
+"""
+import math
+import re
+from typing import List
+
+from sqlalchemy.orm import Session
+
+from ..config import settings
+from ..models import AIChatSession, AIChatMessage
+
+_CJK_RE = re.compile(r"[　-〿一-鿿가-힯＀-￯]")
+
+# 每条消息的角色、分隔符等固定开销
+MESSAGE_OVERHEAD_TOKENS = 4
+SUMMARY_SNIPPET_CHARS = 80
+
+
+def estimate_tokens(text: str) -> int:
+    """快速估算文本 token 数"""
+    if not text:
+        return 0
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+
+def message_tokens(message: dict) -> int:
+    return estimate_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS
+
+
+class ConversationContextBuilder:
+    """按 token 预算组装发送给模型的消息列表"""
+
+    def __init__(
+        self,
+        db: Session,
+        token_budget: int = None,
+        max_messages: int = None,
+        summary_budget: int = None,
+    ):
+        self.db = db
+        self.token_budget = token_budget or settings.AI_CONTEXT_TOKEN_BUDGET
+        self.max_messages = max_messages or settings.AI_HISTORY_MAX_MESSAGES
+        self.summary_budget = summary_budget or settings.AI_SUMMARY_TOKEN_BUDGET
+
+    def load_history(self, session: AIChatSession) -> List[AIChatMessage]:
+        """读取尚未折叠进摘要的最近 max_messages 条消息（按时间正序）"""
+        tail = self.db.query(AIChatMessage).filter(
+            AIChatMessage.session_id == session.id,
+            AIChatMessage.id > (session.summary_until_id or 0)
+        ).order_by(AIChatMessage.id.desc()).limit(self.max_messages).all()
+        tail.reverse()
+        return tail
+
+    def build(
+        self,
+        session: AIChatSession,
+        system_prompt: str,
+        history: List[AIChatMessage],
+    ) -> List[dict]:
+        """
+        组装消息列表，并把放不下的旧消息折叠进会话摘要
+
+        最新一条消息（当前问题）总是保留。会修改 session.summary / summary_until_id，
+        由调用方负责提交。
+        """
+        messages = [{"role": m.role, "content": m.content} for m in history]
+        system = {"role": "system", "content": system_prompt}
+        # 为摘要预留固定额度（本轮折叠后摘要可能变长）
+        used = message_tokens(system) + self.summary_budget + MESSAGE_OVERHEAD_TOKENS
+
+        # 从新到旧放入历史，直到超出预算
+        keep_from = len(messages)
+        for i in range(len(messages) - 1, -1, -1):
+            cost = message_tokens(messages[i])
+            if used + cost > self.token_budget and i < len(messages) - 1:
+                break
+            used += cost
+            keep_from = i
+
+        # 尾部已覆盖到上次摘要位置且全部放得下时，没有需要折叠的消息
+        if history and (keep_from > 0 or len(history) >= self.max_messages):
+            self._fold(session, history[keep_from].id)
+
+        payload = [system]
+        if session.summary:
+            payload.append({"role": "system", "content": f"此前对话摘要:\n{session.summary}"})
+        payload.extend(messages[keep_from:])
+        return payload
+
+    def _fold(self, session: AIChatSession, oldest_kept_id: int):
+        """把 summary_until_id 与 oldest_kept_id 之间的消息追加进摘要"""
+        folded = self.db.query(AIChatMessage).filter(
+            AIChatMessage.session_id == session.id,
+            AIChatMessage.id > (session.summary_until_id or 0),
+            AIChatMessage.id < oldest_kept_id
+        ).order_by(AIChatMessage.id.asc()).limit(self.max_messages).all()
+        if not folded:
+            return
+
+        lines = session.summary.split("\n") if session.summary else []
+        for m in folded:
+            speaker = "用户" if m.role == "user" else "助手"
+            snippet = " ".join(m.content.split())
+            if len(snippet) > SUMMARY_SNIPPET_CHARS:
+                snippet = snippet[:SUMMARY_SNIPPET_CHARS] + "…"
+            lines.append(f"{speaker}: {snippet}")
+
+        # 摘要本身也有预算，超出时丢弃最早的条目
+        while len(lines) > 1 and estimate_tokens("\n".join(lines)) > self.summary_budget:
+            lines.pop(0)
+
+        session.summary = "\n".join(lines)
+        session.summary_until_id = folded[-1].id
@@ -0,0 +1,288 @@
+"""
+AI 回复后台任务队列
+
+- /ai/chat 只写入用户消息和任务记录，立即返回任务 ID
+- 固定数量的 worker 协程并发处理，按用户轮转取任务，避免单个用户占满 worker
+- 数据库会话只在读取上下文、写回结果两个阶段短暂持有（在线程池中执行），
+  调用上游期间不占用连接
+- 任务持久化在 ai_chat_jobs 表，进程重启后未完成的任务会重新入队
+- 支持长轮询等待结果，以及可选的完成回调（callback_url）
+"""
+import asyncio
+import logging
+from collections import deque
+from datetime import datetime
+from typing import Deque, Dict, List, Optional
+
+import httpx
+from starlette.concurrency import run_in_threadpool
+
+from ..config import settings
+from ..database import SessionLocal
+from ..models import AIChatJob, AIChatMessage, AIChatSession
+from .ai_service import AIService, PreparedChat
+
+logger = logging.getLogger(__name__)
+
+FINISHED_STATUSES = ("succeeded", "failed")
+
+
+class QueueFullError(Exception):
+    """该用户排队中的任务已达上限"""
+
+
+def job_to_dict(job: AIChatJob, message: Optional[AIChatMessage] = None) -> dict:
+    data = {
+        "job_id": job.id,
+        "status": job.status,
+        "error": job.error,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+        "message": None,
+    }
+    if message is not None:
+        data["message"] = {
+            "id": message.id,
+            "role": message.role,
+            "content": message.content,
+            "created_at": message.created_at.isoformat(),
+        }
+    return data
+
+
+class AIJobQueue:
+    """进程内公平调度的异步任务队列"""
+
+    def __init__(self, concurrency: int, max_pending_per_user: int):
+        self.concurrency = concurrency
+        self.max_pending_per_user = max_pending_per_user
+        self._pending: Dict[int, Deque[str]] = {}
+        self._reserved: Dict[int, int] = {}  # 已预留、尚未提交的名额
+        self._rotation: Deque[int] = deque()  # 有待处理任务的用户，轮转顺序
+        self._available: Optional[asyncio.Semaphore] = None
+        self._done: Dict[str, asyncio.Event] = {}
+        self._workers: List[asyncio.Task] = []
+
+    # ---------- 生命周期 ----------
+
+    async def start(self):
+        self._available = asyncio.Semaphore(0)
+        for job_id, user_id in await run_in_threadpool(self._recover):
+            self._enqueue(job_id, user_id)
+        self._workers = [
+            asyncio.create_task(self._worker(), name=f"ai-job-worker-{i}")
+            for i in range(self.concurrency)
+        ]
+
+    async def stop(self):
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    @staticmethod
+    def _recover() -> List[tuple]:
+        """把上次进程退出时未完成的任务重新排队"""
+        db = SessionLocal()
+        try:
+            jobs = db.query(AIChatJob).filter(
+                AIChatJob.status.in_(["queued", "running"])
+            ).order_by(AIChatJob.created_at.asc()).all()
+            for job in jobs:
+                job.status = "queued"
+                job.started_at = None
+            db.commit()
+            return [(job.id, job.user_id) for job in jobs]
+        finally:
+            db.close()
+
+    # ---------- 入队 / 等待 ----------
+
+    def pending_count(self, user_id: int) -> int:
+        return len(self._pending.get(user_id, ())) + self._reserved.get(user_id, 0)
+
+    def check_capacity(self, user_id: int):
+        if self.pending_count(user_id) >= self.max_pending_per_user:
+            raise QueueFullError("请求过于频繁，请等待上一条回复完成")
+
+    def reserve(self, user_id: int):
+        """
+        预留一个排队名额，名额已满时抛出 QueueFullError
+
+        在写入任务记录（await）之前同步调用，同一用户的并发请求不会都通过检查；
+        之后必须调用 submit 或 release。
+        """
+        self.check_capacity(user_id)
+        self._reserved[user_id] = self._reserved.get(user_id, 0) + 1
+
+    def release(self, user_id: int):
+        """归还未使用的预留名额（写入任务记录失败时）"""
+        count = self._reserved.get(user_id, 0) - 1
+        if count > 0:
+            self._reserved[user_id] = count
+        else:
+            self._reserved.pop(user_id, None)
+
+    def submit(self, job_id: str, user_id: int):
+        """任务记录提交到数据库之后调用，使用 reserve 预留的名额"""
+        self.release(user_id)
+        self._enqueue(job_id, user_id)
+
+    def _enqueue(self, job_id: str, user_id: int):
+        queue = self._pending.setdefault(user_id, deque())
+        if not queue:
+            self._rotation.append(user_id)
+        queue.append(job_id)
+        self._done.setdefault(job_id, asyncio.Event())
+        self._available.release()
+
+    async def wait(self, job_id: str, timeout: float) -> bool:
+        """
+        等待任务完成，返回是否已完成
+
+        任务不在本进程队列中（多 worker 部署时由其他进程处理）时，
+        每 AI_JOB_POLL_SECONDS 查一次库，而不是立即返回让客户端忙轮询。
+        """
+        event = self._done.get(job_id)
+        if event is None:
+            return await self._poll(job_id, timeout)
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    @staticmethod
+    async def _poll(job_id: str, timeout: float) -> bool:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return False
+            await asyncio.sleep(min(settings.AI_JOB_POLL_SECONDS, remaining))
+            job = await run_in_threadpool(load_job, job_id)
+            if job is None or job["status"] in FINISHED_STATUSES:
+                return True
+
+    def _next(self) -> tuple:
+        user_id = self._rotation.popleft()
+        queue = self._pending[user_id]
+        job_id = queue.popleft()
+        if queue:
+            self._rotation.append(user_id)
+        else:
+            del self._pending[user_id]
+        return job_id, user_id
+
+    # ---------- 执行 ----------
+
+    async def _worker(self):
+        while True:
+            await self._available.acquire()
+            job_id, _ = self._next()
+            try:
+                await self._run(job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.exception("AI job %s crashed", job_id)
+                await run_in_threadpool(self._finish, job_id, None, f"内部错误: {e}")
+            finally:
+                event = self._done.pop(job_id, None)
+                if event is not None:
+                    event.set()
+
+    async def _run(self, job_id: str):
+        prepared = await run_in_threadpool(self._prepare, job_id)
+        if prepared is None:
+            return
+        reply = await AIService.complete(prepared)
+        callback_url = await run_in_threadpool(self._finish, job_id, reply, None)
+        if callback_url:
+            await self._callback(job_id, callback_url)
+
+    @staticmethod
+    def _prepare(job_id: str) -> Optional[PreparedChat]:
+        """阶段一：读取会话上下文，生成上游请求"""
+        db = SessionLocal()
+        try:
+            job = db.query(AIChatJob).filter(AIChatJob.id == job_id).first()
+            if job is None or job.status in FINISHED_STATUSES:
+                return None
+            session = db.query(AIChatSession).filter(AIChatSession.id == job.session_id).first()
+            if session is None:
+                job.status = "failed"
+                job.error = "Session not found"
+                job.finished_at = datetime.now()
+                db.commit()
+                return None
+            job.status = "running"
+            job.started_at = datetime.now()
+            prepared = AIService(db).prepare(job.user_id, session)
+            db.commit()
+            return prepared
+        finally:
+            db.close()
+
+    @staticmethod
+    def _finish(job_id: str, reply: Optional[str], error: Optional[str]) -> Optional[str]:
+        """阶段二：写回助手消息与任务状态，返回需要回调的 URL"""
+        db = SessionLocal()
+        try:
+            job = db.query(AIChatJob).filter(AIChatJob.id == job_id).first()
+            if job is None:
+                return None
+            now = datetime.now()
+            if reply is not None:
+                ai_msg = AIChatMessage(session_id=job.session_id, role="assistant", content=reply)
+                db.add(ai_msg)
+                db.flush()
+                job.result_message_id = ai_msg.id
+                job.status = "succeeded"
+                db.query(AIChatSession).filter(AIChatSession.id == job.session_id).update(
+                    {"last_active_at": now}, synchronize_session=False
+                )
+            else:
+                job.status = "failed"
+                job.error = error
+            job.finished_at = now
+            db.commit()
+            return job.callback_url if settings.AI_JOB_CALLBACKS_ENABLED else None
+        finally:
+            db.close()
+
+    async def _callback(self, job_id: str, url: str):
+        """完成回调（尽力而为，失败只记录日志）"""
+        data = await run_in_threadpool(load_job, job_id)
+        if data is None:
+            return
+        try:
+            async with httpx.AsyncClient(timeout=5.0) as client:
+                await client.post(url, json=data)
+        except httpx.HTTPError as e:
+            logger.warning("AI job %s callback failed: %s", job_id, e)
+
+
+def load_job(job_id: str, user_id: Optional[int] = None) -> Optional[dict]:
+    """读取任务及其结果消息；user_id 不为空时校验归属"""
+    db = SessionLocal()
+    try:
+        query = db.query(AIChatJob).filter(AIChatJob.id == job_id)
+        if user_id is not None:
+            query = query.filter(AIChatJob.user_id == user_id)
+        job = query.first()
+        if job is None:
+            return None
+        message = None
+        if job.result_message_id:
+            message = db.query(AIChatMessage).filter(AIChatMessage.id == job.result_message_id).first()
+        return job_to_dict(job, message)
+    finally:
+        db.close()
+
+
+job_queue = AIJobQueue(
+    concurrency=settings.AI_JOB_CONCURRENCY,
+    max_pending_per_user=settings.AI_JOB_MAX_PENDING_PER_USER,
+)
@@ -1,14 +1,16 @@
-import os
-import requests
-import json
+import logging
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
 from sqlalchemy.orm import Session
 from sqlalchemy import or_
-from ..models import Product, Order, OrderItem
+from ..models import Product, Order, OrderItem, AIChatSession
 from ..config import settings
+from .ai_client import get_ai_client, AIUpstreamError, CircuitOpenError
+from .ai_cache import response_cache
+from .product_index import get_product_index
+from .ai_context import ConversationContextBuilder
 
-# SiliconFlow API Configuration
-SILICONFLOW_API_URL = "https://api.siliconflow.cn/v1/chat/completions"
-MODEL_NAME = "deepseek-ai/DeepSeek-R1-0528-Qwen3-8B"
+logger = logging.getLogger(__name__)
 
 class AIService:
     def __init__(self, db: Session):
@@ -16,33 +18,43 @@ class AIService:
         self.api_key = settings.SILICONFLOW_API_KEY
 
     def _get_product_context(self, query: str):
-        # Simple keyword extraction (naive)
-        keywords = query.split()
-        relevant_products = []
-        
-        # Search capabilities
-        if not keywords:
-            return ""
-
-        # Construct a search query
-        # We look for products where name or description contains any of the keywords
-        # Limit to top 5 to avoid context overflow
-        db_query = self.db.query(Product).filter(
-            or_(*[Product.name.ilike(f"%{kw}%") for kw in keywords])
-        ).limit(5)
-        
-        products = db_query.all()
+        """Returns (context text, referenced product ids)"""
+        products = self._retrieve_products(query)
         
         if not products:
-            return ""
+            return "", []
 
         context_lines = ["找到相关商品:"]
         for p in products:
             context_lines.append(
                 f"- ID: {p.id}, 名称: {p.name}, 价格: ¥{p.price}, 库存: {p.stock}, "
-                f"描述: {p.short_description or p.description[:50]}..."
+                f"描述: {p.short_description or (p.description or '')[:50]}..."
             )
-        return "\n".join(context_lines)
+        return "\n".join(context_lines), [p.id for p in products]
+
+    def _retrieve_products(self, query: str):
+        # Vector retrieval first: works for Chinese queries without word boundaries
+        index = get_product_index()
+        if len(index):
+            hits = index.search(query, settings.AI_RETRIEVAL_TOP_K, settings.AI_RETRIEVAL_MIN_SCORE)
+            if not hits:
+                return []
+            by_id = {
+                p.id: p for p in self.db.query(Product).filter(
+                    Product.id.in_([pid for pid, _ in hits])
+                ).all()
+            }
+            return [by_id[pid] for pid, _ in hits if pid in by_id]
+
+        # Fallback when the index is empty: naive keyword match
+        keywords = query.split()
+        if not keywords:
+            return []
+
+        # Limit to top 5 to avoid context overflow
+        return self.db.query(Product).filter(
+            or_(*[Product.name.ilike(f"%{kw}%") for kw in keywords])
+        ).limit(settings.AI_RETRIEVAL_TOP_K).all()
 
     def _get_order_context(self, user_id: int, query: str):
         if not user_id:
@@ -69,16 +81,39 @@ class AIService:
             )
         return "\n".join(context_lines)
 
-    def generate_response(self, user_id: int, messages: list):
+    def prepare(self, user_id: int, session: AIChatSession) -> "PreparedChat":
+        """
+        DB phase: load history, build context and the upstream payload.
+
+        May update the session's rolling summary; the caller commits.
+        Returns a PreparedChat whose `reply` is already set when no upstream
+        call is needed (cache hit / missing API key).
+        """
         if not self.api_key:
-            return "错误: 系统AI API Key未配置，请联系管理员。"
+            return PreparedChat(reply="错误: 系统AI API Key未配置，请联系管理员。")
+
+        # Bounded tail of the conversation (not yet folded into the summary)
+        builder = ConversationContextBuilder(self.db)
+        history = builder.load_history(session)
+        messages = [{"role": m.role, "content": m.content} for m in history]
 
         # Get the latest user message
         last_message = messages[-1]['content'] if messages else ""
         
         # Build Context
-        product_context = self._get_product_context(last_message)
+        product_context, product_ids = self._get_product_context(last_message)
         order_context = self._get_order_context(user_id, last_message)
+
+        # Only standalone questions (first turn of a session) are cacheable;
+        # follow-ups depend on the conversation and must go to the model.
+        # The order context is user specific, so it is part of the fingerprint.
+        prepared = PreparedChat()
+        if settings.AI_CACHE_ENABLED and len(messages) == 1 and not session.summary:
+            prepared.cache_entry = (last_message, f"{product_context}\n{order_context}", product_ids)
+            cached = response_cache.get(*prepared.cache_entry[:2])
+            if cached is not None:
+                prepared.reply = cached
+                return prepared
         
         system_context = (
             "你是素居家具店的智能助手，一位乐于助人的AI。 "
@@ -93,29 +128,44 @@ class AIService:
             f"{order_context}\n"
         )
 
-        # Prepare payload
-        payload_messages = [{"role": "system", "content": system_context}]
-        # Add history (limit to last 10 to save tokens)
-        payload_messages.extend(messages[-10:]) 
-
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json"
-        }
-        
-        data = {
-            "model": MODEL_NAME,
-            "messages": payload_messages,
+        # Prepare payload: system prompt + rolling summary + as much history as fits the token budget
+        prepared.payload = {
+            "model": settings.AI_MODEL_NAME,
+            "messages": builder.build(session, system_context, history),
             "stream": False,
             "temperature": 0.7
         }
+        return prepared
+
+    @staticmethod
+    async def complete(prepared: "PreparedChat") -> str:
+        """Upstream phase: no DB access, safe to run without a session."""
+        if prepared.reply is not None:
+            return prepared.reply
 
         try:
-            response = requests.post(SILICONFLOW_API_URL, headers=headers, json=data, timeout=60)
-            response.raise_for_status()
-            result = response.json()
+            result = await get_ai_client().chat_completion(prepared.payload)
             ai_content = result['choices'][0]['message']['content']
-            return ai_content
-        except Exception as e:
-            print(f"AI API Error: {e}")
+        except CircuitOpenError:
+            return "抱歉，AI 助手当前繁忙，请稍后再试。"
+        except AIUpstreamError as e:
+            logger.warning("AI API Error: %s", e)
             return "抱歉，目前由于网络问题无法连接此服务，请稍后再试。"
+        except (KeyError, IndexError, TypeError) as e:
+            logger.warning("AI API returned unexpected payload: %r", e)
+            return "抱歉，目前由于网络问题无法连接此服务，请稍后再试。"
+
+        if prepared.cache_entry is not None:
+            response_cache.set(*prepared.cache_entry[:2], ai_content, prepared.cache_entry[2])
+        return ai_content
+
+    async def generate_response(self, user_id: int, session: AIChatSession) -> str:
+        return await self.complete(self.prepare(user_id, session))
+
+
+@dataclass
+class PreparedChat:
+    reply: Optional[str] = None
+    payload: Optional[dict] = None
+    # (prompt, context, product ids) when the answer may be cached
+    cache_entry: Optional[Tuple[str, str, List[int]]] = None
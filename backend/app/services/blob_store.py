@@ -0,0 +1,174 @@
+"""
+内容寻址的图片存储
+
+- 文件按 sha256 分片存放：cas/ab/cd/<sha256>.<ext>，相同内容只存一份
+- URL 由内容决定、永不改变，可以配合 Cache-Control: immutable 长期缓存
+- upload_blobs.ref_count 记录被 Product.main_image_url / image_urls
+  与 ProductReview.image_urls 引用的次数，写入这些字段时增量维护
+- 垃圾回收先全量重算引用数（修正漂移），再删除超过宽限期仍无引用的文件
+"""
+import json
+import logging
+import re
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from ..models import Product, ProductReview, UploadBlob
+from .uploads import StoredUpload
+from .storage import URL_PREFIX, get_storage
+from .image_variants import image_variants, variant_keys
+
+logger = logging.getLogger(__name__)
+
+CAS_DIR = "cas"
+
+_CAS_URL_RE = re.compile(r"/uploads/cas/[0-9a-f]{2}/[0-9a-f]{2}/([0-9a-f]{64})\.[a-z0-9]+$")
+
+
+def blob_relpath(sha256: str, ext: str) -> str:
+    """存储 key（相对上传根目录的分片路径）"""
+    return f"{CAS_DIR}/{sha256[:2]}/{sha256[2:4]}/{sha256}{ext}"
+
+
+def blob_url(sha256: str, ext: str) -> str:
+    return URL_PREFIX + blob_relpath(sha256, ext)
+
+
+def blob_key_from_url(url: Optional[str]) -> Optional[str]:
+    """从图片 URL 中取出 sha256；不是内容寻址的 URL（旧文件、外链）返回 None"""
+    if not url:
+        return None
+    match = _CAS_URL_RE.search(url)
+    return match.group(1) if match else None
+
+
+def parse_url_list(value: Optional[str]) -> List[str]:
+    """image_urls 字段以 JSON 数组存储"""
+    if not value:
+        return []
+    try:
+        urls = json.loads(value)
+    except (TypeError, ValueError):
+        return []
+    return [u for u in urls if isinstance(u, str)] if isinstance(urls, list) else []
+
+
+def product_image_urls(product: Product) -> List[str]:
+    urls = parse_url_list(product.image_urls)
+    if product.main_image_url:
+        urls.append(product.main_image_url)
+    return urls
+
+
+def review_image_urls(review: ProductReview) -> List[str]:
+    return parse_url_list(review.image_urls)
+
+
+def register_blob(db: Session, stored: StoredUpload, uploader_id: Optional[int]) -> UploadBlob:
+    """
+    上传完成后登记文件；已存在（去重命中）时返回已有记录
+
+    去重命中时刷新 created_at：重新上传一个早已无人引用的文件后，表单提交前
+    它同样需要完整的 GC 宽限期，否则可能在引用写入前被删除。
+    """
+    blob = db.query(UploadBlob).filter(UploadBlob.sha256 == stored.sha256).first()
+    if blob is not None:
+        blob.created_at = datetime.now()
+        db.commit()
+        return blob
+    blob = UploadBlob(
+        sha256=stored.sha256,
+        ext=stored.ext,
+        size=stored.size,
+        content_type=stored.content_type,
+        ref_count=0,
+        uploader_id=uploader_id,
+    )
+    db.add(blob)
+    try:
+        db.commit()
+    except IntegrityError:
+        # 并发上传了同一内容
+        db.rollback()
+        blob = db.query(UploadBlob).filter(UploadBlob.sha256 == stored.sha256).first()
+    return blob
+
+
+def adjust_blob_refs(db: Session, old_urls: Iterable[str], new_urls: Iterable[str]):
+    """
+    按新旧 URL 列表的差异增减引用计数
+
+    只生成 UPDATE 语句，由调用方随业务数据一起提交。
+    """
+    delta: Counter = Counter()
+    for url in new_urls:
+        key = blob_key_from_url(url)
+        if key:
+            delta[key] += 1
+    for url in old_urls:
+        key = blob_key_from_url(url)
+        if key:
+            delta[key] -= 1
+    for key, change in delta.items():
+        if change:
+            db.query(UploadBlob).filter(UploadBlob.sha256 == key).update(
+                {UploadBlob.ref_count: UploadBlob.ref_count + change},
+                synchronize_session=False
+            )
+
+
+def recount_blob_refs(db: Session) -> Dict[str, int]:
+    """全量扫描商品与评价图片，重算所有文件的引用数"""
+    counts: Counter = Counter()
+    rows = db.query(Product.main_image_url, Product.image_urls).yield_per(1000)
+    for main_image_url, image_urls in rows:
+        for url in parse_url_list(image_urls) + [main_image_url]:
+            key = blob_key_from_url(url)
+            if key:
+                counts[key] += 1
+    for (image_urls,) in db.query(ProductReview.image_urls).yield_per(1000):
+        for url in parse_url_list(image_urls):
+            key = blob_key_from_url(url)
+            if key:
+                counts[key] += 1
+
+    for blob in db.query(UploadBlob).all():
+        actual = counts.get(blob.sha256, 0)
+        if blob.ref_count != actual:
+            blob.ref_count = actual
+    db.commit()
+    return dict(counts)
+
+
+def collect_garbage(db: Session, grace: timedelta, dry_run: bool = False) -> List[str]:
+    """
+    删除没有任何引用、且上传时间早于宽限期的文件
+
+    宽限期用于保护刚上传、表单还没提交的图片，原图的缩略图与 manifest 一并删除。
+    返回被删除（或将被删除）的 key。
+    """
+    recount_blob_refs(db)
+    cutoff = datetime.now() - grace
+    orphans = db.query(UploadBlob).filter(
+        UploadBlob.ref_count <= 0,
+        UploadBlob.created_at < cutoff
+    ).all()
+
+    storage = get_storage()
+    removed = []
+    for blob in orphans:
+        key = blob_relpath(blob.sha256, blob.ext)
+        removed.append(key)
+        if dry_run:
+            continue
+        for k in variant_keys(key) + [key]:
+            storage.delete(k)
+        image_variants.forget(key)
+        db.delete(blob)
+    if not dry_run:
+        db.commit()
+    return removed
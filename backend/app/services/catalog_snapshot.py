@@ -0,0 +1,218 @@
+"""
+商品列表的内存列式快照（可选，CATALOG_SNAPSHOT_ENABLED 开启）
+
+商品量很大时，列表页的筛选 + 排序 + OFFSET 分页在 SQL 中代价较高。
+开启后在内存中按列保存商品的筛选/排序字段：
+- price / category_id / created_at / sales_count / popularity_score / is_top / is_published
+  各一个 NumPy 数组
+- 每个标签一个布尔位图（与行对齐）
+- 查询时向量化计算筛选掩码，argpartition 只挑出当前页之前的行再排序，
+  最后只按 id 从数据库取当前页的商品
+- 管理员创建/更新/下架商品时增量更新对应行；关键词搜索等快照不支持的条件回退到 SQL
+
+快照在进程内，多 worker 部署时各进程各自维护，只感知本进程内的修改。
+"""
+import logging
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from ..config import settings
+from ..database import SessionLocal
+from ..models import Product, ProductTag
+from .category_tree import category_tree
+from .product_filters import ProductFilters
+
+logger = logging.getLogger(__name__)
+
+_COLUMNS = {
+    "ids": np.int64,
+    "price": np.float64,
+    "category_id": np.int64,
+    "created_at": np.float64,  # 时间戳（秒）
+    "sales_count": np.int64,
+    "popularity_score": np.float64,
+    "is_top": np.bool_,
+    "is_published": np.bool_,
+}
+
+
+def _row(product: Product) -> dict:
+    return {
+        "ids": product.id,
+        "price": float(product.price or 0),
+        "category_id": product.category_id or 0,
+        "created_at": product.created_at.timestamp() if product.created_at else 0.0,
+        "sales_count": product.sales_count or 0,
+        "popularity_score": product.popularity_score or 0.0,
+        "is_top": bool(product.is_top),
+        "is_published": bool(product.is_published),
+    }
+
+
+class _Columns:
+    """一组等长的列；更新时整体替换，查询方拿到的引用不会被修改"""
+
+    def __init__(self, columns: Dict[str, np.ndarray], tags: Dict[int, np.ndarray]):
+        self.columns = columns
+        self.tags = tags
+        self.position = {int(pid): i for i, pid in enumerate(columns["ids"])}
+
+    def __len__(self) -> int:
+        return len(self.columns["ids"])
+
+
+class CatalogSnapshot:
+    def __init__(self):
+        self._data: Optional[_Columns] = None
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self._data is not None
+
+    def __len__(self) -> int:
+        return len(self._data) if self._data is not None else 0
+
+    # ---------- 构建与增量更新 ----------
+
+    def build(self, db: Session):
+        """全量构建"""
+        rows = [_row(p) for p in db.query(Product).order_by(Product.id).yield_per(5000)]
+        columns = {
+            name: np.array([r[name] for r in rows], dtype=dtype)
+            for name, dtype in _COLUMNS.items()
+        }
+        data = _Columns(columns, {})
+        tag_rows: Dict[int, List[int]] = {}
+        for product_id, tag_id in db.query(ProductTag.product_id, ProductTag.tag_id):
+            idx = data.position.get(product_id)
+            if idx is not None:
+                tag_rows.setdefault(tag_id, []).append(idx)
+        for tag_id, indices in tag_rows.items():
+            bits = np.zeros(len(data), dtype=np.bool_)
+            bits[indices] = True
+            data.tags[tag_id] = bits
+        with self._lock:
+            self._data = data
+
+    def upsert(self, products: Iterable[Product]):
+        """新增或更新商品行（含标签）；快照未启用时忽略"""
+        products = list(products)
+        if self._data is None or not products:
+            return
+        with self._lock:
+            old = self._data
+            columns = {name: array.copy() for name, array in old.columns.items()}
+            tags = {tag_id: bits.copy() for tag_id, bits in old.tags.items()}
+            position = dict(old.position)
+
+            new_rows = [p for p in products if p.id not in position]
+            if new_rows:
+                for name, dtype in _COLUMNS.items():
+                    extra = np.array([_row(p)[name] for p in new_rows], dtype=dtype)
+                    columns[name] = np.concatenate([columns[name], extra])
+                for tag_id in tags:
+                    tags[tag_id] = np.concatenate([tags[tag_id], np.zeros(len(new_rows), dtype=np.bool_)])
+                for i, p in enumerate(new_rows):
+                    position[p.id] = len(old) + i
+
+            size = len(columns["ids"])
+            for product in products:
+                idx = position[product.id]
+                for name, value in _row(product).items():
+                    columns[name][idx] = value
+                tag_ids = {t.tag_id for t in product.tags}
+                for tag_id in tag_ids - set(tags):
+                    tags[tag_id] = np.zeros(size, dtype=np.bool_)
+                for tag_id, bits in tags.items():
+                    bits[idx] = tag_id in tag_ids
+            self._data = _Columns(columns, tags)
+
+    def refresh(self, product_ids: Iterable[int]):
+        """从数据库重新读取部分商品（销量、热度等由 SQL 直接更新的字段变化后调用）"""
+        product_ids = list(product_ids)
+        if self._data is None or not product_ids:
+            return
+        db = SessionLocal()
+        try:
+            self.upsert(db.query(Product).filter(Product.id.in_(product_ids)).all())
+        finally:
+            db.close()
+
+    # ---------- 查询 ----------
+
+    def supports(self, filters: ProductFilters) -> bool:
+        # 关键词搜索需要文本匹配，交给 SQL
+        return self._data is not None and not filters.keyword
+
+    def search(
+        self,
+        db: Session,
+        filters: ProductFilters,
+        sort_by: Optional[str],
+        offset: int,
+        limit: int,
+    ) -> Tuple[int, List[int]]:
+        """返回 (总数, 当前页商品 id 列表)；调用前先用 supports() 判断"""
+        data = self._data
+        cols = data.columns
+        mask = np.ones(len(data), dtype=np.bool_)
+
+        if filters.category_id:
+            category_ids = category_tree.descendants(db, filters.category_id) or [filters.category_id]
+            mask &= np.isin(cols["category_id"], category_ids)
+        if filters.tag_id:
+            bits = data.tags.get(filters.tag_id)
+            if bits is None:
+                return 0, []
+            mask &= bits
+        if filters.min_price is not None:
+            mask &= cols["price"] >= filters.min_price
+        if filters.max_price is not None:
+            mask &= cols["price"] <= filters.max_price
+        if filters.is_top is not None:
+            mask &= cols["is_top"] == filters.is_top
+        if filters.is_published is not None:
+            mask &= cols["is_published"] == filters.is_published
+
+        rows = np.flatnonzero(mask)
+        total = len(rows)
+        end = min(offset + limit, total)
+        if offset >= end:
+            return total, []
+
+        # 统一转换成升序排序键，相同值按 id 升序
+        if sort_by == "price_asc":
+            keys = cols["price"][rows]
+        elif sort_by == "price_desc":
+            keys = -cols["price"][rows]
+        elif sort_by == "sales":
+            keys = -cols["sales_count"][rows].astype(np.float64)
+        elif sort_by == "popular":
+            keys = -cols["popularity_score"][rows]
+        else:  # newest / 默认
+            keys = -cols["created_at"][rows]
+        ids = cols["ids"][rows]
+
+        if end < total:
+            # 只有前 end 名需要完整排序；并列的值全部保留，保证分页稳定
+            kth = keys[np.argpartition(keys, end - 1)[end - 1]]
+            candidates = np.flatnonzero(keys <= kth)
+        else:
+            candidates = np.arange(total)
+        order = candidates[np.lexsort((ids[candidates], keys[candidates]))]
+        return total, [int(i) for i in ids[order[offset:end]]]
+
+
+catalog_snapshot = CatalogSnapshot()
+
+
+def init_catalog_snapshot(db: Session):
+    """启动时构建（CATALOG_SNAPSHOT_ENABLED 开启时）"""
+    if not settings.CATALOG_SNAPSHOT_ENABLED:
+        return
+    catalog_snapshot.build(db)
+    logger.info("Catalog snapshot ready: %d products", len(catalog_snapshot))
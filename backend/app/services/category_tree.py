@@ -0,0 +1,228 @@
+"""
+分类树缓存
+
+分类很少修改、读取频繁，这里把整张分类表缓存为一份快照：
+- 一次查询 + 一次遍历建立 parent_id -> 子分类 索引，整棵树 O(n) 构建
+- 序列化后的树按 is_active 过滤条件分别缓存，请求直接返回
+- 分类增删改后调用 invalidate() 使版本号 +1，下次读取时重建
+- 提供祖先 / 子孙查询，供按分类子树筛选商品等场景使用
+
+缓存在进程内，多 worker 部署时各进程只会感知本进程内的修改。
+
+数据库中每个分类还维护物化路径 path（如 "/1/5/12/"）和 depth，
+分类写入时由 assign_path / move_subtree 更新。子树筛选用
+path >= 前缀 AND path < 前缀上界 的范围条件，能直接走 path 索引，
+一条 SQL 即可筛出整个子树下的商品。
+"""
+import threading
+from typing import Dict, List, Optional
+
+from sqlalchemy import and_, func, literal
+from sqlalchemy.orm import Session
+
+from ..models import Category
+from ..schemas import CategoryResponse
+
+
+# ---------- 物化路径 ----------
+
+def _path_upper(path: str) -> str:
+    # "/1/5/" 的子孙路径都以它为前缀；'/' 的下一个字符是 '0'，
+    # 所以 "/1/50" 是所有 "/1/5/..." 之后的第一个字符串
+    return path[:-1] + chr(ord("/") + 1)
+
+
+def subtree_filter(path: str):
+    """匹配路径为 path 的分类及其所有子孙分类（可用 path 索引的范围条件）"""
+    return and_(Category.path >= path, Category.path < _path_upper(path))
+
+
+def assign_path(db: Session, category: Category):
+    """按父分类设置 path / depth；分类需已 flush（有 id）"""
+    parent = db.query(Category).filter(Category.id == category.parent_id).first() if category.parent_id else None
+    if parent is not None and parent.path:
+        category.path = f"{parent.path}{category.id}/"
+        category.depth = (parent.depth or 0) + 1
+    else:
+        category.path = f"/{category.id}/"
+        category.depth = 0
+
+
+def move_subtree(db: Session, category: Category, old_path: Optional[str], old_depth: Optional[int]):
+    """父分类变化后，重算自身路径并批量改写所有子孙分类的路径前缀"""
+    assign_path(db, category)
+    if not old_path or old_path == category.path:
+        return
+    db.query(Category).filter(
+        subtree_filter(old_path),
+        Category.id != category.id
+    ).update({
+        Category.path: literal(category.path) + func.substr(Category.path, len(old_path) + 1),
+        Category.depth: Category.depth + (category.depth - (old_depth or 0)),
+    }, synchronize_session=False)
+
+
+def rebuild_paths(db: Session, only_missing: bool = True) -> int:
+    """
+    按 parent_id 重建所有分类的 path / depth（迁移与数据修复用），返回更新的分类数
+
+    only_missing=True 时，没有缺失路径的分类就直接返回。
+    """
+    if only_missing and db.query(Category.id).filter(Category.path == None).first() is None:
+        return 0
+    categories = db.query(Category).order_by(Category.id).all()
+    children: Dict[int, List[Category]] = {}
+    ids = {c.id for c in categories}
+    for c in categories:
+        # 父分类不存在的按顶级分类处理
+        children.setdefault(c.parent_id if c.parent_id in ids else 0, []).append(c)
+
+    updated = 0
+    stack = [(c, "/", 0) for c in children.get(0, [])]
+    while stack:
+        category, prefix, depth = stack.pop()
+        path = f"{prefix}{category.id}/"
+        if category.path != path or category.depth != depth:
+            category.path = path
+            category.depth = depth
+            updated += 1
+        stack.extend((c, path, depth + 1) for c in children.get(category.id, []))
+    db.commit()
+    return updated
+
+
+# ---------- 分类树缓存 ----------
+
+class _Snapshot:
+    def __init__(self, version: int, categories: List[Category]):
+        self.version = version
+        # 按 (sort_order, id) 排好序，子分类列表自然有序
+        self.nodes: Dict[int, dict] = {}
+        self.children: Dict[int, List[int]] = {}
+        self.paths: Dict[int, Optional[str]] = {}
+        for c in sorted(categories, key=lambda c: (c.sort_order or 0, c.id)):
+            self.nodes[c.id] = CategoryResponse.model_validate(c).model_dump()
+            self.paths[c.id] = c.path
+            self.children.setdefault(c.parent_id or 0, []).append(c.id)
+        self.trees: Dict[Optional[bool], List[dict]] = {}
+
+
+class CategoryTree:
+    def __init__(self):
+        self.version = 0
+        self._snapshot: Optional[_Snapshot] = None
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        """分类数据变化后调用（提交之后）"""
+        with self._lock:
+            self.version += 1
+            self._snapshot = None
+
+    def _get(self, db: Session) -> _Snapshot:
+        snapshot = self._snapshot
+        if snapshot is not None:
+            return snapshot
+        version = self.version
+        snapshot = _Snapshot(version, db.query(Category).all())
+        with self._lock:
+            # 构建期间又有修改时不缓存这份快照
+            if self.version == version:
+                self._snapshot = snapshot
+        return snapshot
+
+    # ---------- 树 ----------
+
+    def get_tree(self, db: Session, is_active: Optional[bool] = None) -> List[dict]:
+        """
+        完整分类树；指定 is_active 时只保留满足条件的分类，
+        不满足条件的分类连同其子树一起隐藏
+        """
+        snapshot = self._get(db)
+        tree = snapshot.trees.get(is_active)
+        if tree is None:
+            tree = self._build(snapshot, is_active)
+            snapshot.trees[is_active] = tree
+        return tree
+
+    @staticmethod
+    def _build(snapshot: _Snapshot, is_active: Optional[bool]) -> List[dict]:
+        def include(node_id: int) -> bool:
+            return is_active is None or snapshot.nodes[node_id]["is_active"] == is_active
+
+        roots: List[dict] = []
+        # 显式栈代替递归；visited 防止 parent_id 成环时死循环
+        stack = [(node_id, roots) for node_id in reversed(snapshot.children.get(0, [])) if include(node_id)]
+        visited = set()
+        while stack:
+            node_id, siblings = stack.pop()
+            if node_id in visited:
+                continue
+            visited.add(node_id)
+            item = dict(snapshot.nodes[node_id])
+            siblings.append(item)
+            child_ids = [c for c in snapshot.children.get(node_id, []) if include(c)]
+            if child_ids:
+                item["children"] = []
+                stack.extend((c, item["children"]) for c in reversed(child_ids))
+        return roots
+
+    def get_nodes(self, db: Session) -> List[dict]:
+        """所有分类（不含 children），按 sort_order 排序"""
+        return [dict(node) for node in self._get(db).nodes.values()]
+
+    def get_children(self, db: Session, parent_id: int, is_active: Optional[bool] = None) -> List[dict]:
+        """直接子分类（不含孙分类）"""
+        snapshot = self._get(db)
+        return [
+            dict(snapshot.nodes[c]) for c in snapshot.children.get(parent_id, [])
+            if is_active is None or snapshot.nodes[c]["is_active"] == is_active
+        ]
+
+    def get_node(self, db: Session, category_id: int) -> Optional[dict]:
+        """单个分类，带直接子分类"""
+        snapshot = self._get(db)
+        node = snapshot.nodes.get(category_id)
+        if node is None:
+            return None
+        result = dict(node)
+        children = self.get_children(db, category_id)
+        if children:
+            result["children"] = children
+        return result
+
+    # ---------- 祖先 / 子孙 ----------
+
+    def path_of(self, db: Session, category_id: int) -> Optional[str]:
+        """分类的物化路径，分类不存在时返回 None"""
+        return self._get(db).paths.get(category_id)
+
+    def ancestors(self, db: Session, category_id: int) -> List[int]:
+        """从根到父分类的 id 列表（不含自身）"""
+        snapshot = self._get(db)
+        result: List[int] = []
+        node = snapshot.nodes.get(category_id)
+        while node is not None and node["parent_id"] and node["parent_id"] not in result:
+            result.append(node["parent_id"])
+            node = snapshot.nodes.get(node["parent_id"])
+        result.reverse()
+        return result
+
+    def descendants(self, db: Session, category_id: int, include_self: bool = True) -> List[int]:
+        """子树中所有分类 id（广度优先）"""
+        snapshot = self._get(db)
+        if category_id not in snapshot.nodes:
+            return []
+        result = [category_id]
+        seen = {category_id}
+        i = 0
+        while i < len(result):
+            for child in snapshot.children.get(result[i], []):
+                if child not in seen:
+                    seen.add(child)
+                    result.append(child)
+            i += 1
+        return result if include_self else result[1:]
+
+
+category_tree = CategoryTree()
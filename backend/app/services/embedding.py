@@ -0,0 +1,68 @@
+"""
+文本向量化
+
+Embedder 只需实现 dim 属性与 embed(texts) -> (n, dim) float32 且已 L2 归一化的矩阵。
+默认的 HashingEmbedder 完全离线、结果确定：
+中文按单字 + 相邻二字切分，英文/数字按单词切分，经 hash 落入固定维度的桶中。
+"""
+import hashlib
+import re
+import unicodedata
+from functools import lru_cache
+from typing import List, Protocol, Sequence
+
+import numpy as np
+
+from ..config import settings
+
+_CJK_RE = re.compile(r"[一-鿿]+")
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+
+class Embedder(Protocol):
+    dim: int
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        ...
+
+
+def tokenize(text: str) -> List[str]:
+    """切分为中文单字/二字组 + 英文单词"""
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    tokens: List[str] = []
+    for run in _CJK_RE.findall(text):
+        tokens.extend(run)
+        tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    tokens.extend(_WORD_RE.findall(text))
+    return tokens
+
+
+class HashingEmbedder:
+    """特征哈希向量化（带符号位，减轻碰撞偏差）"""
+
+    def __init__(self, dim: int = 256):
+        self.dim = dim
+
+    def _bucket(self, token: str):
+        digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+        value = int.from_bytes(digest, "little")
+        return value % self.dim, 1.0 if (value >> 63) & 1 else -1.0
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for token in tokenize(text):
+                idx, sign = self._bucket(token)
+                # 二字组比单字更有区分度
+                matrix[row, idx] += sign * (1.5 if len(token) == 2 and not token.isascii() else 1.0)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+
+@lru_cache()
+def get_embedder() -> Embedder:
+    """按配置返回 Embedder 单例"""
+    if settings.AI_EMBEDDER == "hashing":
+        return HashingEmbedder(settings.AI_EMBEDDING_DIM)
+    raise ValueError(f"未知的 AI_EMBEDDER: {settings.AI_EMBEDDER}")
@@ -0,0 +1,270 @@
+"""
+图片响应式尺寸（缩略图）生成
+
+- 上传完成后，把原图交给进程池生成若干宽度的 WebP / AVIF 缩略图
+- 缩略图与 manifest（<原文件名>.variants.json）写入存储后端，与原图放在同一目录
+- 列表/详情接口通过 manifest 生成 srcset，前端按需选择尺寸；manifest 在后台线程中从存储读取
+  并放入有界 LRU，接口只读缓存，不在事件循环中访问存储（S3 时是网络请求）
+- Pillow 是可选依赖：未安装时跳过生成，接口不返回 srcset
+"""
+import asyncio
+import importlib.util
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from ..config import settings
+from .storage import get_storage, key_from_url
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_SUFFIX = ".variants.json"
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif", ".webp", ".avif"}
+_VARIANT_RE = re.compile(r"_w\d+\.(webp|avif)$")
+
+_PIL_FORMATS = {"webp": "WEBP", "avif": "AVIF"}
+
+# 没有 manifest 的图片多久后再查一次：本进程生成的缩略图完成时直接写入缓存，
+# 这里只用于发现其他 worker / 命令行补生成的缩略图
+MISSING_RECHECK_SECONDS = 300.0
+MANIFEST_LOADER_THREADS = 4
+
+
+def manifest_key(key: str) -> str:
+    return key + MANIFEST_SUFFIX
+
+
+def is_variant_file(name: str) -> bool:
+    return bool(_VARIANT_RE.search(name)) or name.endswith(MANIFEST_SUFFIX)
+
+
+def generate_variants(
+    src_path: str, out_dir: str, stem: str, widths: List[int], formats: List[str], quality: int
+) -> Optional[dict]:
+    """
+    生成缩略图文件 <stem>_w<宽度>.<格式> 到 out_dir，返回 manifest
+
+    只生成比原图窄的尺寸；当前 Pillow 不支持的格式会被跳过。
+    """
+    try:
+        from PIL import Image, features
+    except ImportError:
+        return None
+
+    supported = [f for f in formats if f in _PIL_FORMATS and features.check(f)]
+
+    with Image.open(src_path) as image:
+        image.load()
+        source_width, source_height = image.size
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+
+        variants = []
+        for width in sorted(set(widths)):
+            if width >= source_width:
+                continue
+            height = max(1, round(source_height * width / source_width))
+            resized = image.resize((width, height), Image.LANCZOS)
+            for fmt in supported:
+                filename = f"{stem}_w{width}.{fmt}"
+                resized.save(os.path.join(out_dir, filename), _PIL_FORMATS[fmt], quality=quality)
+                variants.append({"width": width, "format": fmt, "file": filename})
+
+    return {
+        "width": source_width,
+        "height": source_height,
+        "variants": variants,
+    }
+
+
+def generate_variants_for_key(key: str, widths: List[int], formats: List[str], quality: int) -> Optional[dict]:
+    """
+    在子进程中执行：取出原图、生成缩略图并写回存储，最后写入 manifest
+
+    manifest 最后写入，读到 manifest 即表示所有缩略图都已就绪。
+    """
+    storage = get_storage()
+    directory, name = key.rsplit("/", 1) if "/" in key else ("", key)
+    prefix = f"{directory}/" if directory else ""
+    stem = os.path.splitext(name)[0]
+
+    with storage.fetch(key) as src_path, tempfile.TemporaryDirectory(dir=storage.staging_dir()) as out_dir:
+        manifest = generate_variants(src_path, out_dir, stem, widths, formats, quality)
+        if manifest is None:
+            return None
+        for v in manifest["variants"]:
+            storage.save(prefix + v["file"], os.path.join(out_dir, v["file"]), f"image/{v['format']}")
+
+    manifest["source"] = name
+    storage.write_bytes(manifest_key(key), json.dumps(manifest).encode(), "application/json")
+    return manifest
+
+
+def variant_keys(key: str) -> List[str]:
+    """原图对应的所有缩略图与 manifest 的 key（用于清理）"""
+    storage = get_storage()
+    raw = storage.read(manifest_key(key))
+    if raw is None:
+        return []
+    try:
+        manifest = json.loads(raw)
+    except ValueError:
+        return [manifest_key(key)]
+    prefix = key.rsplit("/", 1)[0] + "/" if "/" in key else ""
+    return [prefix + v["file"] for v in manifest.get("variants", [])] + [manifest_key(key)]
+
+
+class ImageVariantService:
+    """管理进程池、提交生成任务、读取 manifest"""
+
+    def __init__(self, max_manifests: int):
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._in_flight: Set[str] = set()
+        # key -> (manifest, 过期时间)；manifest 为 None 表示没有缩略图，到期后重新读取
+        self._manifests: "OrderedDict[str, Tuple[Optional[dict], float]]" = OrderedDict()
+        self._max_manifests = max_manifests
+        self._lock = threading.Lock()
+        self._loader: Optional[ThreadPoolExecutor] = None
+        self._loading: Set[str] = set()
+
+    def start(self):
+        if importlib.util.find_spec("PIL") is None:
+            logger.warning("Pillow is not installed, image variants are disabled")
+            return
+        self._executor = ProcessPoolExecutor(max_workers=settings.IMAGE_VARIANT_WORKERS)
+
+    def stop(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        with self._lock:
+            loader, self._loader = self._loader, None
+            self._loading.clear()
+        if loader is not None:
+            loader.shutdown(wait=False, cancel_futures=True)
+
+    def submit(self, key: str):
+        """在事件循环中调用：后台生成缩略图，不等待结果"""
+        if self._executor is None or key in self._in_flight:
+            return
+        self._in_flight.add(key)
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(
+            self._executor,
+            generate_variants_for_key,
+            key,
+            settings.IMAGE_VARIANT_WIDTHS,
+            settings.IMAGE_VARIANT_FORMATS,
+            settings.IMAGE_VARIANT_QUALITY,
+        )
+        future.add_done_callback(lambda f: self._done(key, f))
+
+    def _done(self, key: str, future):
+        self._in_flight.discard(key)
+        if future.cancelled():
+            self.forget(key)
+            return
+        error = future.exception()
+        if error is not None:
+            logger.warning("Image variant generation failed for %s: %s", key, error)
+            self.forget(key)
+            return
+        self._store(key, future.result())
+
+    # ---------- 读取 ----------
+
+    def manifest_for_url(self, url: Optional[str]) -> Optional[dict]:
+        """
+        只读缓存；未缓存或已过期时提交后台读取并返回 None（本次响应不带 srcset）
+        """
+        key = key_from_url(url)
+        if key is None:
+            return None
+        with self._lock:
+            entry = self._manifests.get(key)
+            if entry is not None:
+                self._manifests.move_to_end(key)
+                manifest, expires_at = entry
+                if manifest is not None or expires_at > time.monotonic():
+                    return manifest
+            if key in self._loading:
+                return None
+            if self._loader is None:
+                self._loader = ThreadPoolExecutor(
+                    max_workers=MANIFEST_LOADER_THREADS, thread_name_prefix="image-manifest"
+                )
+            self._loading.add(key)
+            loader = self._loader
+        loader.submit(self._load, key)
+        return None
+
+    def cached_manifest(self, key: str) -> Optional[dict]:
+        """只查缓存，不触发读取；未缓存或没有缩略图时返回 None"""
+        with self._lock:
+            entry = self._manifests.get(key)
+        return entry[0] if entry is not None else None
+
+    def _load(self, key: str):
+        """后台线程中执行：从存储读取 manifest 并写入缓存"""
+        manifest = None
+        try:
+            raw = get_storage().read(manifest_key(key))
+            manifest = json.loads(raw) if raw is not None else None
+        except ValueError:
+            pass
+        except Exception as e:
+            logger.warning("Image manifest load failed for %s: %s", key, e)
+        finally:
+            with self._lock:
+                self._loading.discard(key)
+        self._store(key, manifest)
+
+    def _store(self, key: str, manifest: Optional[dict]):
+        expires_at = time.monotonic() + MISSING_RECHECK_SECONDS
+        with self._lock:
+            self._manifests[key] = (manifest, expires_at)
+            self._manifests.move_to_end(key)
+            while len(self._manifests) > self._max_manifests:
+                self._manifests.popitem(last=False)
+
+    def srcset(self, url: Optional[str]) -> Optional[Dict[str, str]]:
+        """
+        返回 {格式: srcset 字符串}，如
+        {"webp": "/uploads/x_w320.webp 320w, /uploads/x_w640.webp 640w"}
+        """
+        manifest = self.manifest_for_url(url)
+        if not manifest or not manifest.get("variants"):
+            return None
+        base = url.rsplit("/", 1)[0]
+        result: Dict[str, List[str]] = {}
+        for v in manifest["variants"]:
+            result.setdefault(v["format"], []).append(f"{base}/{v['file']} {v['width']}w")
+        return {fmt: ", ".join(entries) for fmt, entries in result.items()}
+
+    def srcsets(self, urls: Iterable[str]) -> List[Optional[Dict[str, str]]]:
+        return [self.srcset(u) for u in urls]
+
+    def forget(self, key: str):
+        """缩略图删除后清除缓存"""
+        with self._lock:
+            self._manifests.pop(key, None)
+
+
+image_variants = ImageVariantService(max_manifests=settings.IMAGE_MANIFEST_CACHE_SIZE)
+
+
+def iter_source_keys() -> Iterable[str]:
+    """遍历存储中的原图（跳过缩略图与 manifest）"""
+    for key in get_storage().iter_keys():
+        name = key.rsplit("/", 1)[-1]
+        if is_variant_file(name):
+            continue
+        if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS:
+            yield key
@@ -0,0 +1,184 @@
+"""
+通知批量写入
+
+请求中只把通知事件放入进程内的有界队列，由后台任务批量写库：
+- 攒够 NOTIFY_BATCH_SIZE 条或距上次写入超过 NOTIFY_BATCH_INTERVAL 秒时写一次
+- 同一批内 (user_id, type, related_id, title) 相同的重复事件合并为最新的一条；
+  标题区分了订单状态，同一订单先后发货、完成仍是两条通知
+- 一次 INSERT ... RETURNING 写入整批，提交后再更新未读数缓存并推送给在线用户
+- 队列满时 emit 会等待（对调用方施加背压），应用关闭时写完队列中剩余的事件
+"""
+import asyncio
+import logging
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import bindparam, insert, update
+from starlette.concurrency import run_in_threadpool
+
+from ..config import settings
+from ..database import SessionLocal
+from ..models import Notification, NotificationCounter
+from .notification_hub import notification_hub
+from .unread_counters import unread_counters
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class NotificationEvent:
+    user_id: Optional[int]  # None = 全局通知
+    type: str
+    title: str
+    content: Optional[str] = None
+    related_id: Optional[int] = None
+    related_image: Optional[str] = None
+
+    def coalesce_key(self) -> Optional[Tuple]:
+        # 没有关联对象的通知不合并；订单状态通知的标题对应目标状态，不同状态不合并
+        if self.related_id is None:
+            return None
+        return (self.user_id, self.type, self.related_id, self.title)
+
+
+def coalesce(events: List[NotificationEvent]) -> List[NotificationEvent]:
+    """合并同一对象的重复事件，保留最后一条，顺序按最后出现的位置"""
+    latest: Dict[Tuple, int] = {}
+    for i, event in enumerate(events):
+        key = event.coalesce_key()
+        if key is not None:
+            latest[key] = i
+    return [
+        event for i, event in enumerate(events)
+        if event.coalesce_key() is None or latest[event.coalesce_key()] == i
+    ]
+
+
+def write_batch(events: List[NotificationEvent]) -> List[Notification]:
+    """
+    一条 INSERT 写入整批通知，返回带 id 的通知对象（已脱离会话）
+
+    RETURNING 已带回所有列（含 created_at 等服务端默认值），提交时不过期，不再逐行 refresh。
+    """
+    db = SessionLocal(expire_on_commit=False)
+    try:
+        rows = db.scalars(
+            insert(Notification).returning(Notification),
+            [
+                {
+                    "user_id": e.user_id,
+                    "type": e.type,
+                    "title": e.title,
+                    "content": e.content,
+                    "related_id": e.related_id,
+                    "related_image": e.related_image,
+                    "is_read": False,
+                }
+                for e in events
+            ],
+        ).all()
+        # 未缓存（离线 / 重启后未访问）用户的未读数持久化副本同步累加，
+        # 否则下次从该行加载时会少算；已缓存用户的内存计数由 _after_commit 更新，写回时覆盖为同一结果
+        personal = Counter(e.user_id for e in events if e.user_id is not None)
+        if personal:
+            table = NotificationCounter.__table__
+            db.execute(
+                update(table).where(table.c.user_id == bindparam("uid")).values(
+                    personal_unread=table.c.personal_unread + bindparam("n")
+                ),
+                [{"uid": user_id, "n": n} for user_id, n in personal.items()],
+            )
+        db.commit()
+        db.expunge_all()
+        return rows
+    finally:
+        db.close()
+
+
+def _after_commit(notifications: List[Notification]):
+    """写库成功后：更新未读数缓存，推送给在线用户"""
+    for n in notifications:
+        unread_counters.on_insert(n.user_id)
+        notification_hub.publish_notification(n)
+
+
+class NotificationDispatcher:
+    def __init__(self, batch_size: int, interval: float, max_queue: int):
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_queue = max_queue
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self.written = 0
+        self.coalesced = 0
+
+    async def start(self):
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._task = asyncio.create_task(self._run(), name="notification-dispatcher")
+
+    async def stop(self):
+        """写完队列中剩余的事件后停止后台任务"""
+        if self._task is None:
+            return
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+        self._queue = None
+
+    async def emit(self, event: NotificationEvent):
+        """
+        提交一条通知事件
+
+        后台任务未运行（命令行脚本等）时直接写库。
+        """
+        if self._queue is None:
+            await self._flush([event])
+            return
+        await self._queue.put(event)
+
+    def pending(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def _run(self):
+        # 队列中的 None 是停止标记
+        while True:
+            first = await self._queue.get()
+            if first is None:
+                return
+            batch = [first]
+            stopping = False
+            deadline = time.monotonic() + self.interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    event = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if event is None:
+                    stopping = True
+                    break
+                batch.append(event)
+            try:
+                await self._flush(batch)
+            except Exception:
+                logger.exception("Failed to write %d notifications", len(batch))
+            if stopping:
+                return
+
+    async def _flush(self, batch: List[NotificationEvent]):
+        events = coalesce(batch)
+        self.coalesced += len(batch) - len(events)
+        notifications = await run_in_threadpool(write_batch, events)
+        self.written += len(notifications)
+        _after_commit(notifications)
+
+
+notification_dispatcher = NotificationDispatcher(
+    batch_size=settings.NOTIFY_BATCH_SIZE,
+    interval=settings.NOTIFY_BATCH_INTERVAL,
+    max_queue=settings.NOTIFY_QUEUE_MAX,
+)
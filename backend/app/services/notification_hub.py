@@ -0,0 +1,238 @@
+"""
+通知实时推送
+
+- 每个 SSE 连接在 hub 中登记一个订阅（有界队列）
+- 创建通知的地方在提交后调用 publish_notification，消息经 broker 分发给所有 worker，
+  再由各 worker 的 hub 投递给本进程内的连接
+- broker 可替换：单进程用 MemoryBroker，多 worker 部署用 RedisBroker（Redis pub/sub）
+- 背压：连接的队列满了说明客户端读得太慢，直接断开它，
+  客户端重连时带上 Last-Event-ID 补发错过的通知
+- 消息只序列化一次，广播时所有连接共享同一个 SSE 帧
+"""
+import asyncio
+import json
+import logging
+from collections import deque
+from typing import Callable, Deque, Dict, Optional, Set
+
+from ..config import settings
+from ..models import Notification
+
+logger = logging.getLogger(__name__)
+
+
+def notification_to_dict(n: Notification) -> dict:
+    return {
+        "id": n.id,
+        "type": n.type,
+        "title": n.title,
+        "content": n.content,
+        "related_id": n.related_id,
+        "related_image": n.related_image,
+        "is_read": n.is_read,
+        "created_at": n.created_at.isoformat() if n.created_at else None
+    }
+
+
+def format_sse(event: str, data: dict, event_id: Optional[int] = None) -> str:
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data, ensure_ascii=False)}")
+    return "\n".join(lines) + "\n\n"
+
+
+class Subscription:
+    """一个 SSE 连接"""
+
+    __slots__ = ("user_id", "queue")
+
+    def __init__(self, user_id: int, maxsize: int):
+        self.user_id = user_id
+        # None 是结束标记：服务关闭或客户端太慢被断开
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize + 1)
+
+    def offer(self, frame: str) -> bool:
+        """非阻塞投递；队列满时清空并放入结束标记，返回 False"""
+        if self.queue.qsize() < self.queue.maxsize - 1:
+            self.queue.put_nowait(frame)
+            return True
+        self.close()
+        return False
+
+    def close(self):
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(None)
+
+
+# ---------- broker ----------
+
+class MemoryBroker:
+    """单进程：直接投递给本进程的 hub"""
+
+    async def start(self, deliver: Callable[[dict], None]):
+        self._deliver = deliver
+
+    def publish(self, message: dict):
+        self._deliver(message)
+
+    async def stop(self):
+        pass
+
+
+class RedisBroker:
+    """多 worker：通过 Redis pub/sub 把消息广播给所有进程"""
+
+    def __init__(self, url: str, channel: str):
+        self.url = url
+        self.channel = channel
+        self._redis = None
+        self._listener: Optional[asyncio.Task] = None
+        self._pending: Set[asyncio.Task] = set()
+
+    async def start(self, deliver: Callable[[dict], None]):
+        try:
+            import redis.asyncio as redis
+        except ImportError as e:
+            raise RuntimeError("NOTIFY_BROKER=redis 需要安装 redis") from e
+        self._deliver = deliver
+        self._redis = redis.from_url(self.url)
+        self._listener = asyncio.create_task(self._listen(), name="notify-redis-listener")
+
+    async def _listen(self):
+        backoff = 1.0
+        while True:
+            try:
+                pubsub = self._redis.pubsub()
+                await pubsub.subscribe(self.channel)
+                backoff = 1.0
+                async for message in pubsub.listen():
+                    if message["type"] == "message":
+                        self._deliver(json.loads(message["data"]))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Notification broker disconnected: %s", e)
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30.0)
+
+    def publish(self, message: dict):
+        task = asyncio.create_task(self._redis.publish(self.channel, json.dumps(message)))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def stop(self):
+        if self._pending:
+            await asyncio.gather(*self._pending, return_exceptions=True)
+        if self._listener is not None:
+            self._listener.cancel()
+            await asyncio.gather(self._listener, return_exceptions=True)
+        if self._redis is not None:
+            await self._redis.aclose()
+
+
+def create_broker():
+    if settings.NOTIFY_BROKER == "redis":
+        return RedisBroker(settings.NOTIFY_REDIS_URL, settings.NOTIFY_REDIS_CHANNEL)
+    return MemoryBroker()
+
+
+# ---------- hub ----------
+
+class NotificationHub:
+    def __init__(self, queue_size: int, max_connections_per_user: int):
+        self.queue_size = queue_size
+        self.max_connections_per_user = max_connections_per_user
+        self._by_user: Dict[int, Deque[Subscription]] = {}
+        self._broker = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.dropped = 0  # 因背压被断开的连接数
+
+    async def start(self, broker=None):
+        self._loop = asyncio.get_running_loop()
+        self._broker = broker or create_broker()
+        await self._broker.start(self._dispatch)
+
+    async def stop(self):
+        for subs in self._by_user.values():
+            for sub in subs:
+                sub.close()
+        if self._broker is not None:
+            await self._broker.stop()
+            self._broker = None
+
+    # ---------- 连接 ----------
+
+    def subscribe(self, user_id: int) -> Subscription:
+        sub = Subscription(user_id, self.queue_size)
+        subs = self._by_user.setdefault(user_id, deque())
+        subs.append(sub)
+        # 同一用户打开太多页面时，关闭最早的连接
+        while len(subs) > self.max_connections_per_user:
+            subs.popleft().close()
+        return sub
+
+    def unsubscribe(self, sub: Subscription):
+        subs = self._by_user.get(sub.user_id)
+        if not subs:
+            return
+        try:
+            subs.remove(sub)
+        except ValueError:
+            pass
+        if not subs:
+            del self._by_user[sub.user_id]
+
+    def connection_count(self) -> int:
+        return sum(len(subs) for subs in self._by_user.values())
+
+    # ---------- 发布 ----------
+
+    def publish(self, event: str, data: dict, user_id: Optional[int] = None, event_id: Optional[int] = None):
+        """
+        发布事件；user_id 为 None 时推送给所有在线用户
+
+        可以在事件循环或线程池中调用；hub 未启动（命令行脚本等）时忽略。
+        """
+        if self._broker is None or self._loop is None:
+            return
+        message = {"event": event, "data": data, "user_id": user_id, "id": event_id}
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            self._broker.publish(message)
+        else:
+            self._loop.call_soon_threadsafe(self._broker.publish, message)
+
+    def publish_notification(self, notification: Notification):
+        self.publish(
+            "notification",
+            notification_to_dict(notification),
+            user_id=notification.user_id,
+            event_id=notification.id,
+        )
+
+    def _dispatch(self, message: dict):
+        """broker 回调：投递给本进程内的连接"""
+        user_id = message.get("user_id")
+        if user_id is None:
+            targets = [sub for subs in self._by_user.values() for sub in subs]
+        else:
+            targets = list(self._by_user.get(user_id, ()))
+        if not targets:
+            return
+        frame = format_sse(message["event"], message["data"], message.get("id"))
+        for sub in targets:
+            if not sub.offer(frame):
+                self.dropped += 1
+                self.unsubscribe(sub)
+
+
+notification_hub = NotificationHub(
+    queue_size=settings.NOTIFY_QUEUE_SIZE,
+    max_connections_per_user=settings.NOTIFY_MAX_CONNECTIONS_PER_USER,
+)
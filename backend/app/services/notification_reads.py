@@ -0,0 +1,186 @@
+"""
+通知已读状态
+
+- 个人通知（user_id = 用户）：直接使用行上的 is_read
+- 全局通知（user_id IS NULL）：每个用户一条水位线 + 水位线之上的稀疏已读集合
+    已读 ⇔ id <= last_read_id 或 (user_id, id) 在 notification_reads 中
+  “全部已读”只需移动水位线；单条已读插入集合，能连续衔接水位线时自动上移并清理集合，
+  集合因此保持很小
+- 未读数 = 个人未读 + (水位线之上的全局通知数 - 集合大小)，都是索引范围查询
+"""
+from typing import Dict, Iterable
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from ..models import Notification, NotificationRead, NotificationReadState
+
+
+def get_watermark(db: Session, user_id: int) -> int:
+    state = db.query(NotificationReadState).filter(NotificationReadState.user_id == user_id).first()
+    return state.last_read_id if state else 0
+
+
+def _set_watermark(db: Session, user_id: int, last_read_id: int):
+    state = db.query(NotificationReadState).filter(NotificationReadState.user_id == user_id).first()
+    if state is None:
+        db.add(NotificationReadState(user_id=user_id, last_read_id=last_read_id))
+    elif last_read_id > state.last_read_id:
+        state.last_read_id = last_read_id
+    db.query(NotificationRead).filter(
+        NotificationRead.user_id == user_id,
+        NotificationRead.notification_id <= last_read_id
+    ).delete(synchronize_session=False)
+
+
+def count_unread(db: Session, user_id: int) -> int:
+    personal = db.query(func.count(Notification.id)).filter(
+        Notification.user_id == user_id,
+        Notification.is_read == False
+    ).scalar()
+
+    watermark = get_watermark(db, user_id)
+    global_above = db.query(func.count(Notification.id)).filter(
+        Notification.user_id == None,
+        Notification.id > watermark
+    ).scalar()
+    read_above = db.query(func.count(NotificationRead.notification_id)).filter(
+        NotificationRead.user_id == user_id
+    ).scalar()
+    return personal + max(0, global_above - read_above)
+
+
+def count_parts(db: Session, user_id: int):
+    """(个人通知未读数, 已读的全局通知数)，供未读数缓存初始化与校正"""
+    personal = db.query(func.count(Notification.id)).filter(
+        Notification.user_id == user_id,
+        Notification.is_read == False
+    ).scalar()
+    watermark = get_watermark(db, user_id)
+    below = db.query(func.count(Notification.id)).filter(
+        Notification.user_id == None,
+        Notification.id <= watermark
+    ).scalar() if watermark else 0
+    read_above = db.query(func.count(NotificationRead.notification_id)).filter(
+        NotificationRead.user_id == user_id
+    ).scalar()
+    return personal, below + read_above
+
+
+def read_flags(db: Session, user_id: int, notifications: Iterable[Notification]) -> Dict[int, bool]:
+    """批量计算一页通知对该用户的已读状态"""
+    notifications = list(notifications)
+    watermark = get_watermark(db, user_id)
+    candidates = [n.id for n in notifications if n.user_id is None and n.id > watermark]
+    read_set = set()
+    if candidates:
+        read_set = {
+            row[0] for row in db.query(NotificationRead.notification_id).filter(
+                NotificationRead.user_id == user_id,
+                NotificationRead.notification_id.in_(candidates)
+            )
+        }
+    flags = {}
+    for n in notifications:
+        if n.user_id is not None:
+            flags[n.id] = bool(n.is_read)
+        else:
+            flags[n.id] = n.id <= watermark or n.id in read_set
+    return flags
+
+
+def mark_read(db: Session, user_id: int, notification: Notification) -> bool:
+    """
+    标记单条通知为已读，返回之前是否未读；由调用方提交
+    """
+    if notification.user_id is not None:
+        was_unread = not notification.is_read
+        notification.is_read = True
+        return was_unread
+
+    watermark = get_watermark(db, user_id)
+    if notification.id <= watermark:
+        return False
+    exists = db.query(NotificationRead).filter(
+        NotificationRead.user_id == user_id,
+        NotificationRead.notification_id == notification.id
+    ).first()
+    if exists is not None:
+        return False
+    db.add(NotificationRead(user_id=user_id, notification_id=notification.id))
+    db.flush()
+    _advance_watermark(db, user_id, watermark)
+    return True
+
+
+def _advance_watermark(db: Session, user_id: int, watermark: int):
+    """集合中的记录与水位线连续时上移水位线，让集合保持稀疏"""
+    read_ids = sorted(
+        row[0] for row in db.query(NotificationRead.notification_id).filter(
+            NotificationRead.user_id == user_id
+        )
+    )
+    if not read_ids:
+        return
+    # 水位线之上最早的 len(read_ids) 条全局通知，逐条与集合比对
+    next_ids = [
+        row[0] for row in db.query(Notification.id).filter(
+            Notification.user_id == None,
+            Notification.id > watermark
+        ).order_by(Notification.id.asc()).limit(len(read_ids))
+    ]
+    new_watermark = watermark
+    for expected, actual in zip(next_ids, read_ids):
+        if expected != actual:
+            break
+        new_watermark = actual
+    if new_watermark > watermark:
+        _set_watermark(db, user_id, new_watermark)
+
+
+def mark_all_read(db: Session, user_id: int):
+    """全部标记为已读；由调用方提交"""
+    db.query(Notification).filter(
+        Notification.user_id == user_id,
+        Notification.is_read == False
+    ).update({"is_read": True}, synchronize_session=False)
+
+    latest = db.query(func.max(Notification.id)).filter(Notification.user_id == None).scalar()
+    if latest:
+        _set_watermark(db, user_id, latest)
+
+
+def migrate_global_read_flags(db: Session) -> int:
+    """
+    一次性迁移：旧数据中全局通知共用一个 is_read 标记
+
+    为了让每个用户看到的状态与迁移前一致，按旧标记为所有用户生成相同的
+    水位线（连续已读的最大 id）和稀疏集合。已有读状态数据时跳过。返回处理的用户数。
+    """
+    from ..models import User
+
+    if db.query(NotificationReadState.user_id).first() is not None:
+        return 0
+    rows = db.query(Notification.id, Notification.is_read).filter(
+        Notification.user_id == None
+    ).order_by(Notification.id.asc()).all()
+    if not any(is_read for _, is_read in rows):
+        return 0
+
+    watermark = 0
+    for notification_id, is_read in rows:
+        if not is_read:
+            break
+        watermark = notification_id
+    sparse = [nid for nid, is_read in rows if is_read and nid > watermark]
+
+    user_ids = [row[0] for row in db.query(User.id)]
+    db.bulk_insert_mappings(NotificationReadState, [
+        {"user_id": uid, "last_read_id": watermark} for uid in user_ids
+    ])
+    if sparse:
+        db.bulk_insert_mappings(NotificationRead, [
+            {"user_id": uid, "notification_id": nid} for uid in user_ids for nid in sparse
+        ])
+    db.commit()
+    return len(user_ids)
@@ -0,0 +1,162 @@
+"""
+订单流式导出（财务对账）
+
+- 订单按 (created_at, id) 键集分页，每页再按订单 id 查出明细，格式化后立即输出，
+  内存占用与订单总数无关
+- 不使用贯穿整个下载过程的服务端游标：SQLite 非 WAL 模式下打开的读游标持有共享锁，
+  下载期间其他请求的写入会因 database is locked 失败
+- CSV 每个订单明细一行（订单字段重复），JSONL 每个订单一行（items 为明细数组）
+- 使用独立的数据库会话，StreamingResponse 在线程池中迭代生成器
+"""
+import csv
+import io
+import json
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import or_, select
+
+from ..config import settings
+from ..database import SessionLocal
+from ..models import Order, OrderItem, User
+
+CSV_FIELDS = [
+    "order_id", "order_number", "created_at", "paid_at", "status", "user_id", "username",
+    "payment_method", "total_amount", "shipping_fee",
+    "item_id", "product_id", "product_name", "unit_price", "quantity", "subtotal",
+]
+
+# JSONL 中 items 的字段
+_ITEM_FIELDS = CSV_FIELDS[10:]
+
+
+def _money(value) -> Optional[float]:
+    return float(value) if value is not None else None
+
+
+_ORDER_COLUMNS = [
+    Order.id.label("order_id"),
+    Order.order_number,
+    Order.created_at,
+    Order.paid_at,
+    Order.status,
+    Order.user_id,
+    User.username,
+    Order.payment_method,
+    Order.total_amount,
+    Order.shipping_fee,
+]
+_ITEM_COLUMNS = [
+    OrderItem.id.label("item_id"),
+    OrderItem.product_id,
+    OrderItem.product_name,
+    OrderItem.unit_price,
+    OrderItem.quantity,
+    OrderItem.subtotal,
+]
+_NO_ITEM = (None,) * len(_ITEM_FIELDS)
+
+
+def _order_page(
+    start: Optional[datetime],
+    end: Optional[datetime],
+    status: Optional[str],
+    after: Optional[Tuple[datetime, int]],
+    limit: int,
+):
+    """按 (created_at, id) 取 after 之后的一页订单"""
+    stmt = select(*_ORDER_COLUMNS).join(User, User.id == Order.user_id)
+    if start is not None:
+        stmt = stmt.where(Order.created_at >= start)
+    if end is not None:
+        stmt = stmt.where(Order.created_at < end)
+    if status:
+        stmt = stmt.where(Order.status == status)
+    if after is not None:
+        created_at, order_id = after
+        # created_at >= 条件让索引直接定位到上一页末尾，而不是每页从头扫描
+        stmt = stmt.where(
+            Order.created_at >= created_at,
+            or_(Order.created_at > created_at, Order.id > order_id),
+        )
+    return stmt.order_by(Order.created_at, Order.id).limit(limit)
+
+
+def _items_by_order(db, order_ids: List[int]) -> Dict[int, List[tuple]]:
+    items: Dict[int, List[tuple]] = defaultdict(list)
+    rows = db.execute(
+        select(OrderItem.order_id, *_ITEM_COLUMNS).where(
+            OrderItem.order_id.in_(order_ids)
+        ).order_by(OrderItem.order_id, OrderItem.id)
+    )
+    for order_id, *item in rows:
+        items[order_id].append(tuple(item))
+    return items
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def _jsonl_record(order, items: List[tuple]) -> str:
+    record = order._asdict()
+    for name in ("total_amount", "shipping_fee"):
+        record[name] = _money(record[name])
+    record["items"] = []
+    for item in items:
+        data = dict(zip(_ITEM_FIELDS, item))
+        for name in ("unit_price", "subtotal"):
+            data[name] = _money(data[name])
+        record["items"].append(data)
+    return json.dumps(record, ensure_ascii=False, default=_json_default)
+
+
+def export_orders(
+    fmt: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    status: Optional[str] = None,
+) -> Iterator[bytes]:
+    """
+    按下单时间 [start, end) 流式导出订单
+
+    fmt 为 csv 或 jsonl；每页 ORDER_EXPORT_BATCH_SIZE 个订单输出一块。
+    每页是两条读完即结束的短查询，输出前结束读事务，下载期间不占用数据库锁。
+    """
+    db = SessionLocal()
+    try:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if fmt == "csv":
+            buffer.write("\ufeff")  # Excel 按 UTF-8 打开
+            writer.writerow(CSV_FIELDS)
+
+        after: Optional[Tuple[datetime, int]] = None
+        while True:
+            orders = db.execute(
+                _order_page(start, end, status, after, settings.ORDER_EXPORT_BATCH_SIZE)
+            ).all()
+            if not orders:
+                break
+            after = (orders[-1].created_at, orders[-1].order_id)
+            items = _items_by_order(db, [order.order_id for order in orders])
+            db.rollback()  # 结束读事务；客户端下载慢时不阻塞其他写入
+
+            for order in orders:
+                if fmt == "csv":
+                    # 列顺序与 CSV_FIELDS 一致；None 写成空，金额（Decimal）与时间按 str() 输出
+                    writer.writerows(tuple(order) + item for item in items.get(order.order_id) or [_NO_ITEM])
+                else:
+                    buffer.write(_jsonl_record(order, items.get(order.order_id, [])))
+                    buffer.write("\n")
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+
+        if buffer.tell():
+            yield buffer.getvalue().encode("utf-8")
+    finally:
+        db.close()
@@ -0,0 +1,268 @@
+"""
+订单状态机
+
+所有订单状态变更都经过这里：允许的迁移在 TRANSITIONS 中声明（来源、目标、可操作的角色、
+库存变化、通知用户的标题），其余迁移一律拒绝。每次迁移的附带效果：
+- 首次进入 paid / shipped / completed / cancelled 时写入对应的时间戳
+- 进入 cancelled / refunded 时归还库存，退款被驳回（refunded -> completed）时再扣回，
+  迁移两端的库存效果对称：处于 cancelled / refunded 的订单不占用库存
+- 进出成交状态时同步商品销量（见 product_stats）
+- 管理员操作时通知订单所属用户
+
+批量迁移按来源状态分组，每组一条 UPDATE ... WHERE id IN (...) AND status = 来源，
+库存、销量按商品合并后各一条 executemany，与订单数量无关；由调用方在同一事务中提交，
+提交后再调用 publish() 失效缓存、刷新快照并发送通知。
+"""
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, FrozenSet, List, Optional
+
+from sqlalchemy import bindparam, case, func, select, update
+from sqlalchemy.orm import Session
+
+from ..models import Order, Product
+from .ai_cache import invalidate_products
+from .catalog_snapshot import catalog_snapshot
+from .notification_dispatcher import NotificationEvent, notification_dispatcher
+from .product_stats import apply_sales_deltas, order_quantities, sales_direction
+
+STATUS_TEXT = {
+    "pending": "待支付",
+    "paid": "待发货",
+    "shipped": "待收货",
+    "completed": "已完成",
+    "cancelled": "已取消",
+    "refunded": "已退款",
+}
+
+# 进入该状态时写入的时间戳字段（已有值时保留）
+TIMESTAMP_FIELDS = {
+    "paid": "paid_at",
+    "shipped": "shipped_at",
+    "completed": "completed_at",
+    "cancelled": "cancelled_at",
+}
+
+USER = "user"
+ADMIN = "admin"
+ANYONE = frozenset({USER, ADMIN})
+ADMIN_ONLY = frozenset({ADMIN})
+
+
+@dataclass(frozen=True)
+class Transition:
+    source: str
+    target: str
+    actors: FrozenSet[str]
+    stock: int = 0  # 库存变化方向：1 归还订单件数，-1 扣回，0 不变
+    notice: Optional[str] = None  # 管理员操作时通知用户的标题
+
+
+TRANSITIONS: Dict[tuple, Transition] = {
+    (t.source, t.target): t
+    for t in [
+        Transition("pending", "paid", ANYONE),
+        Transition("pending", "cancelled", ANYONE, stock=1, notice="订单已取消"),
+        Transition("paid", "shipped", ADMIN_ONLY, notice="订单已发货"),
+        Transition("paid", "cancelled", ADMIN_ONLY, stock=1, notice="订单已取消"),
+        Transition("paid", "refunded", ANYONE, stock=1, notice="订单已退款"),
+        Transition("shipped", "completed", ANYONE, notice="订单已完成"),
+        Transition("shipped", "refunded", ADMIN_ONLY, stock=1, notice="订单已退款"),  # 退货入库
+        Transition("completed", "refunded", ADMIN_ONLY, stock=1, notice="订单已退款"),
+        Transition("refunded", "completed", ADMIN_ONLY, stock=-1, notice="退款未通过，订单已恢复"),  # 退款驳回
+    ]
+}
+
+
+class InvalidTransition(Exception):
+    """不允许的状态迁移，路由转换为 400"""
+    status_code = 400
+
+
+def check_transition(source: Optional[str], target: str, actor: str = ADMIN) -> Transition:
+    """返回允许的迁移，否则抛出 InvalidTransition"""
+    if target not in STATUS_TEXT:
+        raise InvalidTransition(f"未知的订单状态: {target}")
+    transition = TRANSITIONS.get((source, target))
+    if transition is None or actor not in transition.actors:
+        raise InvalidTransition(
+            f"订单状态为「{STATUS_TEXT.get(source, source)}」，不能变更为「{STATUS_TEXT[target]}」"
+        )
+    return transition
+
+
+@dataclass
+class TransitionEffects:
+    """提交后才能执行的附带效果"""
+    stock_changed: List[int] = field(default_factory=list)
+    sold_changed: List[int] = field(default_factory=list)
+    events: List[NotificationEvent] = field(default_factory=list)
+
+    async def publish(self):
+        if self.stock_changed:
+            invalidate_products(self.stock_changed)
+        if self.sold_changed:
+            catalog_snapshot.refresh(self.sold_changed)
+        for event in self.events:
+            await notification_dispatcher.emit(event)
+
+
+def _notice(transition: Transition, user_id: int, order_id: int, order_number: str) -> NotificationEvent:
+    return NotificationEvent(
+        user_id=user_id,
+        type="order_status",
+        title=transition.notice,
+        content=f"订单 {order_number} 当前状态：{STATUS_TEXT[transition.target]}",
+        related_id=order_id,
+    )
+
+
+def _adjust_stock(db: Session, deltas: Dict[int, int]) -> List[int]:
+    """
+    按商品增减库存（归还、扣回各一条 executemany），同时递增商品版本号
+
+    扣回不低于 0：驳回退款前归还的库存可能已经售出。
+    """
+    table = Product.__table__
+    increments = [{"pid": pid, "n": n} for pid, n in deltas.items() if n > 0]
+    decrements = [{"pid": pid, "n": -n} for pid, n in deltas.items() if n < 0]
+    if increments:
+        db.execute(
+            update(table).where(table.c.id == bindparam("pid")).values(
+                stock=table.c.stock + bindparam("n"),
+                version=table.c.version + 1,
+            ),
+            increments,
+        )
+    if decrements:
+        db.execute(
+            update(table).where(table.c.id == bindparam("pid")).values(
+                stock=case((table.c.stock >= bindparam("n"), table.c.stock - bindparam("n")), else_=0),
+                version=table.c.version + 1,
+            ),
+            decrements,
+        )
+    return sorted(pid for pid, n in deltas.items() if n)
+
+
+def _apply_effects(
+    db: Session, moved: Dict[int, Transition], quantities: Dict[int, Dict[int, int]]
+) -> TransitionEffects:
+    """合并多个订单的库存、销量变化后写入"""
+    stock: Dict[int, int] = defaultdict(int)
+    sales: Dict[int, int] = defaultdict(int)
+    for order_id, transition in moved.items():
+        direction = sales_direction(transition.source, transition.target)
+        for product_id, quantity in quantities.get(order_id, {}).items():
+            stock[product_id] += transition.stock * quantity
+            sales[product_id] += direction * quantity
+    return TransitionEffects(
+        stock_changed=_adjust_stock(db, stock),
+        sold_changed=apply_sales_deltas(db, sales),
+    )
+
+
+def _needs_items(transition: Transition) -> bool:
+    return transition.stock != 0 or sales_direction(transition.source, transition.target) != 0
+
+
+def transition(
+    db: Session, order: Order, target: str, actor: str = ADMIN, notify: bool = False
+) -> TransitionEffects:
+    """
+    迁移单个订单，非法迁移抛出 InvalidTransition；由调用方提交后调用返回值的 publish()
+
+    订单版本号由 ORM 在 flush 时递增。
+    """
+    step = check_transition(order.status, target, actor)
+    quantities = order_quantities(db, [order.id]) if _needs_items(step) else {}
+    effects = _apply_effects(db, {order.id: step}, quantities)
+
+    order.status = target
+    timestamp = TIMESTAMP_FIELDS.get(target)
+    if timestamp and getattr(order, timestamp) is None:
+        setattr(order, timestamp, datetime.now())
+    if notify and step.notice:
+        effects.events.append(_notice(step, order.user_id, order.id, order.order_number))
+    return effects
+
+
+@dataclass
+class BulkTransitionResult:
+    updated: List[int] = field(default_factory=list)
+    skipped: List[dict] = field(default_factory=list)  # [{"order_id", "status", "reason"}]
+    not_found: List[int] = field(default_factory=list)
+    effects: TransitionEffects = field(default_factory=TransitionEffects)
+
+    def to_dict(self) -> dict:
+        return {
+            "updated": len(self.updated),
+            "updated_ids": self.updated,
+            "skipped": self.skipped,
+            "not_found": self.not_found,
+        }
+
+
+def bulk_transition(
+    db: Session, order_ids: List[int], target: str, actor: str = ADMIN, notify: bool = True
+) -> BulkTransitionResult:
+    """
+    批量迁移订单；由调用方提交后调用 result.effects.publish()
+
+    不能迁移的订单记入 skipped，不影响其余订单。读取与 UPDATE 之间被并发修改的订单
+    不满足 status = 来源 条件，同样记入 skipped。
+    """
+    if target not in STATUS_TEXT:
+        raise InvalidTransition(f"未知的订单状态: {target}")
+
+    result = BulkTransitionResult()
+    table = Order.__table__
+    rows = db.execute(
+        select(table.c.id, table.c.status, table.c.user_id, table.c.order_number).where(
+            table.c.id.in_(order_ids)
+        )
+    ).all()
+    found = {row.id: row for row in rows}
+    result.not_found = sorted(set(order_ids) - set(found))
+
+    groups: Dict[str, List[int]] = defaultdict(list)
+    for row in rows:
+        try:
+            check_transition(row.status, target, actor)
+        except InvalidTransition as e:
+            result.skipped.append({"order_id": row.id, "status": row.status, "reason": str(e)})
+        else:
+            groups[row.status].append(row.id)
+
+    now = datetime.now()
+    values = {"status": target, "version": table.c.version + 1}
+    timestamp = TIMESTAMP_FIELDS.get(target)
+    if timestamp:
+        values[timestamp] = func.coalesce(table.c[timestamp], now)
+
+    moved: Dict[int, Transition] = {}
+    for source, ids in groups.items():
+        step = TRANSITIONS[(source, target)]
+        updated = {
+            order_id for order_id, in db.execute(
+                update(table).where(table.c.id.in_(ids), table.c.status == source)
+                .values(**values).returning(table.c.id)
+            )
+        }
+        for order_id in ids:
+            if order_id in updated:
+                moved[order_id] = step
+            else:
+                result.skipped.append({"order_id": order_id, "status": None, "reason": "订单状态已被其他操作修改"})
+
+    with_items = [order_id for order_id, step in moved.items() if _needs_items(step)]
+    result.effects = _apply_effects(db, moved, order_quantities(db, with_items))
+    if notify:
+        result.effects.events = [
+            _notice(step, found[order_id].user_id, order_id, found[order_id].order_number)
+            for order_id, step in moved.items() if step.notice
+        ]
+    result.updated = sorted(moved)
+    result.skipped.sort(key=lambda item: item["order_id"])
+    return result
@@ -0,0 +1,166 @@
+"""
+商品参数 / 标签的差异更新
+
+商品编辑和同步任务提交的是完整的参数、标签列表。与其删除全部旧行再重新插入，
+这里先读出现有数据，和目标列表比较后只写有变化的行：
+- 参数按 (名称, 同名序号) 对应，值或排序变化的执行 UPDATE，多出的 INSERT，缺少的 DELETE
+- 标签按 tag_id 比较，只增删差集
+
+多个商品的变更合并成固定数量的语句（读取 2 条，写入最多 5 条 executemany），
+与商品数量无关；由调用方在同一事务中提交。
+"""
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from sqlalchemy import and_, bindparam, delete, insert, update
+from sqlalchemy.orm import Session
+
+from ..models import Product, ProductParam, ProductTag, Tag
+
+
+@dataclass
+class AttributeChange:
+    """单个商品的目标参数 / 标签；为 None 的部分保持不变"""
+    params: Optional[List[dict]] = None  # [{"name": ..., "value": ...}]，顺序即 sort_order
+    tag_ids: Optional[List[int]] = None
+
+
+@dataclass
+class AttributeDiff:
+    param_inserts: List[dict] = field(default_factory=list)
+    param_updates: List[dict] = field(default_factory=list)
+    param_deletes: List[int] = field(default_factory=list)
+    tag_inserts: List[dict] = field(default_factory=list)
+    tag_deletes: List[dict] = field(default_factory=list)
+    param_products: Set[int] = field(default_factory=set)  # 参数有变化的商品
+
+    @property
+    def tags_changed(self) -> List[int]:
+        return sorted({row["product_id"] for row in self.tag_inserts + self.tag_deletes})
+
+    @property
+    def products_changed(self) -> List[int]:
+        return sorted(set(self.tags_changed) | self.param_products)
+
+    def summary(self) -> dict:
+        return {
+            "params_inserted": len(self.param_inserts),
+            "params_updated": len(self.param_updates),
+            "params_deleted": len(self.param_deletes),
+            "tags_added": len(self.tag_inserts),
+            "tags_removed": len(self.tag_deletes),
+        }
+
+
+def _param_key(params: Sequence, get) -> List[Tuple[str, int]]:
+    """(名称, 同名序号)：同名参数按出现顺序一一对应"""
+    seen: Dict[str, int] = defaultdict(int)
+    keys = []
+    for p in params:
+        name = get(p, "name")
+        keys.append((name, seen[name]))
+        seen[name] += 1
+    return keys
+
+
+def diff_params(
+    product_id: int, existing: List[ProductParam], desired: List[dict], diff: AttributeDiff
+):
+    existing = sorted(existing, key=lambda p: (p.sort_order or 0, p.id))
+    current = dict(zip(_param_key(existing, getattr), existing))
+    before = len(diff.param_inserts) + len(diff.param_updates)
+    for sort_order, (key, p) in enumerate(zip(_param_key(desired, dict.get), desired)):
+        row = current.pop(key, None)
+        if row is None:
+            diff.param_inserts.append({
+                "product_id": product_id, "name": p["name"], "value": p["value"], "sort_order": sort_order,
+            })
+        elif row.value != p["value"] or row.sort_order != sort_order:
+            diff.param_updates.append({"param_id": row.id, "value": p["value"], "sort_order": sort_order})
+    diff.param_deletes.extend(row.id for row in current.values())
+    if current or len(diff.param_inserts) + len(diff.param_updates) > before:
+        diff.param_products.add(product_id)
+
+
+def diff_tags(product_id: int, existing: Iterable[int], desired: Iterable[int], diff: AttributeDiff):
+    existing, desired = set(existing), set(desired)
+    diff.tag_inserts.extend({"product_id": product_id, "tag_id": t} for t in sorted(desired - existing))
+    diff.tag_deletes.extend({"product_id": product_id, "tag_id": t} for t in sorted(existing - desired))
+
+
+def missing_tag_ids(db: Session, tag_ids: Iterable[int]) -> List[int]:
+    tag_ids = set(tag_ids)
+    if not tag_ids:
+        return []
+    found = {tag_id for tag_id, in db.query(Tag.id).filter(Tag.id.in_(tag_ids))}
+    return sorted(tag_ids - found)
+
+
+def compute_diff(db: Session, changes: Dict[int, AttributeChange]) -> AttributeDiff:
+    """读取现有参数、标签（各一条查询）并计算差异"""
+    diff = AttributeDiff()
+    param_ids = [pid for pid, c in changes.items() if c.params is not None]
+    tag_ids = [pid for pid, c in changes.items() if c.tag_ids is not None]
+
+    if param_ids:
+        existing: Dict[int, List[ProductParam]] = defaultdict(list)
+        for param in db.query(ProductParam).filter(ProductParam.product_id.in_(param_ids)):
+            existing[param.product_id].append(param)
+        for product_id in param_ids:
+            diff_params(product_id, existing[product_id], changes[product_id].params, diff)
+
+    if tag_ids:
+        existing_tags: Dict[int, List[int]] = defaultdict(list)
+        for product_id, tag_id in db.query(ProductTag.product_id, ProductTag.tag_id).filter(
+            ProductTag.product_id.in_(tag_ids)
+        ):
+            existing_tags[product_id].append(tag_id)
+        for product_id in tag_ids:
+            diff_tags(product_id, existing_tags[product_id], changes[product_id].tag_ids, diff)
+    return diff
+
+
+def apply_diff(db: Session, diff: AttributeDiff):
+    """每类变更一条（executemany）语句，不经过 ORM 的逐行 flush"""
+    if diff.param_deletes:
+        db.execute(delete(ProductParam).where(ProductParam.id.in_(diff.param_deletes)))
+    if diff.param_updates:
+        table = ProductParam.__table__
+        db.execute(
+            update(table).where(table.c.id == bindparam("param_id")).values(
+                value=bindparam("value"), sort_order=bindparam("sort_order")
+            ),
+            diff.param_updates,
+        )
+    if diff.param_inserts:
+        db.execute(insert(ProductParam.__table__), diff.param_inserts)
+    if diff.tag_deletes:
+        table = ProductTag.__table__
+        db.execute(
+            delete(table).where(and_(table.c.product_id == bindparam("product_id"), table.c.tag_id == bindparam("tag_id"))),
+            diff.tag_deletes,
+        )
+    if diff.tag_inserts:
+        db.execute(insert(ProductTag.__table__), diff.tag_inserts)
+
+
+def bump_versions(db: Session, product_ids: List[int]):
+    """
+    参数、标签变化后递增商品版本号（乐观锁），使持有旧 ETag 的修改返回 409
+
+    只用于没有在会话中加载这些商品对象的场景；已加载时改商品对象本身，由 ORM 递增。
+    """
+    if product_ids:
+        db.execute(
+            update(Product.__table__).where(Product.__table__.c.id.in_(product_ids)).values(
+                version=Product.__table__.c.version + 1
+            )
+        )
+
+
+def update_attributes(db: Session, changes: Dict[int, AttributeChange]) -> AttributeDiff:
+    """计算并写入差异，返回差异明细；由调用方提交"""
+    diff = compute_diff(db, changes)
+    apply_diff(db, diff)
+    return diff
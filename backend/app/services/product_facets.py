@@ -0,0 +1,130 @@
+"""
+商品筛选统计（facets）
+
+给商品列表的筛选项附上数量：各分类、各标签、各价格区间下有多少商品。
+- 每个维度一条 GROUP BY 统计，走 category_id / product_tags / price 上的索引
+- 统计某个维度时不应用该维度自身的条件（例如选中“客厅”后，其他分类的数量仍然可见），
+  其余条件照常生效
+- 分类数量包含子分类下的商品，与列表的分类筛选一致
+- 结果按筛选条件缓存（LRU），商品或分类写入后调用 invalidate() 整体失效
+"""
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import case, func
+from sqlalchemy.orm import Session
+
+from ..config import settings
+from ..models import Product, ProductTag, Tag
+from .category_tree import category_tree
+from .product_filters import ProductFilters, apply_filters
+
+
+def _price_buckets(edges: List[float]) -> List[Tuple[float, Optional[float]]]:
+    """[0, 1000, 2000] -> [(0, 1000), (1000, 2000), (2000, None)]"""
+    edges = sorted(edges)
+    return [(edges[i], edges[i + 1] if i + 1 < len(edges) else None) for i in range(len(edges))]
+
+
+def compute_facets(db: Session, filters: ProductFilters, price_edges: List[float]) -> dict:
+    total = apply_filters(db, db.query(func.count(Product.id)), filters).scalar()
+
+    # 分类：先按 category_id 统计，再把数量累加到各级父分类
+    direct = dict(
+        apply_filters(
+            db,
+            db.query(Product.category_id, func.count(Product.id)),
+            filters.without("category_id"),
+        ).group_by(Product.category_id).all()
+    )
+    nodes = {node["id"]: node for node in category_tree.get_nodes(db)}
+    rolled: Dict[int, int] = {}
+    for category_id, count in direct.items():
+        for node_id in [category_id, *category_tree.ancestors(db, category_id)]:
+            rolled[node_id] = rolled.get(node_id, 0) + count
+    categories = [
+        {"id": node_id, "name": node["name"], "parent_id": node["parent_id"], "count": rolled[node_id]}
+        for node_id, node in nodes.items() if rolled.get(node_id)
+    ]
+
+    # 标签
+    tag_counts = apply_filters(
+        db,
+        db.query(ProductTag.tag_id, func.count(Product.id)).select_from(Product).join(
+            ProductTag, ProductTag.product_id == Product.id
+        ),
+        filters.without("tag_id"),
+    ).group_by(ProductTag.tag_id).all()
+    tag_rows = {t.id: t for t in db.query(Tag).filter(Tag.id.in_([tag_id for tag_id, _ in tag_counts]))}
+    tags = [
+        {"id": tag_id, "name": tag_rows[tag_id].name, "color": tag_rows[tag_id].color, "count": count}
+        for tag_id, count in sorted(tag_counts, key=lambda row: (-row[1], row[0]))
+        if tag_id in tag_rows
+    ]
+
+    # 价格区间
+    buckets = _price_buckets(price_edges)
+    bucket_expr = case(
+        *[(Product.price < upper, i) for i, (_, upper) in enumerate(buckets) if upper is not None],
+        else_=len(buckets) - 1,
+    )
+    bucket_counts = dict(
+        apply_filters(
+            db,
+            db.query(bucket_expr, func.count(Product.id)),
+            filters.without("min_price", "max_price"),
+        ).group_by(bucket_expr).all()
+    )
+    price_ranges = [
+        {"min": lower, "max": upper, "count": bucket_counts.get(i, 0)}
+        for i, (lower, upper) in enumerate(buckets)
+    ]
+
+    return {"total": total, "categories": categories, "tags": tags, "price_ranges": price_ranges}
+
+
+class FacetCache:
+    """按筛选条件缓存统计结果"""
+
+    def __init__(self, max_entries: int, price_edges: List[float]):
+        self.max_entries = max_entries
+        self.price_edges = price_edges
+        self.version = 0
+        self._entries: "OrderedDict[Tuple, dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def invalidate(self):
+        """商品或分类数据变化后调用（提交之后）"""
+        with self._lock:
+            self.version += 1
+            self._entries.clear()
+
+    def get(self, db: Session, filters: ProductFilters) -> dict:
+        key = filters.signature()
+        with self._lock:
+            result = self._entries.get(key)
+            if result is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return result
+            self.misses += 1
+            version = self.version
+
+        result = compute_facets(db, filters, self.price_edges)
+
+        with self._lock:
+            # 统计期间数据有变化时不缓存
+            if self.version == version:
+                self._entries[key] = result
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return result
+
+
+facet_cache = FacetCache(
+    max_entries=settings.FACET_CACHE_MAX_ENTRIES,
+    price_edges=settings.FACET_PRICE_EDGES,
+)
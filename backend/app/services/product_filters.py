@@ -0,0 +1,75 @@
+"""
+商品列表筛选条件
+
+商品列表和筛选统计（facets）共用同一套筛选逻辑，保证两边的结果一致。
+"""
+from dataclasses import astuple, dataclass, replace
+from typing import Optional, Tuple
+
+from sqlalchemy import or_
+from sqlalchemy.orm import Query, Session
+
+from ..models import Category, Product, ProductTag
+from .category_tree import category_tree, subtree_filter
+
+
+@dataclass(frozen=True)
+class ProductFilters:
+    keyword: Optional[str] = None
+    category_id: Optional[int] = None  # 包含子分类
+    tag_id: Optional[int] = None
+    min_price: Optional[float] = None
+    max_price: Optional[float] = None
+    is_top: Optional[bool] = None
+    is_published: Optional[bool] = None
+
+    def signature(self) -> Tuple:
+        """可作为缓存键的筛选条件"""
+        return astuple(self)
+
+    def without(self, *names: str) -> "ProductFilters":
+        """去掉部分条件，例如统计分类分布时不按分类本身筛选"""
+        return replace(self, **{name: None for name in names})
+
+
+def apply_filters(db: Session, query: Query, filters: ProductFilters) -> Query:
+    """把筛选条件加到以 Product 为主体的查询上"""
+    # 关键词搜索
+    if filters.keyword:
+        query = query.filter(
+            or_(
+                Product.name.contains(filters.keyword),
+                Product.short_description.contains(filters.keyword)
+            )
+        )
+
+    # 分类筛选（包含所有子分类）
+    if filters.category_id:
+        path = category_tree.path_of(db, filters.category_id)
+        if path:
+            query = query.join(Category, Product.category_id == Category.id).filter(subtree_filter(path))
+        else:
+            query = query.filter(Product.category_id == filters.category_id)
+
+    # 标签筛选
+    if filters.tag_id:
+        query = query.join(ProductTag, ProductTag.product_id == Product.id).filter(
+            ProductTag.tag_id == filters.tag_id
+        )
+
+    # 价格区间
+    if filters.min_price is not None:
+        query = query.filter(Product.price >= filters.min_price)
+    if filters.max_price is not None:
+        query = query.filter(Product.price <= filters.max_price)
+
+    # 推荐商品
+    if filters.is_top is not None:
+        query = query.filter(Product.is_top == filters.is_top)
+
+    # 上架状态
+    if filters.is_published is not None:
+        query = query.filter(Product.is_published == filters.is_published)
+
+    return query
+
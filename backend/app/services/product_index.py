@@ -0,0 +1,214 @@
+"""
+商品向量检索索引
+
+- 通过可插拔的 Embedder 预先计算已上架商品的向量
+- 向量以 float32 矩阵（ids.npy / vectors.npy）持久化，启动时以 mmap 方式加载
+- 查询时整体做一次矩阵乘法得到余弦相似度，argpartition 取 top-k
+- 管理员创建/更新/下架商品时增量更新；启动时按 updated_at 水位补齐遗漏的变更
+"""
+import json
+import logging
+import os
+import threading
+from datetime import datetime
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import func
+from sqlalchemy.orm import Session, joinedload
+
+from ..config import settings
+from ..models import Product
+from .embedding import Embedder, get_embedder
+
+logger = logging.getLogger(__name__)
+
+EMBED_BATCH_SIZE = 512
+
+
+def product_text(product: Product) -> str:
+    """用于向量化的商品文本"""
+    parts = [product.name or "", product.short_description or ""]
+    if product.category is not None:
+        parts.append(product.category.name or "")
+    parts.append((product.description or "")[:200])
+    return " ".join(p for p in parts if p)
+
+
+class ProductVectorIndex:
+    """商品 ID -> 归一化向量 的内存索引"""
+
+    def __init__(self, directory: str, embedder: Embedder):
+        self.directory = directory
+        self.embedder = embedder
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.vectors = np.zeros((0, embedder.dim), dtype=np.float32)
+        self.watermark: Optional[datetime] = None
+        self.dirty = False
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def _meta(self) -> dict:
+        return {"embedder": type(self.embedder).__name__, "dim": self.embedder.dim}
+
+    # ---------- 持久化 ----------
+
+    def load(self) -> bool:
+        meta_path = os.path.join(self.directory, "meta.json")
+        try:
+            with open(meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+            if {k: meta.get(k) for k in self._meta} != self._meta:
+                logger.info("Product index embedder changed, rebuilding")
+                return False
+            ids = np.load(os.path.join(self.directory, "ids.npy"))
+            vectors = np.load(os.path.join(self.directory, "vectors.npy"), mmap_mode="r")
+        except (OSError, ValueError):
+            return False
+        if vectors.shape != (len(ids), self.embedder.dim):
+            return False
+        self.ids, self.vectors = ids, vectors
+        self.watermark = datetime.fromisoformat(meta["watermark"]) if meta.get("watermark") else None
+        self.dirty = False
+        return True
+
+    def save(self):
+        os.makedirs(self.directory, exist_ok=True)
+        with self._lock:
+            ids, vectors = self.ids, self.vectors
+            meta = {**self._meta, "count": len(ids),
+                    "watermark": self.watermark.isoformat() if self.watermark else None}
+        # 先写临时文件再替换，避免进程中断留下半截文件
+        for name, array in (("ids", ids), ("vectors", vectors)):
+            tmp = os.path.join(self.directory, f"{name}.tmp.npy")
+            np.save(tmp, np.ascontiguousarray(array))
+            os.replace(tmp, os.path.join(self.directory, f"{name}.npy"))
+        tmp = os.path.join(self.directory, "meta.tmp.json")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp, os.path.join(self.directory, "meta.json"))
+        self.dirty = False
+
+    # ---------- 构建与增量更新 ----------
+
+    def _embed_products(self, products: List[Product]) -> np.ndarray:
+        texts = [product_text(p) for p in products]
+        chunks = [
+            self.embedder.embed(texts[i:i + EMBED_BATCH_SIZE])
+            for i in range(0, len(texts), EMBED_BATCH_SIZE)
+        ]
+        if not chunks:
+            return np.zeros((0, self.embedder.dim), dtype=np.float32)
+        return np.vstack(chunks).astype(np.float32, copy=False)
+
+    def _published_query(self, db: Session):
+        return db.query(Product).options(joinedload(Product.category)).filter(
+            Product.is_published == True
+        )
+
+    def build(self, db: Session):
+        """全量重建"""
+        watermark = db.query(func.max(Product.updated_at)).scalar()
+        products = self._published_query(db).order_by(Product.id).all()
+        vectors = self._embed_products(products)
+        with self._lock:
+            self.ids = np.array([p.id for p in products], dtype=np.int64)
+            self.vectors = vectors
+            self.watermark = watermark
+            self.dirty = True
+
+    def refresh_since_watermark(self, db: Session):
+        """补齐上次持久化之后发生的商品变更"""
+        if self.watermark is None:
+            self.build(db)
+            return
+        watermark = db.query(func.max(Product.updated_at)).scalar()
+        changed = db.query(Product).options(joinedload(Product.category)).filter(
+            Product.updated_at >= self.watermark
+        ).all()
+        self.upsert(changed)
+        self.watermark = watermark
+
+    def upsert(self, products: Iterable[Product]):
+        """新增或更新商品向量；未上架的商品会被移出索引"""
+        products = list(products)
+        published = [p for p in products if p.is_published]
+        removed = [p.id for p in products if not p.is_published]
+        vectors = self._embed_products(published)
+        with self._lock:
+            # mmap 加载的矩阵是只读的，首次写入时复制到内存
+            ids = np.array(self.ids, dtype=np.int64)
+            matrix = np.array(self.vectors, dtype=np.float32)
+            if removed:
+                keep = ~np.isin(ids, removed)
+                ids, matrix = ids[keep], matrix[keep]
+            position = {int(pid): i for i, pid in enumerate(ids)}
+            new_ids, new_rows = [], []
+            for product, vector in zip(published, vectors):
+                idx = position.get(product.id)
+                if idx is None:
+                    new_ids.append(product.id)
+                    new_rows.append(vector)
+                else:
+                    matrix[idx] = vector
+            if new_ids:
+                ids = np.concatenate([ids, np.array(new_ids, dtype=np.int64)])
+                matrix = np.vstack([matrix, np.stack(new_rows)])
+            self.ids, self.vectors = ids, matrix
+            self.dirty = True
+
+    def remove(self, product_ids: Iterable[int]):
+        product_ids = list(product_ids)
+        with self._lock:
+            keep = ~np.isin(self.ids, product_ids)
+            if keep.all():
+                return
+            self.ids = self.ids[keep]
+            self.vectors = np.asarray(self.vectors)[keep]
+            self.dirty = True
+
+    # ---------- 查询 ----------
+
+    def search(self, query: str, k: int, min_score: float = 0.0) -> List[Tuple[int, float]]:
+        """返回按相似度降序排列的 (product_id, score)"""
+        with self._lock:
+            ids, vectors = self.ids, self.vectors
+        if not len(ids) or not query.strip():
+            return []
+        q = self.embedder.embed([query])[0]
+        scores = vectors @ q
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(ids[i]), float(scores[i])) for i in top if scores[i] > min_score]
+
+
+_index: Optional[ProductVectorIndex] = None
+
+
+def get_product_index() -> ProductVectorIndex:
+    global _index
+    if _index is None:
+        _index = ProductVectorIndex(settings.PRODUCT_INDEX_DIR, get_embedder())
+    return _index
+
+
+def init_product_index(db: Session) -> ProductVectorIndex:
+    """启动时加载持久化索引并补齐增量；没有可用索引时全量构建"""
+    index = get_product_index()
+    if index.load():
+        index.refresh_since_watermark(db)
+    else:
+        index.build(db)
+    if index.dirty:
+        index.save()
+    logger.info("Product vector index ready: %d products", len(index))
+    return index
+
+
+def save_product_index():
+    if _index is not None and _index.dirty:
+        _index.save()
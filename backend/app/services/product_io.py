@@ -0,0 +1,541 @@
+"""
+商品批量导入 / 导出（管理后台）
+
+导入：
+- 上传的 CSV / JSONL 文件流式落盘后立即返回任务 ID，由后台 worker 处理
+- 文件按行流式读取，每 PRODUCT_IMPORT_BATCH_SIZE 行为一批：逐行用 Pydantic 校验，
+  有效行的商品、参数、标签各用一条批量 INSERT 写入，与任务进度、错误明细在同一事务中提交
+- 校验失败的行记录行号和原因，不影响其他行
+- 任务持久化在 product_import_jobs 表；进度随每批一起提交，进程重启后从已提交的位置继续
+- 导入完成后统一刷新筛选统计缓存、列表快照和向量索引，不发送逐个商品的上新通知
+
+导出：按 id 分页流式读取，输出与导入相同的列，导出的文件可以直接再导入。
+
+文件格式（CSV 首行为列名，JSONL 每行一个 JSON 对象）：
+    name, category_id 或 category（分类名称）, price, original_price, stock,
+    short_description, description, main_image_url, image_urls, tags, params,
+    is_published, is_top
+CSV 中 image_urls / tags 用 "|" 分隔，params 写成 "名称:值|名称:值"；
+JSONL 中分别为字符串数组和 [{"name": ..., "value": ...}] 数组。
+"""
+import asyncio
+import csv
+import io
+import json
+import logging
+import os
+import threading
+from collections import defaultdict
+from datetime import datetime
+from decimal import Decimal
+from typing import Annotated, Dict, Iterator, List, Optional, Tuple, Union
+
+from pydantic import BaseModel, ConfigDict, Field, ValidationError, field_validator, model_validator
+from sqlalchemy import insert
+from sqlalchemy.orm import Session, joinedload
+from starlette.concurrency import run_in_threadpool
+
+from ..config import settings
+from ..database import SessionLocal
+from ..models import Category, Product, ProductImportJob, ProductParam, ProductTag, Tag
+from .blob_store import adjust_blob_refs
+from .catalog_snapshot import catalog_snapshot
+from .product_facets import facet_cache
+from .product_filters import ProductFilters, apply_filters
+from .product_index import get_product_index
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ("csv", "jsonl")
+FINISHED_STATUSES = ("succeeded", "failed")
+
+EXPORT_FIELDS = [
+    "id", "name", "category_id", "category", "price", "original_price", "stock",
+    "short_description", "description", "main_image_url", "image_urls", "tags", "params",
+    "is_published", "is_top",
+]
+
+# 导入完成后更新向量索引时，每次加载的商品数
+_INDEX_BATCH_SIZE = 5000
+
+# 导出只读取需要的列，不构造 ORM 对象
+_EXPORT_COLUMNS = [
+    Product.id, Product.name, Product.category_id, Product.price, Product.original_price, Product.stock,
+    Product.short_description, Product.description, Product.main_image_url, Product.image_urls,
+    Product.is_published, Product.is_top,
+]
+
+
+# ---------- 行校验 ----------
+
+class ImportParam(BaseModel):
+    name: str = Field(..., min_length=1, max_length=50)
+    value: str = Field(..., max_length=200)
+
+
+class ProductImportRow(BaseModel):
+    """导入文件中的一行"""
+    model_config = ConfigDict(str_strip_whitespace=True, extra="ignore")
+
+    name: str = Field(..., min_length=1, max_length=100)
+    category_id: Optional[int] = None
+    category: Optional[str] = None  # 分类名称，与 category_id 二选一
+    short_description: Optional[str] = None
+    description: Optional[str] = None
+    price: Decimal = Field(..., gt=0, max_digits=10, decimal_places=2)
+    original_price: Optional[Decimal] = Field(None, gt=0, max_digits=10, decimal_places=2)
+    stock: int = Field(0, ge=0)
+    main_image_url: Optional[str] = Field(None, max_length=255)
+    image_urls: List[str] = []
+    tags: List[Annotated[str, Field(min_length=1, max_length=50)]] = []
+    params: List[ImportParam] = []
+    is_published: bool = True
+    is_top: bool = False
+
+    @field_validator("image_urls", "tags", mode="before")
+    @classmethod
+    def _split_list(cls, value):
+        if isinstance(value, str):
+            return [item.strip() for item in value.split("|") if item.strip()]
+        return value
+
+    @field_validator("params", mode="before")
+    @classmethod
+    def _split_params(cls, value):
+        if not isinstance(value, str):
+            return value
+        params = []
+        for item in value.split("|"):
+            if not item.strip():
+                continue
+            name, sep, param_value = item.replace("：", ":").partition(":")
+            if not sep:
+                raise ValueError(f"参数格式应为 名称:值，实际为 {item!r}")
+            params.append({"name": name.strip(), "value": param_value.strip()})
+        return params
+
+    @model_validator(mode="after")
+    def _require_category(self):
+        if self.category_id is None and not self.category:
+            raise ValueError("缺少 category_id 或 category")
+        return self
+
+
+def _format_error(e: Exception) -> str:
+    if isinstance(e, ValidationError):
+        return "; ".join(
+            f"{'.'.join(str(loc) for loc in err['loc']) or 'row'}: {err['msg']}" for err in e.errors()
+        )
+    return str(e)
+
+
+# ---------- 文件读取 ----------
+
+def _iter_records(path: str, fmt: str) -> Iterator[Union[dict, Exception]]:
+    """逐行读取数据行；无法解析的行返回异常对象（行号由调用方按顺序计数）"""
+    if fmt == "csv":
+        with open(path, encoding="utf-8-sig", newline="") as f:
+            for record in csv.DictReader(f):
+                # 空单元格视为未填写，使用默认值
+                yield {k: v for k, v in record.items() if k and v not in (None, "")}
+    else:
+        with open(path, encoding="utf-8-sig") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError as e:
+                    yield ValueError(f"JSON 解析失败: {e}")
+                    continue
+                yield record if isinstance(record, dict) else ValueError("每行应为一个 JSON 对象")
+
+
+def count_rows(path: str, fmt: str) -> int:
+    if fmt == "csv":
+        with open(path, encoding="utf-8-sig", newline="") as f:
+            return max(0, sum(1 for _ in csv.reader(f)) - 1)
+    with open(path, encoding="utf-8-sig") as f:
+        return sum(1 for line in f if line.strip())
+
+
+def detect_format(content_type: Optional[str]) -> Optional[str]:
+    """按 Content-Type 推断导入格式"""
+    mime = (content_type or "").split(";")[0].strip().lower()
+    if mime in ("text/csv", "application/csv"):
+        return "csv"
+    if mime in ("application/x-ndjson", "application/jsonl", "application/x-jsonlines", "application/json-lines"):
+        return "jsonl"
+    return None
+
+
+# ---------- 导入 ----------
+
+class _Lookups:
+    """分类、标签的名称/ID 对照，任务开始时加载一次"""
+
+    def __init__(self, db: Session):
+        self.category_ids = set()
+        self.category_by_name: Dict[str, int] = {}
+        for category_id, name in db.query(Category.id, Category.name):
+            self.category_ids.add(category_id)
+            self.category_by_name[name] = category_id
+        self.tag_by_name: Dict[str, int] = dict(db.query(Tag.name, Tag.id))
+
+    def category_for(self, row: ProductImportRow) -> int:
+        if row.category_id is not None:
+            if row.category_id not in self.category_ids:
+                raise ValueError(f"分类不存在: {row.category_id}")
+            return row.category_id
+        category_id = self.category_by_name.get(row.category)
+        if category_id is None:
+            raise ValueError(f"分类不存在: {row.category}")
+        return category_id
+
+
+def _write_batch(
+    db: Session,
+    lookups: _Lookups,
+    rows: List[Tuple[int, ProductImportRow]],
+) -> Tuple[List[int], List[dict]]:
+    """写入一批已通过校验的行，返回 (新商品 id, 错误明细)；由调用方提交"""
+    errors = []
+    valid: List[Tuple[ProductImportRow, int]] = []
+    for row_number, row in rows:
+        try:
+            valid.append((row, lookups.category_for(row)))
+        except ValueError as e:
+            errors.append({"row": row_number, "error": str(e)})
+    if not valid:
+        return [], errors
+
+    product_ids = db.scalars(
+        insert(Product).returning(Product.id, sort_by_parameter_order=True),
+        [
+            {
+                "name": row.name,
+                "category_id": category_id,
+                "short_description": row.short_description,
+                "description": row.description,
+                "price": row.price,
+                "original_price": row.original_price,
+                "stock": row.stock,
+                "main_image_url": row.main_image_url,
+                "image_urls": json.dumps(row.image_urls),
+                "is_published": row.is_published,
+                "is_top": row.is_top,
+            }
+            for row, category_id in valid
+        ],
+    ).all()
+
+    # 新标签先写入，提交成功后再加入对照表
+    new_tags = {name for row, _ in valid for name in row.tags} - set(lookups.tag_by_name)
+    tag_ids = dict(lookups.tag_by_name)
+    if new_tags:
+        created = db.execute(
+            insert(Tag).returning(Tag.name, Tag.id, sort_by_parameter_order=True),
+            [{"name": name} for name in sorted(new_tags)],
+        )
+        tag_ids.update({name: tag_id for name, tag_id in created})
+
+    params, product_tags, image_urls = [], [], []
+    for product_id, (row, _) in zip(product_ids, valid):
+        params.extend(
+            {"product_id": product_id, "name": p.name, "value": p.value, "sort_order": idx}
+            for idx, p in enumerate(row.params)
+        )
+        product_tags.extend(
+            {"product_id": product_id, "tag_id": tag_ids[name]} for name in dict.fromkeys(row.tags)
+        )
+        image_urls.extend(row.image_urls)
+        if row.main_image_url:
+            image_urls.append(row.main_image_url)
+    if params:
+        db.execute(insert(ProductParam), params)
+    if product_tags:
+        db.execute(insert(ProductTag), product_tags)
+    adjust_blob_refs(db, [], image_urls)
+    lookups.tag_by_name = tag_ids
+    return list(product_ids), errors
+
+
+def run_import(job_id: str, stop_event: Optional[threading.Event] = None) -> List[int]:
+    """
+    执行导入任务，返回本次新建的商品 id（线程池中执行）
+
+    stop_event 被设置时在两批之间退出，任务保持 running 状态，下次启动时继续。
+    """
+    db = SessionLocal()
+    created_ids: List[int] = []
+    try:
+        job = db.get(ProductImportJob, job_id)
+        if job is None or job.status in FINISHED_STATUSES:
+            return created_ids
+        if job.status == "queued":
+            job.status = "running"
+            job.started_at = datetime.now()
+            job.total_rows = count_rows(job.file_path, job.format)
+            db.commit()
+
+        lookups = _Lookups(db)
+        errors = json.loads(job.errors or "[]")
+        skip = job.processed_rows or 0
+        batch_size = settings.PRODUCT_IMPORT_BATCH_SIZE
+        batch: List[Tuple[int, Union[dict, Exception]]] = []
+
+        def flush():
+            rows, batch_errors = [], []
+            for row_number, record in batch:
+                try:
+                    if isinstance(record, Exception):
+                        raise record
+                    rows.append((row_number, ProductImportRow.model_validate(record)))
+                except (ValueError, TypeError) as e:
+                    batch_errors.append({"row": row_number, "error": _format_error(e)})
+            try:
+                product_ids, write_errors = _write_batch(db, lookups, rows)
+            except Exception:
+                db.rollback()
+                lookups.tag_by_name = dict(db.query(Tag.name, Tag.id))
+                raise
+            batch_errors.extend(write_errors)
+            batch_errors.sort(key=lambda e: e["row"])
+
+            room = settings.PRODUCT_IMPORT_MAX_ERRORS - len(errors)
+            errors.extend(batch_errors[:max(0, room)])
+            job.processed_rows += len(batch)
+            job.created_count += len(product_ids)
+            job.error_count += len(batch_errors)
+            job.errors = json.dumps(errors, ensure_ascii=False)
+            db.commit()
+            created_ids.extend(product_ids)
+            batch.clear()
+
+        for row_number, record in enumerate(_iter_records(job.file_path, job.format), start=1):
+            if row_number <= skip:
+                continue
+            batch.append((row_number, record))
+            if len(batch) >= batch_size:
+                flush()
+                if stop_event is not None and stop_event.is_set():
+                    return created_ids
+        if batch:
+            flush()
+
+        job.status = "succeeded"
+        job.finished_at = datetime.now()
+        db.commit()
+        _remove_file(job.file_path)
+        return created_ids
+    except Exception as e:
+        logger.exception("Product import %s failed", job_id)
+        db.rollback()
+        job = db.get(ProductImportJob, job_id)
+        if job is not None:
+            job.status = "failed"
+            job.error = "文件不是 UTF-8 编码" if isinstance(e, UnicodeDecodeError) else f"导入失败: {e}"
+            job.finished_at = datetime.now()
+            db.commit()
+            _remove_file(job.file_path)
+        return created_ids
+    finally:
+        db.close()
+
+
+def _remove_file(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def refresh_after_import(product_ids: List[int]):
+    """导入的商品写入后统一刷新各类缓存与索引（线程池中执行）"""
+    if not product_ids:
+        return
+    facet_cache.invalidate()
+    db = SessionLocal()
+    try:
+        if catalog_snapshot.ready:
+            catalog_snapshot.build(db)
+        index = get_product_index()
+        for start in range(0, len(product_ids), _INDEX_BATCH_SIZE):
+            chunk = product_ids[start:start + _INDEX_BATCH_SIZE]
+            index.upsert(
+                db.query(Product).options(joinedload(Product.category)).filter(Product.id.in_(chunk)).all()
+            )
+            db.expunge_all()
+    finally:
+        db.close()
+
+
+def job_to_dict(job: ProductImportJob, with_errors: bool = True) -> dict:
+    data = {
+        "job_id": job.id,
+        "status": job.status,
+        "format": job.format,
+        "total_rows": job.total_rows or 0,
+        "processed_rows": job.processed_rows or 0,
+        "created_count": job.created_count or 0,
+        "error_count": job.error_count or 0,
+        "error": job.error,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
+    if with_errors:
+        data["errors"] = json.loads(job.errors or "[]")
+    return data
+
+
+class ProductImportQueue:
+    """
+    导入任务队列，单个 worker 顺序执行
+
+    导入是大批量写入，并发执行只会互相争用写锁，所以任务依次处理。
+    """
+
+    def __init__(self):
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stop_event = threading.Event()
+
+    async def start(self):
+        self._stop_event.clear()
+        self._queue = asyncio.Queue()
+        for job_id in await run_in_threadpool(self._recover):
+            self._queue.put_nowait(job_id)
+        self._task = asyncio.create_task(self._worker(), name="product-import-worker")
+
+    async def stop(self):
+        # 正在执行的任务在当前批提交后退出，下次启动时继续
+        self._stop_event.set()
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    @staticmethod
+    def _recover() -> List[str]:
+        """上次进程退出时未完成的任务（已提交的批次不会重复写入）"""
+        db = SessionLocal()
+        try:
+            jobs = db.query(ProductImportJob.id).filter(
+                ProductImportJob.status.in_(["queued", "running"])
+            ).order_by(ProductImportJob.created_at.asc()).all()
+            return [job_id for job_id, in jobs]
+        finally:
+            db.close()
+
+    def submit(self, job_id: str):
+        """任务记录提交到数据库之后调用"""
+        self._queue.put_nowait(job_id)
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                created = await run_in_threadpool(run_import, job_id, self._stop_event)
+                await run_in_threadpool(refresh_after_import, created)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Product import worker error on %s", job_id)
+
+
+product_import_queue = ProductImportQueue()
+
+
+# ---------- 导出 ----------
+
+def _export_record(product, category_name: Optional[str], tags: List[str], params: List[dict]) -> dict:
+    try:
+        image_urls = json.loads(product.image_urls) if product.image_urls else []
+    except ValueError:
+        image_urls = []
+    return {
+        "id": product.id,
+        "name": product.name,
+        "category_id": product.category_id,
+        "category": category_name,
+        "price": float(product.price) if product.price is not None else None,
+        "original_price": float(product.original_price) if product.original_price is not None else None,
+        "stock": product.stock or 0,
+        "short_description": product.short_description,
+        "description": product.description,
+        "main_image_url": product.main_image_url,
+        "image_urls": image_urls,
+        "tags": tags,
+        "params": params,
+        "is_published": bool(product.is_published),
+        "is_top": bool(product.is_top),
+    }
+
+
+def _csv_cell(name: str, value):
+    if value is None:
+        return ""
+    if name in ("image_urls", "tags"):
+        return "|".join(value)
+    if name == "params":
+        return "|".join(f"{p['name']}:{p['value']}" for p in value)
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return value
+
+
+def export_products(fmt: str, filters: ProductFilters) -> Iterator[bytes]:
+    """
+    按 id 分页流式导出商品（StreamingResponse 在线程池中迭代）
+
+    使用独立的数据库会话，与请求的会话生命周期无关。
+    """
+    db = SessionLocal()
+    try:
+        category_names = dict(db.query(Category.id, Category.name))
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if fmt == "csv":
+            buffer.write("\ufeff")  # Excel 按 UTF-8 打开
+            writer.writerow(EXPORT_FIELDS)
+
+        last_id = 0
+        while True:
+            page = apply_filters(db, db.query(*_EXPORT_COLUMNS), filters).filter(
+                Product.id > last_id
+            ).order_by(Product.id).limit(settings.PRODUCT_EXPORT_BATCH_SIZE).all()
+            if not page:
+                break
+            last_id = page[-1].id
+            ids = [p.id for p in page]
+
+            tags: Dict[int, List[str]] = defaultdict(list)
+            for product_id, name in db.query(ProductTag.product_id, Tag.name).join(
+                Tag, Tag.id == ProductTag.tag_id
+            ).filter(ProductTag.product_id.in_(ids)).order_by(ProductTag.product_id, Tag.id):
+                tags[product_id].append(name)
+            params: Dict[int, List[dict]] = defaultdict(list)
+            for product_id, name, value in db.query(
+                ProductParam.product_id, ProductParam.name, ProductParam.value
+            ).filter(ProductParam.product_id.in_(ids)).order_by(
+                ProductParam.product_id, ProductParam.sort_order, ProductParam.id
+            ):
+                params[product_id].append({"name": name, "value": value})
+
+            for product in page:
+                record = _export_record(product, category_names.get(product.category_id),
+                                        tags[product.id], params[product.id])
+                if fmt == "csv":
+                    writer.writerow([_csv_cell(name, record[name]) for name in EXPORT_FIELDS])
+                else:
+                    buffer.write(json.dumps(record, ensure_ascii=False))
+                    buffer.write("\n")
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+
+        if buffer.tell():
+            yield buffer.getvalue().encode("utf-8")
+    finally:
+        db.close()
@@ -0,0 +1,194 @@
+"""
+商品销量与热度
+
+销量（sales_count）：
+- 订单从未成交状态（pending / cancelled / refunded）进入成交状态（paid / shipped / completed）时
+  按订单明细累加，反方向变化时扣减；用 UPDATE ... SET sales_count = sales_count + n 原子更新，
+  与订单状态在同一事务中提交
+- 按状态迁移而不是按接口计数，重复支付、退款被驳回后恢复等情况都不会重复或漏计；
+  由订单状态机（services/order_state.py）在每次迁移时调用，批量迁移时按商品合并成一次写入
+
+热度（popularity_score）：
+- 近 POPULARITY_WINDOW_DAYS 天成交的件数按时间衰减求和（半衰期 POPULARITY_HALF_LIFE_DAYS），
+  再加上浏览量的加权
+- 后台任务定期重算并写回，列表按 (is_published, popularity_score) 索引排序
+"""
+import asyncio
+import logging
+import math
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import bindparam, case, func, select, update
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from ..config import settings
+from ..database import SessionLocal
+from ..models import Order, OrderItem, Product
+from .catalog_snapshot import catalog_snapshot
+
+logger = logging.getLogger(__name__)
+
+SOLD_STATUSES = frozenset({"paid", "shipped", "completed"})
+
+
+def sales_direction(old_status: Optional[str], new_status: str) -> int:
+    """状态变化对销量的影响：进入成交状态 1，离开成交状态 -1，否则 0"""
+    was_sold = old_status in SOLD_STATUSES
+    is_sold = new_status in SOLD_STATUSES
+    return int(is_sold) - int(was_sold)
+
+
+def order_quantities(db: Session, order_ids: List[int]) -> Dict[int, Dict[int, int]]:
+    """按订单汇总各商品的件数：{order_id: {product_id: quantity}}，一条 GROUP BY 查询"""
+    quantities: Dict[int, Dict[int, int]] = defaultdict(dict)
+    if not order_ids:
+        return quantities
+    rows = db.query(OrderItem.order_id, OrderItem.product_id, func.sum(OrderItem.quantity)).filter(
+        OrderItem.order_id.in_(order_ids)
+    ).group_by(OrderItem.order_id, OrderItem.product_id)
+    for order_id, product_id, quantity in rows:
+        quantities[order_id][product_id] = int(quantity or 0)
+    return quantities
+
+
+def apply_sales_deltas(db: Session, deltas: Dict[int, int]) -> List[int]:
+    """
+    按商品累加 / 扣减销量，返回有变化的商品 id；由调用方提交
+
+    增加、扣减各一条 executemany，扣减不低于 0。
+    显式保留 updated_at：销量变化不算商品内容变更（向量索引按 updated_at 增量更新）；
+    用 Core UPDATE，也不递增商品版本号。
+    """
+    table = Product.__table__
+    increments = [{"pid": pid, "n": n} for pid, n in deltas.items() if n > 0]
+    decrements = [{"pid": pid, "n": -n} for pid, n in deltas.items() if n < 0]
+    if increments:
+        db.execute(
+            update(table).where(table.c.id == bindparam("pid")).values(
+                sales_count=table.c.sales_count + bindparam("n"),
+                updated_at=table.c.updated_at,
+            ),
+            increments,
+        )
+    if decrements:
+        db.execute(
+            update(table).where(table.c.id == bindparam("pid")).values(
+                sales_count=case(
+                    (table.c.sales_count >= bindparam("n"), table.c.sales_count - bindparam("n")),
+                    else_=0,
+                ),
+                updated_at=table.c.updated_at,
+            ),
+            decrements,
+        )
+    return sorted(pid for pid, n in deltas.items() if n)
+
+
+def backfill_sales_counts(db: Session) -> int:
+    """
+    一次性迁移：按已成交订单重算所有商品的销量，返回更新的行数；由调用方提交
+
+    销量改为由状态迁移增量维护之前，sales_count 是手工填写的值；不回填的话排序只反映
+    升级后的成交，升级前订单退款时的扣减也会被截断在 0。
+    """
+    table = Product.__table__
+    sold = select(func.coalesce(func.sum(OrderItem.quantity), 0)).join(
+        Order, Order.id == OrderItem.order_id
+    ).where(
+        OrderItem.product_id == table.c.id,
+        Order.status.in_(SOLD_STATUSES)
+    ).scalar_subquery()
+    result = db.execute(update(table).values(sales_count=sold, updated_at=table.c.updated_at))
+    return result.rowcount
+
+
+# ---------- 热度 ----------
+
+def compute_popularity(db: Session, now: Optional[datetime] = None) -> Dict[int, float]:
+    """按近期成交和浏览量计算所有商品的热度"""
+    now = now or datetime.now()
+    since = now - timedelta(days=settings.POPULARITY_WINDOW_DAYS)
+    half_life = settings.POPULARITY_HALF_LIFE_DAYS * 86400
+
+    rows = db.query(OrderItem.product_id, OrderItem.quantity, Order.paid_at, Order.created_at).join(
+        Order, Order.id == OrderItem.order_id
+    ).filter(
+        Order.status.in_(SOLD_STATUSES),
+        Order.created_at >= since
+    )
+    decayed: Dict[int, float] = defaultdict(float)
+    for product_id, quantity, paid_at, created_at in rows:
+        age = max(0.0, (now - (paid_at or created_at)).total_seconds())
+        decayed[product_id] += quantity * math.pow(0.5, age / half_life)
+
+    return {
+        product_id: round(decayed.get(product_id, 0.0) + settings.POPULARITY_VIEW_WEIGHT * (view_count or 0), 4)
+        for product_id, view_count in db.query(Product.id, Product.view_count)
+    }
+
+
+def refresh_popularity() -> List[int]:
+    """重算热度并写回有变化的商品，返回这些商品的 id（线程池中执行）"""
+    db = SessionLocal()
+    try:
+        scores = compute_popularity(db)
+        current = dict(db.query(Product.id, Product.popularity_score))
+        changed = [
+            {"pid": product_id, "score": score}
+            for product_id, score in scores.items()
+            if product_id in current and current[product_id] != score
+        ]
+        if changed:
+            # 同样保留 updated_at；用 Core UPDATE，热度变化也不递增商品版本号
+            table = Product.__table__
+            db.execute(
+                update(table).where(table.c.id == bindparam("pid")).values(
+                    popularity_score=bindparam("score"),
+                    updated_at=table.c.updated_at,
+                ),
+                changed,
+            )
+            db.commit()
+        return [row["pid"] for row in changed]
+    finally:
+        db.close()
+
+
+class PopularityJob:
+    """定期重算商品热度"""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+        self.runs = 0
+
+    async def start(self):
+        self._task = asyncio.create_task(self._loop(), name="popularity-refresh")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def run_once(self) -> List[int]:
+        changed = await run_in_threadpool(refresh_popularity)
+        self.runs += 1
+        if changed:
+            await run_in_threadpool(catalog_snapshot.refresh, changed)
+            logger.info("Popularity refreshed for %d products", len(changed))
+        return changed
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.warning("Popularity refresh failed: %s", e)
+            await asyncio.sleep(self.interval)
+
+
+popularity_job = PopularityJob(interval=settings.POPULARITY_REFRESH_SECONDS)
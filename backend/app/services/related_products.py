@@ -0,0 +1,205 @@
+"""
+相关商品推荐（离线预计算）
+
+1. 用户-商品交互矩阵：成交订单中的商品（权重 RELATED_PURCHASE_WEIGHT）+ 收藏（权重 1）
+2. 商品-商品相似度 = 交互矩阵的共现 X^T X，按各商品向量长度做余弦归一化；
+   矩阵以 COO 三元组（NumPy 数组）表示，共现按 (i, j) 键 np.unique + bincount 聚合
+3. 每个商品取相似度最高的 top-k 个已上架商品，不足时依次用同分类、同一级分类、
+   全站的高销量商品补足
+4. 结果整表写入 product_recommendations（每商品一行），详情页按主键读取
+
+后台任务每 RELATED_REFRESH_SECONDS 秒重建一次，也可以手动运行: python -m app.rebuild_related
+"""
+import asyncio
+import json
+import logging
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from ..config import settings
+from ..database import SessionLocal
+from ..models import Category, Order, OrderItem, Product, ProductRecommendation
+from ..models.favorite import Favorite
+from .product_stats import SOLD_STATUSES
+
+logger = logging.getLogger(__name__)
+
+# 单个用户参与共现计算的商品数上限（按权重取前若干个），避免个别大客户带来平方级的计算量
+MAX_ITEMS_PER_USER = 100
+
+
+def load_interactions(db: Session) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """用户-商品交互，返回 COO 形式的 (user_ids, product_ids, weights)"""
+    weights: Dict[Tuple[int, int], float] = defaultdict(float)
+    purchases = db.query(Order.user_id, OrderItem.product_id).join(
+        OrderItem, OrderItem.order_id == Order.id
+    ).filter(Order.status.in_(SOLD_STATUSES)).distinct()
+    for user_id, product_id in purchases:
+        weights[(user_id, product_id)] += settings.RELATED_PURCHASE_WEIGHT
+    for user_id, product_id in db.query(Favorite.user_id, Favorite.product_id):
+        weights[(user_id, product_id)] += 1.0
+
+    if not weights:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, np.zeros(0, dtype=np.float64)
+    keys = np.array(list(weights.keys()), dtype=np.int64)
+    return keys[:, 0], keys[:, 1], np.array(list(weights.values()), dtype=np.float64)
+
+
+def item_similarity(
+    users: np.ndarray, items: np.ndarray, weights: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """商品-商品余弦相似度，返回 COO 形式的 (product_i, product_j, score)，i != j"""
+    if not len(users):
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, np.zeros(0, dtype=np.float64)
+
+    item_ids, item_idx = np.unique(items, return_inverse=True)
+    n_items = len(item_ids)
+    norms = np.sqrt(np.bincount(item_idx, weights=weights ** 2, minlength=n_items))
+
+    # 按用户分组，组内两两组合得到共现
+    order = np.argsort(users, kind="stable")
+    users, item_idx, weights = users[order], item_idx[order], weights[order]
+    bounds = np.flatnonzero(np.diff(users)) + 1
+    pair_keys, pair_weights = [], []
+    for idx, w in zip(np.split(item_idx, bounds), np.split(weights, bounds)):
+        if len(idx) < 2:
+            continue
+        if len(idx) > MAX_ITEMS_PER_USER:
+            top = np.argsort(-w, kind="stable")[:MAX_ITEMS_PER_USER]
+            idx, w = idx[top], w[top]
+        a, b = np.meshgrid(np.arange(len(idx)), np.arange(len(idx)), indexing="ij")
+        off_diagonal = a != b
+        pair_keys.append(idx[a[off_diagonal]] * n_items + idx[b[off_diagonal]])
+        pair_weights.append(w[a[off_diagonal]] * w[b[off_diagonal]])
+    if not pair_keys:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, np.zeros(0, dtype=np.float64)
+
+    keys, inverse = np.unique(np.concatenate(pair_keys), return_inverse=True)
+    cooccurrence = np.bincount(inverse, weights=np.concatenate(pair_weights))
+    i, j = keys // n_items, keys % n_items
+    scores = cooccurrence / (norms[i] * norms[j])
+    return item_ids[i], item_ids[j], scores
+
+
+def top_neighbors(
+    left: np.ndarray, right: np.ndarray, scores: np.ndarray, allowed: set, k: int
+) -> Dict[int, List[int]]:
+    """每个商品相似度最高的 k 个商品（只保留 allowed 中的商品）"""
+    if not len(left):
+        return {}
+    keep = np.isin(right, np.fromiter(allowed, dtype=np.int64, count=len(allowed)))
+    left, right, scores = left[keep], right[keep], scores[keep]
+    # 按 (商品, 相似度降序, id 升序) 排序后，每组取前 k 个
+    order = np.lexsort((right, -scores, left))
+    left, right = left[order], right[order]
+    starts = np.r_[0, np.flatnonzero(np.diff(left)) + 1]
+    rank = np.arange(len(left)) - np.repeat(starts, np.diff(np.r_[starts, len(left)]))
+    result: Dict[int, List[int]] = defaultdict(list)
+    for product_id, related_id in zip(left[rank < k].tolist(), right[rank < k].tolist()):
+        result[product_id].append(related_id)
+    return result
+
+
+def compute_recommendations(db: Session, k: int) -> Dict[int, List[int]]:
+    products = db.query(
+        Product.id, Product.category_id, Product.sales_count
+    ).filter(Product.is_published == True).all()
+    published = {p.id for p in products}
+    paths = dict(db.query(Category.id, Category.path))
+
+    neighbors = top_neighbors(*item_similarity(*load_interactions(db)), allowed=published, k=k)
+
+    # 兜底候选：按销量降序
+    by_sales = sorted(products, key=lambda p: (-(p.sales_count or 0), p.id))
+    by_category: Dict[int, List[int]] = defaultdict(list)
+    by_root: Dict[str, List[int]] = defaultdict(list)
+    for p in by_sales:
+        by_category[p.category_id].append(p.id)
+        by_root[_root(paths.get(p.category_id))].append(p.id)
+    global_top = [p.id for p in by_sales[:k * 2]]
+
+    result = {}
+    for p in products:
+        related = list(neighbors.get(p.id, []))
+        seen = set(related) | {p.id}
+        for candidates in (by_category[p.category_id], by_root[_root(paths.get(p.category_id))], global_top):
+            if len(related) >= k:
+                break
+            for candidate in candidates:
+                if candidate not in seen:
+                    related.append(candidate)
+                    seen.add(candidate)
+                    if len(related) >= k:
+                        break
+        result[p.id] = related
+    return result
+
+
+def _root(path: Optional[str]) -> str:
+    """一级分类：物化路径的第一段"""
+    return path.split("/")[1] if path else ""
+
+
+def rebuild_recommendations(k: Optional[int] = None) -> int:
+    """重建整张推荐表，返回商品数（线程池或命令行中执行）"""
+    k = k or settings.RELATED_TOP_K
+    db = SessionLocal()
+    try:
+        recommendations = compute_recommendations(db, k)
+        db.query(ProductRecommendation).delete(synchronize_session=False)
+        db.bulk_insert_mappings(ProductRecommendation, [
+            {"product_id": product_id, "related_ids": json.dumps(related)}
+            for product_id, related in recommendations.items()
+        ])
+        db.commit()
+        return len(recommendations)
+    finally:
+        db.close()
+
+
+def get_related_ids(db: Session, product_id: int) -> Optional[List[int]]:
+    """预计算的相关商品 id；还没有计算过（新商品）时返回 None"""
+    row = db.get(ProductRecommendation, product_id)
+    return json.loads(row.related_ids) if row is not None else None
+
+
+class RecommendationJob:
+    """定期重建相关商品"""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+        self.runs = 0
+
+    async def start(self):
+        self._task = asyncio.create_task(self._loop(), name="related-products-rebuild")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def run_once(self) -> int:
+        count = await run_in_threadpool(rebuild_recommendations)
+        self.runs += 1
+        logger.info("Related products rebuilt for %d products", count)
+        return count
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.warning("Related products rebuild failed: %s", e)
+            await asyncio.sleep(self.interval)
+
+
+recommendation_job = RecommendationJob(interval=settings.RELATED_REFRESH_SECONDS)
@@ -0,0 +1,462 @@
+"""
+上传文件存储后端
+
+- LocalStorage：本地目录（单机部署 / 开发环境）
+- S3Storage：S3 兼容对象存储（AWS S3、MinIO 等），多实例部署时共享
+- 通过 Settings.STORAGE_BACKEND 选择
+
+对外的图片 URL 统一为 /uploads/<key>，与后端无关：本地后端由静态文件服务直接返回，
+S3 后端重定向到桶的公开地址（或预签名 GET）。切换后端不需要改写数据库中的 URL。
+
+两种后端都支持预签名直传：客户端拿到 URL 后直接把文件发给存储，不经过 API worker
+（本地后端的“预签名 URL”指向 /v1/upload/direct，由签名 token 授权）。
+大文件走分片上传。
+"""
+import base64
+import logging
+import os
+import shutil
+import tempfile
+import uuid
+from contextlib import contextmanager, nullcontext
+from datetime import timedelta
+from typing import ContextManager, Dict, Iterator, List, Optional
+
+from ..config import settings
+from ..utils.security import create_upload_token
+
+logger = logging.getLogger(__name__)
+
+URL_PREFIX = "/uploads/"
+
+CHUNK_SIZE = 64 * 1024
+
+
+class StorageError(Exception):
+    """存储后端不可用或操作失败"""
+
+
+def url_for_key(key: str) -> str:
+    return URL_PREFIX + key
+
+
+def key_from_url(url: Optional[str]) -> Optional[str]:
+    """/uploads/<key> -> key；外链或非法路径返回 None"""
+    if not url or not url.startswith(URL_PREFIX):
+        return None
+    key = url[len(URL_PREFIX):]
+    if not key or key.startswith("/") or ".." in key.split("/"):
+        return None
+    return key
+
+
+class StorageBackend:
+    """存储后端接口，key 为 / 分隔的相对路径"""
+
+    name = ""
+
+    def ensure_ready(self):
+        """启动时检查（创建目录 / 桶）"""
+
+    def staging_dir(self) -> str:
+        """接收上传时写临时文件的本地目录"""
+        raise NotImplementedError
+
+    # ---------- 读写 ----------
+
+    def save(self, key: str, src_path: str, content_type: str):
+        """把本地文件移入存储（调用后 src_path 不再存在）"""
+        raise NotImplementedError
+
+    def write_bytes(self, key: str, data: bytes, content_type: str):
+        raise NotImplementedError
+
+    def read(self, key: str) -> Optional[bytes]:
+        """读取整个对象，不存在时返回 None"""
+        raise NotImplementedError
+
+    def read_head(self, key: str, length: int) -> bytes:
+        raise NotImplementedError
+
+    def iter_chunks(self, key: str) -> Iterator[bytes]:
+        raise NotImplementedError
+
+    def size(self, key: str) -> Optional[int]:
+        """对象大小，不存在时返回 None"""
+        raise NotImplementedError
+
+    def exists(self, key: str) -> bool:
+        return self.size(key) is not None
+
+    def delete(self, key: str):
+        raise NotImplementedError
+
+    def iter_keys(self, prefix: str = "") -> Iterator[str]:
+        raise NotImplementedError
+
+    def fetch(self, key: str) -> ContextManager[str]:
+        """在 with 块内提供对象的本地文件路径（远程后端会下载到临时文件）"""
+        raise NotImplementedError
+
+    def public_url(self, key: str) -> str:
+        """浏览器可直接访问的地址"""
+        raise NotImplementedError
+
+    # ---------- 直传 ----------
+
+    def presign_put(self, key: str, content_type: str, sha256: str) -> Dict:
+        """返回 {"method", "url", "headers"}，客户端按此直接上传整个文件"""
+        raise NotImplementedError
+
+    def create_multipart(self, key: str, content_type: str) -> str:
+        """开始分片上传，返回 upload_id"""
+        raise NotImplementedError
+
+    def presign_part(self, key: str, upload_id: str, part_number: int) -> str:
+        raise NotImplementedError
+
+    def complete_multipart(self, key: str, upload_id: str, parts: List[Dict]):
+        """parts: [{"part_number": 1, "etag": "..."}]"""
+        raise NotImplementedError
+
+    def abort_multipart(self, key: str, upload_id: str):
+        raise NotImplementedError
+
+
+class LocalStorage(StorageBackend):
+    name = "local"
+
+    def __init__(self, root: str, staging: str):
+        self.root = root
+        self.staging = staging
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, *key.split("/"))
+
+    def ensure_ready(self):
+        os.makedirs(self.staging_dir(), exist_ok=True)
+        # 旧版本的暂存目录在上传根目录下，会被 /uploads 静态目录直接访问到
+        shutil.rmtree(os.path.join(self.root, ".staging"), ignore_errors=True)
+
+    def staging_dir(self) -> str:
+        # 不在上传根目录下：上传中的文件、分片不能通过 /uploads 访问。
+        # save 先移到目标旁的临时文件再 os.replace，跨文件系统时同样是原子替换
+        return self.staging
+
+    def save(self, key: str, src_path: str, content_type: str):
+        final_path = self._path(key)
+        os.makedirs(os.path.dirname(final_path), exist_ok=True)
+        tmp = f"{final_path}.{uuid.uuid4().hex[:8]}.tmp"
+        shutil.move(src_path, tmp)
+        os.replace(tmp, final_path)
+
+    def write_bytes(self, key: str, data: bytes, content_type: str):
+        final_path = self._path(key)
+        os.makedirs(os.path.dirname(final_path), exist_ok=True)
+        tmp = f"{final_path}.{uuid.uuid4().hex[:8]}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, final_path)
+
+    def read(self, key: str) -> Optional[bytes]:
+        try:
+            with open(self._path(key), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def read_head(self, key: str, length: int) -> bytes:
+        with open(self._path(key), "rb") as f:
+            return f.read(length)
+
+    def iter_chunks(self, key: str) -> Iterator[bytes]:
+        with open(self._path(key), "rb") as f:
+            while True:
+                chunk = f.read(CHUNK_SIZE)
+                if not chunk:
+                    return
+                yield chunk
+
+    def size(self, key: str) -> Optional[int]:
+        try:
+            return os.path.getsize(self._path(key))
+        except OSError:
+            return None
+
+    def delete(self, key: str):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def iter_keys(self, prefix: str = "") -> Iterator[str]:
+        base = self._path(prefix) if prefix else self.root
+        for directory, dirs, names in os.walk(base):
+            dirs[:] = [d for d in dirs if not d.startswith(".")]
+            rel = os.path.relpath(directory, self.root).replace(os.sep, "/")
+            for name in names:
+                if name.startswith(".") or name.endswith(".tmp"):
+                    continue
+                yield name if rel == "." else f"{rel}/{name}"
+
+    def fetch(self, key: str) -> ContextManager[str]:
+        return nullcontext(self._path(key))
+
+    def public_url(self, key: str) -> str:
+        return url_for_key(key)
+
+    # 本地后端的直传目标是 API 自己的 /v1/upload/direct，由短期 token 授权
+
+    def _direct_url(self, claims: dict) -> str:
+        token = create_upload_token(claims, timedelta(seconds=settings.UPLOAD_PRESIGN_EXPIRES))
+        return f"/v1/upload/direct?token={token}"
+
+    def presign_put(self, key: str, content_type: str, sha256: str) -> Dict:
+        url = self._direct_url({"op": "put", "key": key, "sha256": sha256, "content_type": content_type})
+        return {"method": "PUT", "url": url, "headers": {"Content-Type": content_type}}
+
+    def part_path(self, upload_id: str, part_number: int) -> str:
+        return os.path.join(self.staging_dir(), "multipart", upload_id, f"{part_number:05d}")
+
+    def create_multipart(self, key: str, content_type: str) -> str:
+        upload_id = uuid.uuid4().hex
+        os.makedirs(os.path.join(self.staging_dir(), "multipart", upload_id))
+        return upload_id
+
+    def presign_part(self, key: str, upload_id: str, part_number: int) -> str:
+        return self._direct_url({"op": "part", "key": key, "upload_id": upload_id, "part_number": part_number})
+
+    def complete_multipart(self, key: str, upload_id: str, parts: List[Dict]):
+        if not parts:
+            raise StorageError("没有已上传的分片")
+        tmp = os.path.join(self.staging_dir(), f".{upload_id}.part")
+        try:
+            with open(tmp, "wb") as out:
+                for part in sorted(parts, key=lambda p: p["part_number"]):
+                    path = self.part_path(upload_id, part["part_number"])
+                    if not os.path.exists(path):
+                        raise StorageError(f"分片 {part['part_number']} 不存在")
+                    with open(path, "rb") as f:
+                        shutil.copyfileobj(f, out, CHUNK_SIZE)
+            self.save(key, tmp, "")
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        self.abort_multipart(key, upload_id)
+
+    def abort_multipart(self, key: str, upload_id: str):
+        shutil.rmtree(os.path.join(self.staging_dir(), "multipart", upload_id), ignore_errors=True)
+
+
+class S3Storage(StorageBackend):
+    """S3 兼容对象存储（boto3），开发时可指向本地 MinIO"""
+
+    name = "s3"
+
+    def __init__(
+        self,
+        bucket: str,
+        endpoint_url: Optional[str] = None,
+        region: str = "us-east-1",
+        access_key: Optional[str] = None,
+        secret_key: Optional[str] = None,
+        public_url: str = "",
+    ):
+        try:
+            import boto3
+            from boto3.s3.transfer import TransferConfig
+            from botocore.config import Config
+        except ImportError as e:
+            raise StorageError("使用 S3 存储需要安装 boto3") from e
+
+        self.bucket = bucket
+        self.public_base = public_url.rstrip("/")
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=endpoint_url or None,
+            region_name=region,
+            aws_access_key_id=access_key or None,
+            aws_secret_access_key=secret_key or None,
+            # MinIO 等自建服务通常只支持 path-style 地址
+            config=Config(signature_version="s3v4", s3={"addressing_style": "path"}),
+        )
+        # 超过阈值的文件由 boto3 自动分片并发上传
+        self.transfer_config = TransferConfig(
+            multipart_threshold=settings.UPLOAD_MULTIPART_THRESHOLD,
+            multipart_chunksize=settings.UPLOAD_PART_SIZE,
+        )
+
+    def _is_not_found(self, error) -> bool:
+        code = error.response.get("Error", {}).get("Code")
+        return code in ("404", "NoSuchKey", "NotFound", "NoSuchBucket")
+
+    def ensure_ready(self):
+        from botocore.exceptions import ClientError
+
+        try:
+            self.client.head_bucket(Bucket=self.bucket)
+        except ClientError as e:
+            if not self._is_not_found(e):
+                raise StorageError(f"无法访问存储桶 {self.bucket}: {e}") from e
+            logger.info("Creating bucket %s", self.bucket)
+            self.client.create_bucket(Bucket=self.bucket)
+        os.makedirs(self.staging_dir(), exist_ok=True)
+
+    def staging_dir(self) -> str:
+        return os.path.join(tempfile.gettempdir(), "suju-upload-staging")
+
+    def save(self, key: str, src_path: str, content_type: str):
+        extra = {"ContentType": content_type} if content_type else {}
+        try:
+            self.client.upload_file(
+                src_path, self.bucket, key, ExtraArgs=extra, Config=self.transfer_config
+            )
+        finally:
+            os.remove(src_path)
+
+    def write_bytes(self, key: str, data: bytes, content_type: str):
+        self.client.put_object(Bucket=self.bucket, Key=key, Body=data, ContentType=content_type)
+
+    def read(self, key: str) -> Optional[bytes]:
+        from botocore.exceptions import ClientError
+
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=key)["Body"].read()
+        except ClientError as e:
+            if self._is_not_found(e):
+                return None
+            raise
+
+    def read_head(self, key: str, length: int) -> bytes:
+        response = self.client.get_object(Bucket=self.bucket, Key=key, Range=f"bytes=0-{length - 1}")
+        return response["Body"].read()
+
+    def iter_chunks(self, key: str) -> Iterator[bytes]:
+        body = self.client.get_object(Bucket=self.bucket, Key=key)["Body"]
+        try:
+            yield from body.iter_chunks(CHUNK_SIZE)
+        finally:
+            body.close()
+
+    def size(self, key: str) -> Optional[int]:
+        from botocore.exceptions import ClientError
+
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=key)["ContentLength"]
+        except ClientError as e:
+            if self._is_not_found(e):
+                return None
+            raise
+
+    def delete(self, key: str):
+        self.client.delete_object(Bucket=self.bucket, Key=key)
+
+    def iter_keys(self, prefix: str = "") -> Iterator[str]:
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix):
+            for obj in page.get("Contents", []):
+                yield obj["Key"]
+
+    @contextmanager
+    def fetch(self, key: str) -> Iterator[str]:
+        fd, path = tempfile.mkstemp(dir=self.staging_dir(), suffix=os.path.splitext(key)[1])
+        os.close(fd)
+        try:
+            self.client.download_file(self.bucket, key, path, Config=self.transfer_config)
+            yield path
+        finally:
+            os.remove(path)
+
+    def public_url(self, key: str) -> str:
+        if self.public_base:
+            return f"{self.public_base}/{key}"
+        return self.client.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": self.bucket, "Key": key},
+            ExpiresIn=settings.UPLOAD_PRESIGN_EXPIRES,
+        )
+
+    def presign_put(self, key: str, content_type: str, sha256: str) -> Dict:
+        # 签入 sha256 校验和：存储端会拒绝内容与声明不一致的上传
+        checksum = base64.b64encode(bytes.fromhex(sha256)).decode()
+        url = self.client.generate_presigned_url(
+            "put_object",
+            Params={
+                "Bucket": self.bucket,
+                "Key": key,
+                "ContentType": content_type,
+                "ChecksumSHA256": checksum,
+            },
+            ExpiresIn=settings.UPLOAD_PRESIGN_EXPIRES,
+        )
+        return {
+            "method": "PUT",
+            "url": url,
+            "headers": {"Content-Type": content_type, "x-amz-checksum-sha256": checksum},
+        }
+
+    def create_multipart(self, key: str, content_type: str) -> str:
+        response = self.client.create_multipart_upload(
+            Bucket=self.bucket, Key=key, ContentType=content_type
+        )
+        return response["UploadId"]
+
+    def presign_part(self, key: str, upload_id: str, part_number: int) -> str:
+        return self.client.generate_presigned_url(
+            "upload_part",
+            Params={"Bucket": self.bucket, "Key": key, "UploadId": upload_id, "PartNumber": part_number},
+            ExpiresIn=settings.UPLOAD_PRESIGN_EXPIRES,
+        )
+
+    def complete_multipart(self, key: str, upload_id: str, parts: List[Dict]):
+        from botocore.exceptions import ClientError
+
+        try:
+            self.client.complete_multipart_upload(
+                Bucket=self.bucket,
+                Key=key,
+                UploadId=upload_id,
+                MultipartUpload={"Parts": [
+                    {"PartNumber": p["part_number"], "ETag": p["etag"]}
+                    for p in sorted(parts, key=lambda p: p["part_number"])
+                ]},
+            )
+        except ClientError as e:
+            raise StorageError(f"合并分片失败: {e}") from e
+
+    def abort_multipart(self, key: str, upload_id: str):
+        self.client.abort_multipart_upload(Bucket=self.bucket, Key=key, UploadId=upload_id)
+
+
+_storage: Optional[StorageBackend] = None
+
+
+def create_storage() -> StorageBackend:
+    if settings.STORAGE_BACKEND == "local":
+        return LocalStorage(settings.UPLOAD_DIR, settings.UPLOAD_STAGING_DIR)
+    if settings.STORAGE_BACKEND == "s3":
+        return S3Storage(
+            bucket=settings.S3_BUCKET,
+            endpoint_url=settings.S3_ENDPOINT_URL,
+            region=settings.S3_REGION,
+            access_key=settings.S3_ACCESS_KEY,
+            secret_key=settings.S3_SECRET_KEY,
+            public_url=settings.S3_PUBLIC_URL,
+        )
+    raise StorageError(f"未知的存储后端: {settings.STORAGE_BACKEND}")
+
+
+def init_storage() -> StorageBackend:
+    """应用启动时调用：创建后端并检查目录 / 桶"""
+    global _storage
+    _storage = create_storage()
+    _storage.ensure_ready()
+    return _storage
+
+
+def get_storage() -> StorageBackend:
+    """获取存储后端；命令行工具和子进程中首次调用时按配置创建"""
+    global _storage
+    if _storage is None:
+        _storage = create_storage()
+    return _storage
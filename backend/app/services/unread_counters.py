@@ -0,0 +1,246 @@
+"""
+通知未读数缓存
+
+未读数是前端轮询最频繁的数据，这里在内存中按用户维护：
+    未读数 = personal_unread + global_total - global_read
+- 全局广播只需 global_total += 1，不用逐个用户更新
+- 新建个人通知 / 标记已读 / 全部已读时增量更新；新建个人通知同时在写入事务中累加持久化行
+- 首次访问某用户时从持久化表（或通知表）加载，之后不再查询通知表
+- 变化过的用户定期批量写回 notification_counters 表，重启后直接加载
+- 校正任务定期按通知表重算，修复进程崩溃、并发写入等造成的偏差
+
+计数只在事件循环线程中修改；数据库读写在线程池中执行。
+多 worker 部署时每个进程各自维护一份，由校正任务收敛。
+"""
+import asyncio
+import bisect
+import logging
+from collections import Counter
+from typing import Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from ..config import settings
+from ..database import SessionLocal
+from ..models import Notification, NotificationCounter, NotificationRead, NotificationReadState
+from .notification_reads import count_parts, count_unread
+
+logger = logging.getLogger(__name__)
+
+
+class UnreadCounters:
+    def __init__(self):
+        self.global_total: Optional[int] = None  # None 表示未启动，直接查库
+        self._counts: Dict[int, List[int]] = {}  # user_id -> [personal_unread, global_read]
+        self._dirty: Set[int] = set()
+        # 校正时用来判断计数在重算期间是否又发生了变化
+        self._seq = 0
+        self._changed_at: Dict[int, int] = {}
+        self._global_changed_at = 0
+        self._tasks: List[asyncio.Task] = []
+        self.reconciled = 0  # 校正修复过的用户数
+
+    # ---------- 生命周期 ----------
+
+    async def start(self):
+        self.global_total = await run_in_threadpool(self._load_global_total)
+        self._tasks = [
+            asyncio.create_task(self._flush_loop(), name="unread-counter-flush"),
+            asyncio.create_task(self._reconcile_loop(), name="unread-counter-reconcile"),
+        ]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await self.flush()
+
+    @staticmethod
+    def _load_global_total() -> int:
+        db = SessionLocal()
+        try:
+            return db.query(func.count(Notification.id)).filter(Notification.user_id == None).scalar()
+        finally:
+            db.close()
+
+    # ---------- 读取 ----------
+
+    def get(self, db: Session, user_id: int) -> int:
+        if self.global_total is None:
+            return count_unread(db, user_id)
+        entry = self._counts.get(user_id)
+        if entry is None:
+            entry = self._load(db, user_id)
+        return max(0, entry[0] + self.global_total - entry[1])
+
+    def ensure_loaded(self, db: Session, user_id: int):
+        """
+        在修改通知已读状态之前调用（同一请求、提交之前）
+
+        on_read 只对已缓存的用户生效；未缓存的用户先按修改前的状态加载，
+        否则其持久化行不会被扣减，重启后会多算。
+        """
+        if self.global_total is not None and user_id not in self._counts:
+            self._load(db, user_id)
+
+    def _load(self, db: Session, user_id: int) -> List[int]:
+        row = db.query(NotificationCounter).filter(NotificationCounter.user_id == user_id).first()
+        if row is not None:
+            entry = [row.personal_unread, row.global_read]
+        else:
+            entry = list(count_parts(db, user_id))
+            self._dirty.add(user_id)
+        self._counts[user_id] = entry
+        return entry
+
+    # ---------- 增量更新（提交之后调用） ----------
+
+    def _touch(self, user_id: int):
+        self._seq += 1
+        self._changed_at[user_id] = self._seq
+        self._dirty.add(user_id)
+
+    def on_insert(self, user_id: Optional[int]):
+        """新建通知；user_id 为 None 表示全局通知"""
+        if self.global_total is None:
+            return
+        if user_id is None:
+            self._seq += 1
+            self._global_changed_at = self._seq
+            self.global_total += 1
+            return
+        # 未缓存的用户不在这里处理：write_batch 已在同一事务中累加其持久化行，
+        # 没有持久化行的用户首次访问时按通知表重算
+        entry = self._counts.get(user_id)
+        if entry is not None:
+            entry[0] += 1
+            self._touch(user_id)
+
+    def on_read(self, user_id: int, is_global: bool):
+        """一条未读通知被标记为已读；调用前须已 ensure_loaded"""
+        entry = self._counts.get(user_id)
+        if entry is None:
+            return
+        if is_global:
+            entry[1] += 1
+        else:
+            entry[0] = max(0, entry[0] - 1)
+        self._touch(user_id)
+
+    def on_read_all(self, user_id: int):
+        if self.global_total is None:
+            return
+        self._counts[user_id] = [0, self.global_total]
+        self._touch(user_id)
+
+    # ---------- 持久化 ----------
+
+    async def flush(self):
+        if not self._dirty:
+            return
+        batch = {uid: tuple(self._counts[uid]) for uid in self._dirty if uid in self._counts}
+        self._dirty = set()
+        try:
+            await run_in_threadpool(self._write, batch)
+        except Exception as e:
+            logger.warning("Unread counter flush failed: %s", e)
+            self._dirty.update(batch)
+
+    @staticmethod
+    def _write(batch: Dict[int, Tuple[int, int]]):
+        db = SessionLocal()
+        try:
+            existing = {
+                row.user_id: row for row in db.query(NotificationCounter).filter(
+                    NotificationCounter.user_id.in_(list(batch))
+                )
+            }
+            for user_id, (personal_unread, global_read) in batch.items():
+                row = existing.get(user_id)
+                if row is None:
+                    db.add(NotificationCounter(
+                        user_id=user_id, personal_unread=personal_unread, global_read=global_read
+                    ))
+                else:
+                    row.personal_unread = personal_unread
+                    row.global_read = global_read
+            db.commit()
+        finally:
+            db.close()
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(settings.NOTIFY_COUNTER_FLUSH_SECONDS)
+            await self.flush()
+
+    # ---------- 校正 ----------
+
+    async def reconcile(self) -> int:
+        """按通知表重算所有已缓存 / 已持久化用户的计数，返回修复的用户数"""
+        started_at = self._seq
+        global_total, actual, persisted = await run_in_threadpool(self._compute_all, list(self._counts))
+
+        fixed = 0
+        if self._global_changed_at <= started_at:
+            self.global_total = global_total
+        for user_id, values in actual.items():
+            # 重算期间又有变化的用户留到下一轮
+            if self._changed_at.get(user_id, 0) > started_at:
+                continue
+            current = self._counts.get(user_id, persisted.get(user_id))
+            if current != values:
+                self._counts[user_id] = values
+                self._dirty.add(user_id)
+                fixed += 1
+        self.reconciled += fixed
+        if fixed:
+            logger.info("Reconciled unread counters for %d users", fixed)
+        await self.flush()
+        return fixed
+
+    @classmethod
+    def _compute_all(cls, cached: List[int]):
+        """线程池中执行：一次性算出所有相关用户的真实计数"""
+        db = SessionLocal()
+        try:
+            persisted = {
+                row.user_id: [row.personal_unread, row.global_read]
+                for row in db.query(NotificationCounter)
+            }
+            global_ids = [row[0] for row in db.query(Notification.id).filter(
+                Notification.user_id == None
+            ).order_by(Notification.id.asc())]
+            user_ids = set(cached) | set(persisted)
+            if not user_ids:
+                return len(global_ids), {}, persisted
+
+            personal = dict(db.query(Notification.user_id, func.count(Notification.id)).filter(
+                Notification.user_id != None,
+                Notification.is_read == False
+            ).group_by(Notification.user_id).all())
+            watermarks = dict(db.query(NotificationReadState.user_id, NotificationReadState.last_read_id).all())
+            sparse = Counter(dict(db.query(
+                NotificationRead.user_id, func.count(NotificationRead.notification_id)
+            ).group_by(NotificationRead.user_id).all()))
+
+            actual = {}
+            for user_id in user_ids:
+                global_read = bisect.bisect_right(global_ids, watermarks.get(user_id, 0)) + sparse[user_id]
+                actual[user_id] = [personal.get(user_id, 0), global_read]
+            return len(global_ids), actual, persisted
+        finally:
+            db.close()
+
+    async def _reconcile_loop(self):
+        while True:
+            await asyncio.sleep(settings.NOTIFY_COUNTER_RECONCILE_SECONDS)
+            try:
+                await self.reconcile()
+            except Exception as e:
+                logger.warning("Unread counter reconcile failed: %s", e)
+
+
+unread_counters = UnreadCounters()
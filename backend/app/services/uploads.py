@@ -0,0 +1,287 @@
+"""
+流式文件上传
+
+直接从请求体流式解析 multipart，不经过 Starlette 的整体表单解析：
+- 按块写入临时文件（anyio 异步文件 I/O），不阻塞事件循环
+- 边接收边累计大小，超过上限立即中止
+- 根据文件头魔数识别真实类型，不信任客户端的 content_type 和扩展名
+- 边写边计算 sha256
+- 中途失败会删除临时文件；接收完成后由调用方移入存储后端
+"""
+import hashlib
+import os
+import uuid
+from dataclasses import dataclass
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+import anyio
+from fastapi import Request
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ModuleNotFoundError:  # python-multipart < 0.0.13
+    from multipart.multipart import MultipartParser, parse_options_header
+
+# 识别所需的最少字节数
+SNIFF_BYTES = 32
+
+# multipart 边界、头部等额外开销的估计上限
+MULTIPART_OVERHEAD = 16 * 1024
+
+
+class UploadError(Exception):
+    """上传失败（请求格式错误等）"""
+    status_code = 400
+
+
+class UploadTooLargeError(UploadError):
+    status_code = 413
+
+
+class UnsupportedFileTypeError(UploadError):
+    status_code = 415
+
+
+@dataclass
+class StoredUpload:
+    filename: str
+    path: str
+    size: int
+    sha256: str
+    content_type: str
+    ext: str
+    deduplicated: bool = False  # 目标文件已存在（内容相同），未重复写入
+
+
+# 支持的图片类型及其扩展名
+IMAGE_TYPES = {
+    "image/jpeg": ".jpg",
+    "image/png": ".png",
+    "image/gif": ".gif",
+    "image/webp": ".webp",
+    "image/avif": ".avif",
+}
+
+
+def sniff_image_type(head: bytes) -> Optional[Tuple[str, str]]:
+    """根据魔数返回 (mime, 扩展名)，不是支持的图片格式时返回 None"""
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg", ".jpg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png", ".png"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif", ".gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp", ".webp"
+    if head[4:8] == b"ftyp" and head[8:12] in (b"avif", b"avis"):
+        return "image/avif", ".avif"
+    return None
+
+
+def generate_filename(ext: str) -> str:
+    return f"{datetime.now().strftime('%Y%m%d%H%M%S')}_{uuid.uuid4().hex[:8]}{ext}"
+
+
+class _PartCollector:
+    """python-multipart 回调是同步的，这里只收集事件，由协程异步处理"""
+
+    def __init__(self, field_name: str):
+        self.field_name = field_name
+        self.events: List[Tuple[str, bytes]] = []
+        self._header_field = b""
+        self._header_value = b""
+        self._disposition = b""
+        self._in_target = False
+
+    def callbacks(self) -> dict:
+        return {
+            "on_part_begin": self.on_part_begin,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+        }
+
+    def on_part_begin(self):
+        self._disposition = b""
+        self._in_target = False
+
+    def on_header_field(self, data: bytes, start: int, end: int):
+        self._header_field += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def on_header_end(self):
+        if self._header_field.lower() == b"content-disposition":
+            self._disposition = self._header_value
+        self._header_field = b""
+        self._header_value = b""
+
+    def on_headers_finished(self):
+        _, options = parse_options_header(self._disposition)
+        name = options.get(b"name", b"").decode("latin-1")
+        self._in_target = name == self.field_name and b"filename" in options
+        if self._in_target:
+            self.events.append(("begin", b""))
+
+    def on_part_data(self, data: bytes, start: int, end: int):
+        if self._in_target:
+            self.events.append(("data", data[start:end]))
+
+    def on_part_end(self):
+        if self._in_target:
+            self.events.append(("end", b""))
+            self._in_target = False
+
+
+class _FileSink:
+    """按块写入临时文件：累计大小、识别类型、计算 sha256"""
+
+    def __init__(self, path: str, max_bytes: int, sniff: bool = True):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.sniff = sniff
+        self.hasher = hashlib.sha256()
+        self.size = 0
+        self.head = b""
+        self.sniffed: Optional[Tuple[str, str]] = None
+        self._out = None
+
+    async def open(self):
+        self._out = await anyio.open_file(self.path, "wb")
+
+    async def write(self, data: bytes):
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            raise UploadTooLargeError(f"文件大小不能超过 {self.max_bytes // (1024 * 1024)}MB")
+        if self.sniff and self.sniffed is None:
+            self.head += data[:SNIFF_BYTES]
+            if len(self.head) >= SNIFF_BYTES:
+                self.sniffed = sniff_image_type(self.head)
+                if self.sniffed is None:
+                    raise UnsupportedFileTypeError("只能上传图片文件")
+        self.hasher.update(data)
+        await self._out.write(data)
+
+    async def close(self):
+        if self._out is not None:
+            await self._out.aclose()
+            self._out = None
+        if self.sniff and self.sniffed is None:
+            # 文件小于 SNIFF_BYTES 的情况
+            self.sniffed = sniff_image_type(self.head)
+            if self.sniffed is None:
+                raise UnsupportedFileTypeError("只能上传图片文件")
+
+    async def discard(self):
+        if self._out is not None:
+            await self._out.aclose()
+            self._out = None
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def _check_content_length(request: Request, max_bytes: int, overhead: int = 0):
+    # 声明的长度已经超限时，不读请求体直接拒绝
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > max_bytes + overhead:
+        raise UploadTooLargeError(f"文件大小不能超过 {max_bytes // (1024 * 1024)}MB")
+
+
+async def receive_image_upload(
+    request: Request,
+    directory: str,
+    max_bytes: int,
+    field_name: str = "file",
+) -> StoredUpload:
+    """
+    从 multipart 请求体中流式接收一张图片，保存为 directory 下的临时文件
+
+    返回的 path 由调用方移入存储（或删除）。
+
+    Raises:
+        UploadTooLargeError / UnsupportedFileTypeError / UploadError
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in params:
+        raise UploadError("请使用 multipart/form-data 上传文件")
+    _check_content_length(request, max_bytes, MULTIPART_OVERHEAD)
+
+    collector = _PartCollector(field_name)
+    parser = MultipartParser(params[b"boundary"], collector.callbacks())
+
+    os.makedirs(directory, exist_ok=True)
+    sink = _FileSink(os.path.join(directory, f".{uuid.uuid4().hex}.part"), max_bytes)
+    state = "waiting"  # waiting -> receiving -> done
+
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+            for event, data in collector.events:
+                if state == "done":
+                    break
+                if event == "begin":
+                    await sink.open()
+                    state = "receiving"
+                elif event == "end":
+                    state = "done"
+                else:
+                    await sink.write(data)
+            collector.events.clear()
+        parser.finalize()
+
+        if state != "done":
+            raise UploadError("未找到上传的文件")
+        await sink.close()
+    except BaseException:
+        await sink.discard()
+        raise
+
+    mime, ext = sink.sniffed
+    return StoredUpload(
+        filename=os.path.basename(sink.path),
+        path=sink.path,
+        size=sink.size,
+        sha256=sink.hasher.hexdigest(),
+        content_type=mime,
+        ext=ext,
+    )
+
+
+async def receive_raw_upload(
+    request: Request,
+    directory: str,
+    max_bytes: int,
+    sniff: bool = True,
+) -> StoredUpload:
+    """
+    流式接收原始请求体（PUT 直传），保存为 directory 下的临时文件
+
+    sniff=False 用于分片上传的中间分片，此时不识别文件类型。
+    """
+    _check_content_length(request, max_bytes)
+    os.makedirs(directory, exist_ok=True)
+    sink = _FileSink(os.path.join(directory, f".{uuid.uuid4().hex}.part"), max_bytes, sniff=sniff)
+    try:
+        await sink.open()
+        async for chunk in request.stream():
+            if chunk:
+                await sink.write(chunk)
+        await sink.close()
+    except BaseException:
+        await sink.discard()
+        raise
+
+    mime, ext = sink.sniffed if sink.sniffed else ("application/octet-stream", "")
+    return StoredUpload(
+        filename=os.path.basename(sink.path),
+        path=sink.path,
+        size=sink.size,
+        sha256=sink.hasher.hexdigest(),
+        content_type=mime,
+        ext=ext,
+    )
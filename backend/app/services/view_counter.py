@@ -0,0 +1,155 @@
+"""
+商品浏览量（写回缓冲）
+
+商品详情是访问量最大的接口，不能每次浏览都写一次库：
+- 浏览只在内存中累加 product_id -> 待写入次数
+- 后台任务每 VIEW_FLUSH_SECONDS 秒（或待写入总数超过 VIEW_FLUSH_THRESHOLD 时）
+  用一条批量 UPDATE view_count = view_count + n 写回
+- 进程崩溃最多丢失一个写回周期内的浏览数
+- 同一访客（登录用户按 user_id，游客按 IP + User-Agent）在 VIEW_DEDUP_SECONDS 内
+  重复浏览同一商品只计一次；常见爬虫 User-Agent 不计数
+
+计数只在事件循环线程中修改，数据库写入在线程池中执行。
+"""
+import asyncio
+import hashlib
+import logging
+import re
+import time
+from collections import OrderedDict, defaultdict
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import bindparam, func, update
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+
+from ..config import settings
+from ..database import SessionLocal
+from ..models import Product
+from ..utils.security import verify_token
+
+logger = logging.getLogger(__name__)
+
+_BOT_RE = re.compile(r"bot|crawl|spider|slurp|curl|wget|python-requests|httpclient|headless", re.IGNORECASE)
+
+
+def viewer_key(request: Request) -> Optional[str]:
+    """访客标识；爬虫返回 None（不计数）"""
+    user_agent = request.headers.get("user-agent", "")
+    if _BOT_RE.search(user_agent):
+        return None
+    auth = request.headers.get("authorization", "")
+    if auth.lower().startswith("bearer "):
+        payload = verify_token(auth[7:])
+        if payload and payload.get("sub"):
+            return f"u:{payload['sub']}"
+    host = request.client.host if request.client else ""
+    digest = hashlib.sha1(f"{host}|{user_agent}".encode("utf-8")).hexdigest()[:16]
+    return f"a:{digest}"
+
+
+class ViewCounter:
+    def __init__(self, flush_interval: float, flush_threshold: int, dedup_seconds: float, max_seen: int):
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+        self.dedup_seconds = dedup_seconds
+        self.max_seen = max_seen
+        self._pending: Dict[int, int] = defaultdict(int)
+        self._pending_total = 0
+        # (访客, 商品) -> 过期时间；按写入顺序排列，过期的总在前面
+        self._seen: "OrderedDict[Tuple[str, int], float]" = OrderedDict()
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self.flushed = 0
+        self.deduplicated = 0
+
+    # ---------- 生命周期 ----------
+
+    async def start(self):
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._flush_loop(), name="view-counter-flush")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    # ---------- 计数 ----------
+
+    def record(self, product_id: int, viewer: Optional[str]) -> bool:
+        """记录一次浏览，返回是否计数"""
+        if viewer is None:
+            return False
+        now = time.monotonic()
+        while self._seen:
+            expires_at = next(iter(self._seen.values()))
+            if expires_at > now and len(self._seen) < self.max_seen:
+                break
+            self._seen.popitem(last=False)
+
+        key = (viewer, product_id)
+        if key in self._seen:
+            self.deduplicated += 1
+            return False
+        self._seen[key] = now + self.dedup_seconds
+
+        self._pending[product_id] += 1
+        self._pending_total += 1
+        if self._pending_total >= self.flush_threshold and self._wake is not None:
+            self._wake.set()
+        return True
+
+    def pending(self, product_id: int) -> int:
+        """尚未写回的浏览数，接口返回 view_count 时加上"""
+        return self._pending.get(product_id, 0)
+
+    # ---------- 写回 ----------
+
+    async def flush(self):
+        if not self._pending:
+            return
+        batch = dict(self._pending)
+        self._pending = defaultdict(int)
+        self._pending_total = 0
+        try:
+            await run_in_threadpool(self._write, batch)
+            self.flushed += sum(batch.values())
+        except Exception as e:
+            logger.warning("View counter flush failed: %s", e)
+            for product_id, count in batch.items():
+                self._pending[product_id] += count
+                self._pending_total += count
+
+    @staticmethod
+    def _write(batch: Dict[int, int]):
+        table = Product.__table__
+        # 显式保留 updated_at：浏览量变化不算商品内容变更
+        stmt = update(table).where(table.c.id == bindparam("pid")).values(
+            view_count=func.coalesce(table.c.view_count, 0) + bindparam("n"),
+            updated_at=table.c.updated_at,
+        )
+        db = SessionLocal()
+        try:
+            db.execute(stmt, [{"pid": pid, "n": n} for pid, n in batch.items()])
+            db.commit()
+        finally:
+            db.close()
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+
+
+view_counter = ViewCounter(
+    flush_interval=settings.VIEW_FLUSH_SECONDS,
+    flush_threshold=settings.VIEW_FLUSH_THRESHOLD,
+    dedup_seconds=settings.VIEW_DEDUP_SECONDS,
+    max_seen=settings.VIEW_DEDUP_MAX_ENTRIES,
+)
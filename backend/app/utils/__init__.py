@@ -4,6 +4,7 @@ from .security import (
     hash_password,
     create_access_token,
     create_refresh_token,
+    create_upload_token,
     decode_token,
     verify_token,
 )
@@ -14,6 +15,7 @@ __all__ = [
     "hash_password",
     "create_access_token",
     "create_refresh_token",
+    "create_upload_token",
     "decode_token",
     "verify_token",
     "success_response",
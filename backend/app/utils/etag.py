@@ -0,0 +1,33 @@
+"""
+乐观并发控制：版本号与 ETag / If-Match
+
+Product、Order、Refund 的 version 列由 SQLAlchemy version_id_col 维护，
+ETag 直接由版本号生成。修改接口读取 If-Match：与当前版本不一致时返回 409，
+未提供时不做前置检查（提交时仍由 version_id_col 检测并发修改）。
+"""
+from typing import Optional
+
+from fastapi import HTTPException, Response, status
+
+from .response import ErrorMessage
+
+
+def etag_for(version: int) -> str:
+    return f'"{version}"'
+
+
+def set_etag(response: Response, version: int):
+    response.headers["ETag"] = etag_for(version)
+
+
+def check_if_match(if_match: Optional[str], version: int):
+    """If-Match 不包含当前版本时抛出 409"""
+    if not if_match or if_match.strip() == "*":
+        return
+    tags = [tag.strip().removeprefix("W/") for tag in if_match.split(",")]
+    if etag_for(version) not in tags:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=ErrorMessage.VERSION_CONFLICT,
+            headers={"ETag": etag_for(version)},
+        )
@@ -93,3 +93,4 @@ class ErrorMessage:
     ADDRESS_NOT_FOUND = "地址不存在"
     CART_EMPTY = "购物车为空"
     CANNOT_CANCEL_ORDER = "无法取消该订单"
+    VERSION_CONFLICT = "数据已被其他人修改，请刷新后重试"
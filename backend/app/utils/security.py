@@ -60,6 +60,22 @@ def create_refresh_token(data: dict) -> str:
     return encoded_jwt
 
 
+def create_upload_token(data: dict, expires_delta: timedelta) -> str:
+    """
+    创建直传授权 Token（本地存储后端的预签名上传 URL）
+
+    Args:
+        data: 要编码的数据（目标 key、操作类型等）
+        expires_delta: 过期时间增量
+
+    Returns:
+        JWT token 字符串
+    """
+    to_encode = data.copy()
+    to_encode.update({"exp": datetime.utcnow() + expires_delta, "type": "upload"})
+    return jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
+
+
 def decode_token(token: str) -> Optional[dict]:
     """
     解码 JWT Token
@@ -0,0 +1,131 @@
+"""
+订单导出基准
+
+在临时目录的 SQLite 数据库中生成订单（默认 100 万个，每单 1~2 个明细），分别导出
+CSV、JSONL，记录耗时、输出大小、峰值内存增量；再导出一次 CSV，期间另一个线程每 200ms
+写一次库，记录写入的最大耗时与失败次数（验证下载过程中不持有数据库锁）。
+
+    cd backend && python -m benchmarks.order_export --orders 1000000
+
+不使用 suju.db；生成 100 万订单约需 1 分钟。
+"""
+import argparse
+import multiprocessing
+import os
+import resource
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+_TMP_DIR = tempfile.mkdtemp(prefix="suju-bench-")
+os.environ["DATABASE_URL"] = f"sqlite:///{_TMP_DIR}/bench.db"
+
+from sqlalchemy import insert, update  # noqa: E402
+
+import app.models  # noqa: E402,F401  注册全部模型
+from app.database import Base, SessionLocal, engine  # noqa: E402
+from app.models import Category, Order, OrderItem, Product, User  # noqa: E402
+from app.services.order_export import export_orders  # noqa: E402
+
+SEED_BATCH = 20000
+
+
+def seed(orders: int):
+    Base.metadata.create_all(bind=engine)
+    engine.dispose()
+    db = SessionLocal()
+    try:
+        db.add(Category(id=1, name="基准"))
+        db.add(User(id=1, username="bench", email="bench@example.com", password_hash="x"))
+        db.execute(insert(Product), [
+            {"id": i, "name": f"商品{i}", "price": 10, "stock": 10 ** 9, "category_id": 1}
+            for i in range(1, 101)
+        ])
+        db.commit()
+
+        start = datetime(2024, 1, 1)
+        item_id = 0
+        for offset in range(0, orders, SEED_BATCH):
+            order_rows, item_rows = [], []
+            for order_id in range(offset + 1, min(offset + SEED_BATCH, orders) + 1):
+                order_rows.append({
+                    "id": order_id, "order_number": f"B{order_id:010d}", "user_id": 1,
+                    "total_amount": 20, "status": "completed",
+                    "created_at": start + timedelta(seconds=order_id * 30),
+                })
+                for n in range(1 + order_id % 2):
+                    item_id += 1
+                    item_rows.append({
+                        "id": item_id, "order_id": order_id, "product_id": 1 + item_id % 100,
+                        "product_name": "商品", "unit_price": 10, "quantity": 1, "subtotal": 10,
+                    })
+            db.execute(insert(Order), order_rows)
+            db.execute(insert(OrderItem), item_rows)
+            db.commit()
+    finally:
+        db.close()
+
+
+def _writer(stop: threading.Event, stats: dict):
+    """模拟下载期间其他请求的写入"""
+    while not stop.is_set():
+        started = time.perf_counter()
+        db = SessionLocal()
+        try:
+            db.execute(update(Product).where(Product.id == 1).values(stock=Product.stock - 1))
+            db.commit()
+            stats["writes"] += 1
+        except Exception:
+            stats["failed"] += 1
+        finally:
+            db.close()
+        stats["max_latency"] = max(stats["max_latency"], time.perf_counter() - started)
+        stop.wait(0.2)
+
+
+def run(fmt: str, concurrent_writes: bool = False):
+    stats = {"writes": 0, "failed": 0, "max_latency": 0.0}
+    stop = threading.Event()
+    writer = threading.Thread(target=_writer, args=(stop, stats))
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    started = time.perf_counter()
+    if concurrent_writes:
+        writer.start()
+    size = 0
+    try:
+        for chunk in export_orders(fmt):
+            size += len(chunk)
+    finally:
+        stop.set()
+        if concurrent_writes:
+            writer.join()
+    elapsed = time.perf_counter() - started
+    rss_growth = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before
+    line = f"{fmt:5s}  {size / 2 ** 20:8.1f} MB  {elapsed:6.1f} s  peak RSS +{rss_growth / 1024:.0f} MB"
+    if concurrent_writes:
+        line += (
+            f"  concurrent writes {stats['writes']} ok / {stats['failed']} failed, "
+            f"max {stats['max_latency'] * 1000:.0f} ms"
+        )
+    print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--orders", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    # 在子进程中生成数据，避免生成过程的内存占用计入导出的峰值
+    started = time.perf_counter()
+    seeder = multiprocessing.get_context("fork").Process(target=seed, args=(args.orders,))
+    seeder.start()
+    seeder.join()
+    print(f"seeded {args.orders} orders in {time.perf_counter() - started:.1f} s ({_TMP_DIR})")
+    for fmt in ("csv", "jsonl"):
+        run(fmt)
+    run("csv", concurrent_writes=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+并发上传基准
+
+在一个事件循环中同时接收 N 个 10MB 的 multipart 上传（请求体按 64KB 分块送入），对比：
+- stream：receive_image_upload（流式解析，异步写入临时文件，边写边算 sha256）
+- form：旧实现的做法，await request.form() 整体解析后在协程中同步 shutil.copyfileobj
+
+记录总耗时、吞吐量，以及事件循环的最大延迟（另一个协程每 10ms 醒来一次，
+记录实际醒来时间与预期的最大差值，反映其他请求会被卡住多久）。
+
+    cd backend && python -m benchmarks.uploads --concurrency 20
+
+临时文件写在系统临时目录，结束后删除。
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+
+from starlette.requests import Request
+
+from app.services.uploads import receive_image_upload
+
+BOUNDARY = "----suju-bench-boundary"
+CHUNK = 64 * 1024
+FILE_BYTES = 10 * 1024 * 1024
+
+
+def multipart_body(data: bytes) -> bytes:
+    return b"".join([
+        f"--{BOUNDARY}\r\n".encode(),
+        b'Content-Disposition: form-data; name="file"; filename="bench.png"\r\n',
+        b"Content-Type: image/png\r\n\r\n",
+        data,
+        f"\r\n--{BOUNDARY}--\r\n".encode(),
+    ])
+
+
+def make_request(body: bytes) -> Request:
+    offsets = iter(range(0, len(body), CHUNK))
+
+    async def receive():
+        offset = next(offsets, None)
+        if offset is None:
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await asyncio.sleep(0)  # 模拟逐块到达的网络数据，给其他协程调度机会
+        return {"type": "http.request", "body": body[offset:offset + CHUNK], "more_body": True}
+
+    scope = {
+        "type": "http",
+        "method": "POST",
+        "path": "/v1/upload",
+        "headers": [
+            (b"content-type", f"multipart/form-data; boundary={BOUNDARY}".encode()),
+            (b"content-length", str(len(body)).encode()),
+        ],
+    }
+    return Request(scope, receive)
+
+
+async def upload_stream(body: bytes, directory: str):
+    stored = await receive_image_upload(make_request(body), directory, FILE_BYTES)
+    os.remove(stored.path)
+
+
+async def upload_form(body: bytes, directory: str):
+    form = await make_request(body).form(max_part_size=FILE_BYTES * 2)
+    upload = form["file"]
+    path = os.path.join(directory, f"{id(upload)}.png")
+    with open(path, "wb") as out:
+        shutil.copyfileobj(upload.file, out)
+    await form.close()
+    os.remove(path)
+
+
+async def _ticker(stop: asyncio.Event, lag: list):
+    interval = 0.01
+    while not stop.is_set():
+        expected = time.perf_counter() + interval
+        await asyncio.sleep(interval)
+        lag[0] = max(lag[0], time.perf_counter() - expected)
+
+
+async def run(name: str, handler, concurrency: int, body: bytes, directory: str):
+    stop, lag = asyncio.Event(), [0.0]
+    ticker = asyncio.create_task(_ticker(stop, lag))
+    started = time.perf_counter()
+    await asyncio.gather(*(handler(body, directory) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await ticker
+    total_mb = concurrency * FILE_BYTES / 2 ** 20
+    print(
+        f"{name:6s}  {concurrency} x 10 MB  {elapsed:6.2f} s  {total_mb / elapsed:7.1f} MB/s  "
+        f"max event loop lag {lag[0] * 1000:6.1f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--concurrency", type=int, default=20)
+    args = parser.parse_args()
+
+    data = b"\x89PNG\r\n\x1a\n" + os.urandom(FILE_BYTES - 8)
+    body = multipart_body(data)
+    directory = tempfile.mkdtemp(prefix="suju-bench-uploads-")
+    try:
+        asyncio.run(run("stream", upload_stream, args.concurrency, body, directory))
+        asyncio.run(run("form", upload_form, args.concurrency, body, directory))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
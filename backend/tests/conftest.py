@@ -0,0 +1,74 @@
+"""
+测试公共配置
+
+测试使用临时目录中的独立 SQLite 数据库（在导入 app 之前设置 DATABASE_URL），
+每个用例重新建表，不会碰到开发环境的 suju.db。
+"""
+import os
+import tempfile
+from contextlib import contextmanager
+
+_TMP_DIR = tempfile.mkdtemp(prefix="suju-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{_TMP_DIR}/test.db"
+
+import pytest
+from sqlalchemy import event
+
+import app.models  # noqa: F401  注册全部模型
+from app.database import Base, SessionLocal, engine
+from app.models import Category, Product, User
+
+
+@pytest.fixture
+def db():
+    Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+        Base.metadata.drop_all(bind=engine)
+
+
+@pytest.fixture
+def make_user(db):
+    def make(username: str) -> User:
+        user = User(username=username, email=f"{username}@example.com", password_hash="x")
+        db.add(user)
+        db.commit()
+        return user
+    return make
+
+
+@pytest.fixture
+def make_product(db):
+    category = []
+
+    def make(name: str, stock: int = 100, sales_count: int = 0) -> Product:
+        if not category:
+            category.append(Category(name="测试分类"))
+            db.add(category[0])
+            db.flush()
+        product = Product(name=name, price=100, stock=stock, sales_count=sales_count, category_id=category[0].id)
+        db.add(product)
+        db.commit()
+        return product
+    return make
+
+
+@pytest.fixture
+def count_statements():
+    """用法：with count_statements() as statements: ...，结束后 len(statements) 为执行的 SQL 条数"""
+    @contextmanager
+    def counter():
+        statements = []
+
+        def listener(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(engine, "before_cursor_execute", listener)
+        try:
+            yield statements
+        finally:
+            event.remove(engine, "before_cursor_execute", listener)
+    return counter
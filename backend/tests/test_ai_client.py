@@ -0,0 +1,130 @@
+"""
+AI 上游客户端：用 httpx.MockTransport 模拟上游，覆盖重试与熔断
+"""
+import asyncio
+
+import httpx
+import pytest
+
+from app.config import settings
+from app.services.ai_client import (
+    AIUpstreamClient, AIUpstreamError, CircuitBreaker, CircuitOpenError,
+)
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(settings, "AI_HTTP_RETRY_BACKOFF", 0.0)
+
+
+def make_client(responses):
+    """按顺序返回 responses 中的响应（或抛出其中的异常），记录调用次数"""
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        item = responses[min(len(calls), len(responses)) - 1]
+        if isinstance(item, Exception):
+            raise item
+        return item
+
+    client = AIUpstreamClient(base_url="http://upstream.test/v1/chat", api_key="k",
+                              transport=httpx.MockTransport(handler))
+    return client, calls
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+# ---------- 熔断器 ----------
+
+def test_breaker_opens_after_threshold():
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=60)
+    for _ in range(2):
+        breaker.record_failure()
+        assert breaker.state == CircuitBreaker.CLOSED
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow_request()
+
+
+def test_breaker_half_open_allows_single_probe():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+    breaker.record_failure()
+    breaker.opened_at -= 61
+
+    assert breaker.allow_request()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow_request()  # 试探请求尚未返回
+
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.failures == 0
+    assert breaker.allow_request()
+
+
+def test_breaker_failed_probe_reopens():
+    breaker = CircuitBreaker(failure_threshold=5, reset_timeout=60)
+    for _ in range(5):
+        breaker.record_failure()
+    breaker.opened_at -= 61
+    assert breaker.allow_request()
+
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow_request()
+
+
+# ---------- 重试 ----------
+
+def test_retries_on_5xx_then_succeeds():
+    client, calls = make_client([
+        httpx.Response(503),
+        httpx.Response(502),
+        httpx.Response(200, json={"choices": []}),
+    ])
+    assert run(client.chat_completion({})) == {"choices": []}
+    assert len(calls) == 3
+    assert client.metrics.retries == 2
+    assert client.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_retries_on_transport_error():
+    client, calls = make_client([
+        httpx.ConnectError("refused"),
+        httpx.Response(200, json={"ok": True}),
+    ])
+    assert run(client.chat_completion({})) == {"ok": True}
+    assert len(calls) == 2
+
+
+def test_4xx_is_not_retried_and_not_counted_by_breaker():
+    client, calls = make_client([httpx.Response(400)])
+    with pytest.raises(AIUpstreamError):
+        run(client.chat_completion({}))
+    assert len(calls) == 1
+    assert client.breaker.failures == 0
+
+
+def test_exhausted_retries_open_breaker(monkeypatch):
+    monkeypatch.setattr(settings, "AI_CIRCUIT_FAILURE_THRESHOLD", 2)
+    client, calls = make_client([httpx.Response(500)])
+
+    for _ in range(2):
+        with pytest.raises(AIUpstreamError):
+            run(client.chat_completion({}))
+    assert len(calls) == 2 * (settings.AI_HTTP_MAX_RETRIES + 1)
+    assert client.breaker.state == CircuitBreaker.OPEN
+
+    # 熔断期间不再请求上游
+    with pytest.raises(CircuitOpenError):
+        run(client.chat_completion({}))
+    assert len(calls) == 2 * (settings.AI_HTTP_MAX_RETRIES + 1)
+    assert client.metrics.rejected == 1
+
+
+def test_retry_after_header_is_respected():
+    client, _ = make_client([])
+    assert client._backoff(0, "3") == 3.0
+    assert client._backoff(0, "999") == settings.AI_HTTP_RETRY_BACKOFF_MAX
@@ -0,0 +1,57 @@
+"""
+AI 任务队列：排队名额预留、跨进程任务的长轮询
+"""
+import asyncio
+import time
+
+import pytest
+
+from app.config import settings
+from app.models import AIChatJob, AIChatSession
+from app.services.ai_jobs import AIJobQueue, QueueFullError
+
+
+@pytest.fixture
+def queue():
+    queue = AIJobQueue(concurrency=1, max_pending_per_user=2)
+    queue._available = asyncio.Semaphore(0)
+    return queue
+
+
+def test_reserve_counts_against_capacity(queue):
+    """预留在 await 之前同步完成，并发请求中超出名额的一个立即得到 QueueFullError"""
+    queue.reserve(1)
+    queue.reserve(1)
+    with pytest.raises(QueueFullError):
+        queue.reserve(1)
+    queue.reserve(2)  # 其他用户不受影响
+
+    queue.submit("a", 1)  # 预留转为排队，不再重复检查
+    assert queue.pending_count(1) == 2
+    queue.release(1)  # 写入失败时归还
+    assert queue.pending_count(1) == 1
+    queue.reserve(1)
+
+
+@pytest.fixture
+def remote_job(db, make_user, monkeypatch):
+    """不在本进程队列中的任务（由其他 worker 进程处理）"""
+    monkeypatch.setattr(settings, "AI_JOB_POLL_SECONDS", 0.02)
+    user = make_user("alice")
+    session = AIChatSession(user_id=user.id, session_token="s")
+    db.add(session)
+    db.flush()
+    job = AIChatJob(id="remote", user_id=user.id, session_id=session.id, user_message_id=1, status="queued")
+    db.add(job)
+    db.commit()
+    return job
+
+
+def test_wait_polls_jobs_of_other_processes(db, queue, remote_job):
+    started = time.monotonic()
+    assert asyncio.run(queue.wait("remote", 0.1)) is False
+    assert time.monotonic() - started >= 0.1  # 等到超时，而不是立即返回
+
+    remote_job.status = "succeeded"
+    db.commit()
+    assert asyncio.run(queue.wait("remote", 5)) is True
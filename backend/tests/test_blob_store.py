@@ -0,0 +1,25 @@
+"""
+内容寻址存储：去重登记与垃圾回收宽限期
+"""
+from datetime import datetime, timedelta
+
+from app.models import UploadBlob
+from app.services.blob_store import blob_relpath, collect_garbage, register_blob
+from app.services.uploads import StoredUpload
+
+SHA = "ab" * 32
+
+
+def stored() -> StoredUpload:
+    return StoredUpload(filename=f"{SHA}.png", path="", size=10, sha256=SHA, content_type="image/png", ext=".png")
+
+
+def test_reupload_of_orphan_restarts_grace_period(db):
+    db.add(UploadBlob(sha256=SHA, ext=".png", size=10, content_type="image/png", ref_count=0,
+                      created_at=datetime.now() - timedelta(days=30)))
+    db.commit()
+    assert collect_garbage(db, timedelta(days=1), dry_run=True) == [blob_relpath(SHA, ".png")]
+
+    # 去重命中：表单提交前同样受宽限期保护
+    register_blob(db, stored(), uploader_id=None)
+    assert collect_garbage(db, timedelta(days=1), dry_run=True) == []
@@ -0,0 +1,36 @@
+"""
+通知批量写入：合并规则、每批固定的 SQL 条数
+"""
+from app.services.notification_dispatcher import NotificationEvent, coalesce, write_batch
+
+
+def order_event(order_id, title, user_id=1):
+    return NotificationEvent(user_id=user_id, type="order_status", title=title, related_id=order_id)
+
+
+def test_coalesce_keeps_distinct_order_statuses():
+    events = [
+        order_event(1, "订单已发货"),
+        order_event(1, "订单已完成"),
+        order_event(1, "订单已发货"),  # 重复事件合并为最后一条
+        order_event(2, "订单已发货"),
+        NotificationEvent(user_id=None, type="new_product", title="新商品上架"),
+        NotificationEvent(user_id=None, type="new_product", title="新商品上架"),  # 无关联对象，不合并
+    ]
+    merged = coalesce(events)
+    assert [(e.related_id, e.title) for e in merged] == [
+        (1, "订单已完成"), (1, "订单已发货"), (2, "订单已发货"), (None, "新商品上架"), (None, "新商品上架"),
+    ]
+
+
+def test_write_batch_statement_count_is_constant(db, make_user, count_statements):
+    users = [make_user(f"u{i}") for i in range(3)]
+    events = [order_event(i, "订单已发货", user_id=users[i % 3].id) for i in range(30)]
+
+    with count_statements() as statements:
+        rows = write_batch(events)
+    # INSERT ... RETURNING 与未读数持久化行的 executemany 各一条，提交后不再逐行 SELECT
+    assert [s.split()[0] for s in statements] == ["INSERT", "UPDATE"]
+
+    assert len(rows) == 30
+    assert all(row.id and row.created_at for row in rows)  # 已脱离会话，属性仍可读取
@@ -0,0 +1,67 @@
+"""
+SSE 推送 hub：定向投递、广播、慢连接背压、每用户连接数上限
+"""
+import asyncio
+
+from app.services.notification_hub import MemoryBroker, NotificationHub, format_sse
+
+
+def run_with_hub(body, queue_size=4, max_connections_per_user=2):
+    async def run():
+        hub = NotificationHub(queue_size=queue_size, max_connections_per_user=max_connections_per_user)
+        await hub.start(MemoryBroker())
+        try:
+            return body(hub)
+        finally:
+            await hub.stop()
+    return asyncio.run(run())
+
+
+def drain(sub):
+    frames = []
+    while not sub.queue.empty():
+        frames.append(sub.queue.get_nowait())
+    return frames
+
+
+def test_format_sse():
+    assert format_sse("notification", {"a": "中"}, 7) == 'id: 7\nevent: notification\ndata: {"a": "中"}\n\n'
+
+
+def test_personal_and_broadcast_delivery():
+    def body(hub):
+        alice, bob = hub.subscribe(1), hub.subscribe(2)
+        hub.publish("notification", {"n": 1}, user_id=1, event_id=1)
+        hub.publish("notification", {"n": 2}, user_id=None, event_id=2)
+        return drain(alice), drain(bob)
+
+    alice, bob = run_with_hub(body)
+    assert [f.split("\n")[0] for f in alice] == ["id: 1", "id: 2"]
+    assert [f.split("\n")[0] for f in bob] == ["id: 2"]
+    # 广播时所有连接共享同一个帧对象
+    assert alice[1] is bob[0]
+
+
+def test_slow_subscriber_is_disconnected():
+    def body(hub):
+        slow, fast = hub.subscribe(1), hub.subscribe(2)
+        for i in range(hub.queue_size + 1):
+            hub.publish("notification", {"n": i}, user_id=1)
+            hub.publish("notification", {"n": i}, user_id=2)
+            drain(fast)
+        return hub, slow
+
+    hub, slow = run_with_hub(body)
+    assert drain(slow) == [None]  # 队列被清空，只剩结束标记
+    assert hub.dropped == 1
+
+
+def test_connection_cap_closes_oldest():
+    def body(hub):
+        subs = [hub.subscribe(1) for _ in range(3)]
+        return drain(subs[0]), [drain(sub) for sub in subs[1:]], list(hub._by_user[1]) == subs[1:]
+
+    oldest, others, registered = run_with_hub(body, max_connections_per_user=2)
+    assert oldest == [None]
+    assert others == [[], []]
+    assert registered
@@ -0,0 +1,84 @@
+"""
+全局通知按用户的已读状态：水位线 + 稀疏集合
+"""
+import pytest
+
+from app.models import Notification, NotificationRead, NotificationReadState
+from app.services.notification_reads import (
+    count_parts, count_unread, get_watermark, mark_all_read, mark_read,
+    migrate_global_read_flags, read_flags,
+)
+
+
+@pytest.fixture
+def notifications(db, make_user):
+    def make(user_id=None, count=1, is_read=False):
+        rows = [Notification(user_id=user_id, type="t", title="t", is_read=is_read) for _ in range(count)]
+        db.add_all(rows)
+        db.commit()
+        return rows
+    return make
+
+
+def test_single_reads_advance_watermark(db, make_user, notifications):
+    user = make_user("alice")
+    g1, g2, g3, g4 = notifications(count=4)
+    assert count_unread(db, user.id) == 4
+
+    assert mark_read(db, user.id, g1)
+    db.commit()
+    assert get_watermark(db, user.id) == g1.id
+
+    assert mark_read(db, user.id, g3)  # 不连续，进入稀疏集合
+    db.commit()
+    assert get_watermark(db, user.id) == g1.id
+    assert count_unread(db, user.id) == 2
+
+    assert mark_read(db, user.id, g2)  # 补上缺口后水位线上移，集合清空
+    db.commit()
+    assert get_watermark(db, user.id) == g3.id
+    assert db.query(NotificationRead).count() == 0
+    assert not mark_read(db, user.id, g3)  # 重复标记
+    assert read_flags(db, user.id, [g1, g2, g3, g4]) == {g1.id: True, g2.id: True, g3.id: True, g4.id: False}
+    assert count_unread(db, user.id) == 1
+
+
+def test_read_state_is_per_user(db, make_user, notifications):
+    alice, bob = make_user("alice"), make_user("bob")
+    notifications(count=3)
+    notifications(user_id=alice.id, count=2)
+
+    mark_all_read(db, alice.id)
+    db.commit()
+    assert count_unread(db, alice.id) == 0
+    assert count_unread(db, bob.id) == 3
+    assert count_parts(db, alice.id) == (0, 3)
+    assert count_parts(db, bob.id) == (0, 0)
+
+
+def test_count_unread_statements_do_not_grow(db, make_user, notifications, count_statements):
+    user = make_user("alice")
+    notifications(count=5)
+    with count_statements() as few:
+        count_unread(db, user.id)
+    notifications(count=500)
+    notifications(user_id=user.id, count=100)
+    with count_statements() as many:
+        assert count_unread(db, user.id) == 605
+    assert len(many) == len(few)
+
+
+def test_migrate_global_read_flags(db, make_user, notifications):
+    alice, bob = make_user("alice"), make_user("bob")
+    g1, g2 = notifications(count=2, is_read=True)
+    g3, = notifications(count=1)
+    g4, = notifications(count=1, is_read=True)
+
+    assert migrate_global_read_flags(db) == 2
+    db.commit()
+    for user in (alice, bob):
+        assert get_watermark(db, user.id) == g2.id
+        assert read_flags(db, user.id, [g3, g4]) == {g3.id: False, g4.id: True}
+    # 已有读状态时不再执行
+    assert migrate_global_read_flags(db) == 0
+    assert db.query(NotificationReadState).count() == 2
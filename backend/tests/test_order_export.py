@@ -0,0 +1,72 @@
+"""
+订单导出：键集分页、明细分组、下载过程中不阻塞写入
+"""
+import csv
+import io
+import json
+from datetime import datetime
+
+import pytest
+
+from app.config import settings
+from app.database import SessionLocal
+from app.models import Order, OrderItem, Product
+from app.services.order_export import CSV_FIELDS, export_orders
+
+
+@pytest.fixture
+def orders(db, make_user, make_product, monkeypatch):
+    """5 个订单，其中 3 个下单时间相同（跨页边界），最后一个没有明细；每页 2 个订单"""
+    monkeypatch.setattr(settings, "ORDER_EXPORT_BATCH_SIZE", 2)
+    user = make_user("buyer")
+    product = make_product("商品")
+    times = [datetime(2024, 1, 1), datetime(2024, 1, 2), datetime(2024, 1, 2), datetime(2024, 1, 2), datetime(2024, 1, 3)]
+    result = []
+    for i, created_at in enumerate(times):
+        order = Order(order_number=f"E{i}", user_id=user.id, total_amount=10, status="paid", created_at=created_at)
+        db.add(order)
+        db.flush()
+        for _ in range(2 if i < 4 else 0):
+            db.add(OrderItem(order_id=order.id, product_id=product.id, product_name=product.name,
+                             unit_price=5, quantity=1, subtotal=5))
+        result.append(order)
+    db.commit()
+    return result
+
+
+def test_csv_export(orders):
+    body = b"".join(export_orders("csv")).decode("utf-8-sig")
+    rows = list(csv.reader(io.StringIO(body)))
+    assert rows[0] == CSV_FIELDS
+    # 每个明细一行，没有明细的订单一行
+    assert [row[1] for row in rows[1:]] == ["E0", "E0", "E1", "E1", "E2", "E2", "E3", "E3", "E4"]
+    assert rows[-1][CSV_FIELDS.index("item_id"):] == [""] * 6
+
+
+def test_jsonl_export_groups_items(orders):
+    lines = b"".join(export_orders("jsonl")).decode("utf-8").splitlines()
+    records = [json.loads(line) for line in lines]
+    assert [r["order_number"] for r in records] == ["E0", "E1", "E2", "E3", "E4"]
+    assert [len(r["items"]) for r in records] == [2, 2, 2, 2, 0]
+    assert records[0]["items"][0]["subtotal"] == 5.0
+
+
+def test_filters(orders):
+    lines = b"".join(export_orders("jsonl", start=datetime(2024, 1, 2), end=datetime(2024, 1, 3))).splitlines()
+    assert [json.loads(line)["order_number"] for line in lines] == ["E1", "E2", "E3"]
+
+
+def test_writes_succeed_while_download_is_paused(orders):
+    """客户端读得慢时生成器停在 yield 上，此时不能持有数据库锁"""
+    chunks = export_orders("csv")
+    next(chunks)
+    next(chunks)
+
+    writer = SessionLocal()
+    try:
+        writer.query(Product).update({Product.stock: Product.stock - 1})
+        writer.commit()
+    finally:
+        writer.close()
+
+    assert len(list(chunks)) >= 1
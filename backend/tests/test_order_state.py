@@ -0,0 +1,178 @@
+"""
+订单状态机：迁移规则、单个迁移的附带效果、批量迁移
+"""
+import pytest
+
+from app.models import Order, OrderItem, Product
+from app.services.order_state import (
+    USER, InvalidTransition, bulk_transition, check_transition, transition,
+)
+
+
+@pytest.fixture
+def make_order(db, make_user):
+    user = []
+    counter = [0]
+
+    def make(status, items):
+        """items: [(product, quantity)]"""
+        if not user:
+            user.append(make_user("buyer"))
+        counter[0] += 1
+        order = Order(order_number=f"T{counter[0]:06d}", user_id=user[0].id, total_amount=1, status=status)
+        db.add(order)
+        db.flush()
+        for product, quantity in items:
+            db.add(OrderItem(order_id=order.id, product_id=product.id, product_name=product.name,
+                             unit_price=1, quantity=quantity, subtotal=quantity))
+        db.commit()
+        return order
+    return make
+
+
+def stock_and_sales(db, product):
+    db.expire_all()
+    row = db.get(Product, product.id)
+    return row.stock, row.sales_count
+
+
+# ---------- 规则 ----------
+
+@pytest.mark.parametrize("source, target, actor", [
+    ("pending", "shipped", "admin"),
+    ("paid", "paid", "admin"),
+    ("cancelled", "paid", "admin"),
+    ("completed", "pending", "admin"),
+    ("paid", "shipped", USER),  # 只有管理员能发货
+    ("paid", "cancelled", USER),  # 已支付订单用户只能申请退款
+])
+def test_invalid_transitions(source, target, actor):
+    with pytest.raises(InvalidTransition):
+        check_transition(source, target, actor)
+
+
+def test_unknown_status():
+    with pytest.raises(InvalidTransition, match="未知的订单状态"):
+        check_transition("paid", "lost")
+
+
+# ---------- 单个迁移 ----------
+
+def test_pay_ship_complete_sets_timestamps_and_sales(db, make_product, make_order):
+    product = make_product("chair", stock=8, sales_count=10)
+    order = make_order("pending", [(product, 2)])
+
+    for target, actor in (("paid", USER), ("shipped", "admin"), ("completed", USER)):
+        transition(db, order, target, actor=actor)
+        db.commit()
+    assert order.paid_at and order.shipped_at and order.completed_at
+    assert order.version == 4
+    assert stock_and_sales(db, product) == (8, 12)
+
+    with pytest.raises(InvalidTransition):
+        transition(db, order, "paid", actor=USER)
+
+
+def test_cancel_returns_stock(db, make_product, make_order):
+    product = make_product("chair", stock=8)
+    order = make_order("pending", [(product, 2)])
+    effects = transition(db, order, "cancelled", actor=USER)
+    db.commit()
+    assert effects.stock_changed == [product.id]
+    assert effects.sold_changed == []
+    assert order.cancelled_at is not None
+    assert stock_and_sales(db, product) == (10, 0)
+
+
+@pytest.mark.parametrize("paid_from", ["paid", "shipped", "completed"])
+def test_refund_then_reject_round_trip(db, make_product, make_order, paid_from):
+    """退款后被驳回：库存与销量都回到退款前"""
+    product = make_product("sofa", stock=5, sales_count=3)
+    other = make_product("lamp", stock=7, sales_count=1)
+    order = make_order(paid_from, [(product, 3), (other, 1)])
+    before = stock_and_sales(db, product), stock_and_sales(db, other)
+
+    transition(db, order, "refunded")
+    db.commit()
+    assert stock_and_sales(db, product) == (8, 0)
+    assert stock_and_sales(db, other) == (8, 0)
+
+    effects = transition(db, order, "completed", notify=True)
+    db.commit()
+    assert (stock_and_sales(db, product), stock_and_sales(db, other)) == before
+    assert effects.stock_changed == sorted([product.id, other.id])
+    assert [e.title for e in effects.events] == ["退款未通过，订单已恢复"]
+
+
+def test_reject_does_not_take_stock_below_zero(db, make_product, make_order):
+    product = make_product("sofa", stock=0, sales_count=2)
+    order = make_order("paid", [(product, 2)])
+    transition(db, order, "refunded")
+    db.commit()
+    db.query(Product).filter(Product.id == product.id).update({Product.stock: 1})  # 归还的库存又卖掉了一件
+    db.commit()
+
+    transition(db, order, "completed")
+    db.commit()
+    assert stock_and_sales(db, product) == (0, 2)
+
+
+# ---------- 批量迁移 ----------
+
+def test_bulk_transition_groups_by_source(db, make_product, make_order):
+    product = make_product("desk", stock=50, sales_count=0)
+    pending = [make_order("pending", [(product, 1)]) for _ in range(3)]
+    paid = [make_order("paid", [(product, 2)]) for _ in range(2)]
+    shipped = make_order("shipped", [(product, 5)])
+    ids = [o.id for o in pending + paid] + [shipped.id, 99999]
+
+    result = bulk_transition(db, ids, "cancelled")
+    db.commit()
+    assert result.updated == sorted(o.id for o in pending + paid)
+    assert [s["order_id"] for s in result.skipped] == [shipped.id]
+    assert result.not_found == [99999]
+    # 待支付 3 件 + 已支付 4 件归还库存；已支付订单离开成交状态扣减销量（不低于 0）
+    assert stock_and_sales(db, product) == (57, 0)
+    assert result.effects.stock_changed == [product.id]
+    assert len(result.effects.events) == 5
+
+    db.expire_all()
+    for order in pending + paid:
+        row = db.get(Order, order.id)
+        assert row.status == "cancelled" and row.cancelled_at is not None and row.version == 2
+    assert db.get(Order, shipped.id).status == "shipped"
+
+
+def test_bulk_refund_and_reject_round_trip(db, make_product, make_order):
+    product = make_product("bed", stock=10, sales_count=20)
+    orders = [make_order(status, [(product, 2)]) for status in ("paid", "shipped", "completed")]
+    ids = [o.id for o in orders]
+
+    assert bulk_transition(db, ids, "refunded").updated == ids
+    db.commit()
+    assert stock_and_sales(db, product) == (16, 14)
+
+    assert bulk_transition(db, ids, "completed").updated == ids
+    db.commit()
+    assert stock_and_sales(db, product) == (10, 20)
+
+
+def test_bulk_statement_count_does_not_depend_on_order_count(db, make_product, make_order, count_statements):
+    products = [make_product(f"p{i}", stock=1000) for i in range(3)]
+
+    def statements_for(n):
+        orders = [make_order(status, [(p, 1) for p in products]) for status in ("pending", "paid") for _ in range(n)]
+        ids = [o.id for o in orders]
+        with count_statements() as statements:
+            result = bulk_transition(db, ids, "cancelled")
+        db.commit()
+        assert len(result.updated) == 2 * n
+        return len(statements)
+
+    # 读取订单 + 每个来源状态一条 UPDATE + 汇总明细 + 库存 / 销量各一条 executemany
+    assert statements_for(2) == statements_for(100) == 6
+
+
+def test_bulk_unknown_status(db):
+    with pytest.raises(InvalidTransition):
+        bulk_transition(db, [1], "lost")
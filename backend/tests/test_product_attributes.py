@@ -0,0 +1,105 @@
+"""
+商品参数 / 标签的差异更新
+"""
+import pytest
+
+from app.models import ProductParam, ProductTag, Tag
+from app.services.product_attributes import (
+    AttributeChange, compute_diff, missing_tag_ids, update_attributes,
+)
+
+
+@pytest.fixture
+def tags(db):
+    rows = [Tag(name=f"tag{i}") for i in range(4)]
+    db.add_all(rows)
+    db.commit()
+    return [t.id for t in rows]
+
+
+def params_of(db, product_id):
+    rows = db.query(ProductParam).filter(ProductParam.product_id == product_id).order_by(ProductParam.sort_order)
+    return [(p.name, p.value) for p in rows]
+
+
+def tags_of(db, product_id):
+    return sorted(t for t, in db.query(ProductTag.tag_id).filter(ProductTag.product_id == product_id))
+
+
+def p(*pairs):
+    return [{"name": n, "value": v} for n, v in pairs]
+
+
+def test_params_diff_keeps_unchanged_rows(db, make_product):
+    product = make_product("sofa")
+    update_attributes(db, {product.id: AttributeChange(params=p(("材质", "布"), ("尺寸", "2m"), ("颜色", "灰")))})
+    db.commit()
+    ids = {r.name: r.id for r in db.query(ProductParam)}
+
+    diff = update_attributes(db, {product.id: AttributeChange(params=p(("材质", "皮"), ("尺寸", "2m"), ("产地", "佛山")))})
+    db.commit()
+    assert diff.summary() == {
+        "params_inserted": 1, "params_updated": 1, "params_deleted": 1, "tags_added": 0, "tags_removed": 0,
+    }
+    assert params_of(db, product.id) == [("材质", "皮"), ("尺寸", "2m"), ("产地", "佛山")]
+    # 未变化 / 只改值的行保留原 id
+    current = {r.name: r.id for r in db.query(ProductParam)}
+    assert current["尺寸"] == ids["尺寸"] and current["材质"] == ids["材质"]
+    assert diff.products_changed == [product.id]
+
+
+def test_duplicate_param_names_match_by_occurrence(db, make_product):
+    product = make_product("desk")
+    update_attributes(db, {product.id: AttributeChange(params=p(("颜色", "白"), ("颜色", "黑")))})
+    db.commit()
+    diff = update_attributes(db, {product.id: AttributeChange(params=p(("颜色", "白"), ("颜色", "黑")))})
+    assert diff.summary()["params_updated"] == 0
+    assert diff.products_changed == []
+
+    diff = update_attributes(db, {product.id: AttributeChange(params=p(("颜色", "白")))})
+    db.commit()
+    assert diff.summary()["params_deleted"] == 1
+    assert params_of(db, product.id) == [("颜色", "白")]
+
+
+def test_tags_diff_and_untouched_parts(db, make_product, tags):
+    product = make_product("bed")
+    update_attributes(db, {product.id: AttributeChange(params=p(("a", "1")), tag_ids=tags[:2])})
+    db.commit()
+
+    diff = update_attributes(db, {product.id: AttributeChange(tag_ids=[tags[1], tags[2]])})
+    db.commit()
+    assert diff.summary()["tags_added"] == 1 and diff.summary()["tags_removed"] == 1
+    assert diff.tags_changed == [product.id]
+    assert tags_of(db, product.id) == [tags[1], tags[2]]
+    assert params_of(db, product.id) == [("a", "1")]  # params=None 时保持不变
+
+    assert missing_tag_ids(db, [tags[0], 9999]) == [9999]
+
+
+def test_statement_count_does_not_depend_on_product_count(db, make_product, tags, count_statements):
+    def statements_for(n):
+        products = [make_product(f"p{n}-{i}") for i in range(n)]
+        update_attributes(db, {
+            pr.id: AttributeChange(params=p(("a", "1"), ("b", "2")), tag_ids=tags[:2]) for pr in products
+        })
+        db.commit()
+        changes = {pr.id: AttributeChange(params=p(("a", "9"), ("c", "3")), tag_ids=tags[1:3]) for pr in products}
+        with count_statements() as statements:
+            update_attributes(db, changes)
+        db.commit()
+        return len(statements)
+
+    # 读取 2 条 + 每类变更 1 条 executemany
+    assert statements_for(3) == statements_for(60) == 7
+
+
+def test_compute_diff_without_changes_writes_nothing(db, make_product, count_statements):
+    product = make_product("lamp")
+    update_attributes(db, {product.id: AttributeChange(params=p(("a", "1")), tag_ids=[])})
+    db.commit()
+    with count_statements() as statements:
+        diff = update_attributes(db, {product.id: AttributeChange(params=p(("a", "1")), tag_ids=[])})
+    assert diff.products_changed == []
+    assert all(s.lstrip().upper().startswith("SELECT") for s in statements)
+    assert compute_diff(db, {}).products_changed == []
@@ -0,0 +1,23 @@
+"""
+本地存储：暂存目录不在 /uploads 静态目录下
+"""
+import os
+
+from app.services.storage import LocalStorage
+
+
+def test_staging_is_outside_served_root(tmp_path):
+    root, staging = tmp_path / "uploads", tmp_path / "staging"
+    (root / ".staging" / "multipart" / "old").mkdir(parents=True)  # 旧版本的暂存目录
+    storage = LocalStorage(str(root), str(staging))
+    storage.ensure_ready()
+
+    assert not (root / ".staging").exists()
+    upload_id = storage.create_multipart("cas/ab/cd/x.png", "image/png")
+    part = storage.part_path(upload_id, 1)
+    assert os.path.commonpath([part, str(root)]) != str(root)
+
+    with open(part, "wb") as f:
+        f.write(b"data")
+    storage.complete_multipart("cas/ab/cd/x.png", upload_id, [{"part_number": 1}])
+    assert (root / "cas" / "ab" / "cd" / "x.png").read_bytes() == b"data"
@@ -0,0 +1,107 @@
+"""
+未读数缓存：增量更新、持久化副本、离线用户、校正
+"""
+import asyncio
+
+import pytest
+
+from app.models import Notification, NotificationCounter
+from app.services.notification_dispatcher import NotificationEvent, write_batch
+from app.services.notification_reads import mark_read
+from app.services.unread_counters import UnreadCounters
+
+
+@pytest.fixture
+def counters(db):
+    """未启动后台任务的独立实例"""
+    counters = UnreadCounters()
+    counters.global_total = counters._load_global_total()
+    return counters
+
+
+def personal(user_id, related_id):
+    return NotificationEvent(user_id=user_id, type="order_status", title="t", related_id=related_id)
+
+
+def test_incremental_updates(db, make_user, counters):
+    user = make_user("alice")
+    assert counters.get(db, user.id) == 0
+
+    counters.on_insert(user.id)
+    counters.on_insert(None)
+    counters.on_insert(None)
+    assert counters.get(db, user.id) == 3
+
+    counters.on_read(user.id, is_global=True)
+    counters.on_read(user.id, is_global=False)
+    assert counters.get(db, user.id) == 1
+
+    counters.on_read_all(user.id)
+    assert counters.get(db, user.id) == 0
+    counters.on_insert(None)
+    assert counters.get(db, user.id) == 1
+
+
+def test_first_access_counts_from_notifications(db, make_user, counters):
+    user = make_user("alice")
+    write_batch([personal(user.id, 1), personal(user.id, 2), NotificationEvent(user_id=None, type="t", title="g")])
+    counters.global_total = counters._load_global_total()
+    assert counters.get(db, user.id) == 3
+
+
+def test_write_batch_updates_persisted_counter_of_uncached_user(db, make_user, counters):
+    """离线 / 重启后未访问的用户：新通知要反映到持久化行，否则从该行加载会少算"""
+    online, offline = make_user("online"), make_user("offline")
+    for user in (online, offline):
+        counters.get(db, user.id)
+    asyncio.run(counters.flush())
+    del counters._counts[offline.id]  # 模拟重启后尚未访问
+
+    written = write_batch([personal(offline.id, i) for i in range(4)] + [personal(online.id, 9)])
+    for n in written:
+        counters.on_insert(n.user_id)
+
+    row = db.query(NotificationCounter).filter(NotificationCounter.user_id == offline.id).one()
+    db.refresh(row)
+    assert row.personal_unread == 4
+
+    restarted = UnreadCounters()
+    restarted.global_total = restarted._load_global_total()
+    assert restarted.get(db, offline.id) == 4
+    assert counters.get(db, online.id) == 1
+
+
+def test_flush_and_reconcile(db, make_user, counters):
+    user = make_user("alice")
+    counters.get(db, user.id)
+    counters.on_insert(user.id)  # 内存中多算了一条（没有对应的通知行）
+    asyncio.run(counters.flush())
+    row = db.query(NotificationCounter).filter(NotificationCounter.user_id == user.id).one()
+    assert row.personal_unread == 1
+
+    fixed = asyncio.run(counters.reconcile())
+    assert fixed == 1
+    assert counters.get(db, user.id) == 0
+    db.refresh(row)
+    assert row.personal_unread == 0
+    assert db.query(Notification).count() == 0
+
+
+def test_read_by_uncached_user_updates_persisted_counter(db, make_user, counters):
+    """重启后未访问的用户直接标记已读：要先按修改前的状态加载，再扣减"""
+    user = make_user("alice")
+    written = write_batch([personal(user.id, 1), personal(user.id, 2)])
+    counters.get(db, user.id)
+    asyncio.run(counters.flush())
+    del counters._counts[user.id]  # 模拟重启后尚未访问
+
+    notification = db.get(Notification, written[0].id)
+    counters.ensure_loaded(db, user.id)
+    assert mark_read(db, user.id, notification)
+    db.commit()
+    counters.on_read(user.id, is_global=False)
+    asyncio.run(counters.flush())
+
+    restarted = UnreadCounters()
+    restarted.global_total = restarted._load_global_total()
+    assert restarted.get(db, user.id) == 1
@@ -0,0 +1,159 @@
+"""
+流式上传：按魔数识别类型、边写边检查大小
+"""
+import asyncio
+import hashlib
+
+import pytest
+from starlette.requests import ClientDisconnect, Request
+
+from app.services.uploads import (
+    UnsupportedFileTypeError, UploadError, UploadTooLargeError, _FileSink, receive_image_upload,
+    sniff_image_type,
+)
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * 64
+JPEG = b"\xff\xd8\xff\xe0" + b"\x00" * 64
+
+
+@pytest.mark.parametrize("head, expected", [
+    (JPEG, ("image/jpeg", ".jpg")),
+    (PNG, ("image/png", ".png")),
+    (b"GIF89a" + b"\x00" * 10, ("image/gif", ".gif")),
+    (b"RIFF\x00\x00\x00\x00WEBPVP8 ", ("image/webp", ".webp")),
+    (b"\x00\x00\x00\x1cftypavif", ("image/avif", ".avif")),
+    (b"<svg xmlns=", None),
+    (b"", None),
+])
+def test_sniff_image_type(head, expected):
+    assert sniff_image_type(head) == expected
+
+
+def write_chunks(path, chunks, max_bytes, sniff=True):
+    async def run():
+        sink = _FileSink(str(path), max_bytes, sniff=sniff)
+        await sink.open()
+        try:
+            for chunk in chunks:
+                await sink.write(chunk)
+            await sink.close()
+        except Exception:
+            await sink.discard()
+            raise
+        return sink
+    return asyncio.run(run())
+
+
+def test_sink_hashes_and_sniffs_across_chunks(tmp_path):
+    data = PNG * 100
+    chunks = [data[i:i + 7] for i in range(0, len(data), 7)]  # 魔数跨多个块
+    sink = write_chunks(tmp_path / "a.png", chunks, max_bytes=len(data))
+    assert sink.size == len(data)
+    assert sink.sniffed == ("image/png", ".png")
+    assert sink.hasher.hexdigest() == hashlib.sha256(data).hexdigest()
+    assert (tmp_path / "a.png").read_bytes() == data
+
+
+def test_sink_rejects_oversize_and_removes_file(tmp_path):
+    with pytest.raises(UploadTooLargeError):
+        write_chunks(tmp_path / "big.jpg", [JPEG, JPEG], max_bytes=len(JPEG) + 10)
+    assert not (tmp_path / "big.jpg").exists()
+
+
+def test_sink_rejects_non_image(tmp_path):
+    with pytest.raises(UnsupportedFileTypeError):
+        write_chunks(tmp_path / "x.jpg", [b"#!/bin/sh\necho pwned\n" * 4], max_bytes=1024)
+    assert not (tmp_path / "x.jpg").exists()
+
+
+def test_sink_sniffs_small_file_on_close(tmp_path):
+    with pytest.raises(UnsupportedFileTypeError):
+        write_chunks(tmp_path / "tiny.jpg", [b"hello"], max_bytes=1024)
+    sink = write_chunks(tmp_path / "tiny.gif", [b"GIF89a"], max_bytes=1024)
+    assert sink.sniffed == ("image/gif", ".gif")
+
+
+def test_sink_without_sniffing_accepts_any_content(tmp_path):
+    sink = write_chunks(tmp_path / "rows.csv", [b"name,price\n", b"a,1\n"], max_bytes=1024, sniff=False)
+    assert sink.sniffed is None
+    assert sink.size == 15
+
+
+# ---------- 端到端：receive_image_upload ----------
+
+BOUNDARY = "----suju-test-boundary"
+
+
+def multipart_body(data: bytes, field_name="file") -> bytes:
+    return b"".join([
+        f"--{BOUNDARY}\r\n".encode(),
+        b'Content-Disposition: form-data; name="note"\r\n\r\n',
+        b"hello\r\n",
+        f"--{BOUNDARY}\r\n".encode(),
+        f'Content-Disposition: form-data; name="{field_name}"; filename="a.png"\r\n'.encode(),
+        b"Content-Type: application/octet-stream\r\n\r\n",
+        data,
+        f"\r\n--{BOUNDARY}--\r\n".encode(),
+    ])
+
+
+def chunked_request(chunks, disconnect_after=None):
+    """按块送出请求体（不带 Content-Length）；disconnect_after 个块之后模拟客户端断开"""
+    messages = [{"type": "http.request", "body": c, "more_body": True} for c in chunks]
+    if disconnect_after is not None:
+        messages = messages[:disconnect_after] + [{"type": "http.disconnect"}]
+    else:
+        messages.append({"type": "http.request", "body": b"", "more_body": False})
+    sent = []
+
+    async def receive():
+        message = messages[len(sent)]
+        sent.append(message)
+        return message
+
+    scope = {
+        "type": "http",
+        "method": "POST",
+        "path": "/v1/upload",
+        "headers": [(b"content-type", f"multipart/form-data; boundary={BOUNDARY}".encode())],
+    }
+    return Request(scope, receive), sent
+
+
+def split(body: bytes, size: int):
+    return [body[i:i + size] for i in range(0, len(body), size)]
+
+
+def test_receive_image_upload_with_boundary_split_across_chunks(tmp_path):
+    data = PNG * 500
+    request, _ = chunked_request(split(multipart_body(data), 7))  # 边界、头部、魔数都跨块
+    stored = asyncio.run(receive_image_upload(request, str(tmp_path), max_bytes=len(data)))
+
+    assert stored.content_type == "image/png"
+    assert stored.size == len(data)
+    assert stored.sha256 == hashlib.sha256(data).hexdigest()
+    with open(stored.path, "rb") as f:
+        assert f.read() == data  # 结尾的 \r\n--boundary 不属于文件内容
+
+
+def test_receive_image_upload_aborts_oversize_mid_stream(tmp_path):
+    chunks = split(multipart_body(PNG * 10_000), 4096)
+    request, sent = chunked_request(chunks)
+    with pytest.raises(UploadTooLargeError):
+        asyncio.run(receive_image_upload(request, str(tmp_path), max_bytes=16 * 1024))
+    assert len(sent) < len(chunks) // 2  # 超限后不再读取剩余的请求体
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_receive_image_upload_cleans_up_on_client_disconnect(tmp_path):
+    request, _ = chunked_request(split(multipart_body(PNG * 1000), 1024), disconnect_after=20)
+    with pytest.raises(ClientDisconnect):
+        asyncio.run(receive_image_upload(request, str(tmp_path), max_bytes=1024 * 1024))
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_receive_image_upload_requires_file_field(tmp_path):
+    request, _ = chunked_request([multipart_body(PNG, field_name="other")])
+    with pytest.raises(UploadError, match="未找到上传的文件"):
+        asyncio.run(receive_image_upload(request, str(tmp_path), max_bytes=1024))
+    assert list(tmp_path.iterdir()) == []
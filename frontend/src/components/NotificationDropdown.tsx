@@ -1,7 +1,7 @@
 import React, { useState, useEffect, useRef } from 'react';
 import { useNavigate } from 'react-router-dom';
 import { Bell, Check } from 'lucide-react';
-import { getNotifications, getUnreadCount, markAsRead, markAllAsRead, type NotificationItem } from '../services/notificationService';
+import { getNotifications, getUnreadCount, markAsRead, markAllAsRead, subscribeNotifications, type NotificationItem } from '../services/notificationService';
 import { useAuth } from '../contexts';
 
 const NotificationDropdown: React.FC = () => {
@@ -13,7 +13,7 @@ const NotificationDropdown: React.FC = () => {
     const [loading, setLoading] = useState(false);
     const dropdownRef = useRef<HTMLDivElement>(null);
 
-    // Fetch unread count periodically
+    // Fetch unread count once, then follow the push stream
     useEffect(() => {
         if (!user) return;
 
@@ -27,9 +27,23 @@ const NotificationDropdown: React.FC = () => {
         };
 
         fetchUnread();
-        const interval = setInterval(fetchUnread, 60000); // Every minute
-
-        return () => clearInterval(interval);
+        const seen = new Set<number>();
+        const unsubscribe = subscribeNotifications(
+            (notification) => {
+                // Replayed notifications after a reconnect may repeat
+                if (seen.has(notification.id)) return;
+                seen.add(notification.id);
+                if (!notification.is_read) {
+                    setUnreadCount(prev => prev + 1);
+                }
+                setNotifications(prev =>
+                    prev.some(n => n.id === notification.id) ? prev : [notification, ...prev].slice(0, 8)
+                );
+            },
+            fetchUnread
+        );
+
+        return unsubscribe;
     }, [user]);
 
     // Fetch notifications when dropdown opens
@@ -14,6 +14,13 @@ export interface ChatMessage {
     created_at: string;
 }
 
+export interface ChatJob {
+    job_id: string;
+    status: 'queued' | 'running' | 'succeeded' | 'failed';
+    error?: string | null;
+    message?: ChatMessage | null;
+}
+
 export const aiService = {
     getSessions: async (): Promise<ChatSession[]> => {
         const response = await api.get<ChatSession[]>('/ai/sessions');
@@ -34,8 +41,29 @@ export const aiService = {
         return response.data;
     },
 
-    sendMessage: async (sessionToken: string, content: string): Promise<ChatMessage> => {
-        const response = await api.post<ChatMessage>('/ai/chat', { session_token: sessionToken, content });
+    getJob: async (jobId: string, wait = 0): Promise<ChatJob> => {
+        const response = await api.get<ChatJob>(`/ai/jobs/${jobId}`, { params: { wait } });
         return response.data;
     },
+
+    // 提交后台任务，并长轮询直到拿到助手回复
+    sendMessage: async (sessionToken: string, content: string): Promise<ChatMessage> => {
+        const response = await api.post<{ job_id: string }>('/ai/chat', { session_token: sessionToken, content });
+        const jobId = response.data.job_id;
+        for (;;) {
+            const startedAt = Date.now();
+            const job = await aiService.getJob(jobId, 25);
+            if (job.status === 'succeeded' && job.message) {
+                return job.message;
+            }
+            if (job.status === 'failed') {
+                throw new Error(job.error || 'AI 回复失败');
+            }
+            // 服务端没有等待就返回时（如旧版本后端），间隔一秒再查，避免忙轮询
+            const elapsed = Date.now() - startedAt;
+            if (elapsed < 1000) {
+                await new Promise((resolve) => setTimeout(resolve, 1000 - elapsed));
+            }
+        }
+    },
 };
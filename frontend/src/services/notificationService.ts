@@ -1,4 +1,4 @@
-import api from './api';
+import api, { getToken } from './api';
 
 export interface NotificationItem {
     id: number;
@@ -37,3 +37,33 @@ export const markAsRead = async (notificationId: number): Promise<void> => {
 export const markAllAsRead = async (): Promise<void> => {
     await api.put('/notifications/read-all');
 };
+
+/**
+ * 订阅通知实时推送（SSE）
+ * 浏览器断线后会自动重连，并通过 Last-Event-ID 补发错过的通知
+ * 返回取消订阅函数
+ */
+export const subscribeNotifications = (
+    onNotification: (notification: NotificationItem) => void,
+    onReconnect?: () => void
+): (() => void) => {
+    const token = getToken();
+    if (!token || typeof EventSource === 'undefined') {
+        return () => {};
+    }
+
+    const url = `${api.defaults.baseURL}/notifications/stream?token=${encodeURIComponent(token)}`;
+    const source = new EventSource(url);
+    let opened = false;
+
+    source.addEventListener('notification', (e) => {
+        onNotification(JSON.parse((e as MessageEvent).data));
+    });
+    source.onopen = () => {
+        // 首次连接之外的 open 都是重连，交给调用方重新同步
+        if (opened) onReconnect?.();
+        opened = true;
+    };
+
+    return () => source.close();
+};